@@ -129,6 +129,10 @@ CREATE TABLE IF NOT EXISTS trade (
 CREATE TABLE IF NOT EXISTS holding (
    PortfolioID    INT UNSIGNED NOT NULL,
    SecurityID     INT UNSIGNED NOT NULL,
+   BuyQty         DECIMAL(18,4) NOT NULL DEFAULT 0,
+   SellQty        DECIMAL(18,4) NOT NULL DEFAULT 0,
+   NetQty         DECIMAL(18,4) NOT NULL DEFAULT 0,
+   TotalBuyCost   DECIMAL(18,4) NOT NULL DEFAULT 0,
    AvgCostBasis   DECIMAL(18,4) NOT NULL DEFAULT 0,
    PRIMARY KEY (PortfolioID, SecurityID),
    CONSTRAINT fk_holding_portfolio
@@ -141,6 +145,9 @@ CREATE TABLE IF NOT EXISTS holding (
            ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- Holding rows are maintained incrementally by every code path that writes
+-- BUY/SELL trades.
+
 -- =======================
 -- PRICE SNAPSHOT
 -- =======================
@@ -162,4 +169,11 @@ CREATE TABLE IF NOT EXISTS price_snapshot (
           ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- =======================
+-- LATER SCHEMA CHANGES
+-- =======================
 
+-- Indexes and columns added after this file was written are applied by
+-- migrations.py, which records the applied version in schema_version.
+-- After creating the tables above (or to upgrade an existing portfolio_db):
+--     python migrations.py
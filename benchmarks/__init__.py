@@ -0,0 +1,4 @@
+# benchmarks
+#
+# Deterministic synthetic data and timing harness for the report and
+# import paths. See benchmarks/run.py for usage.
@@ -0,0 +1,191 @@
+# benchmarks/prepared.py
+#
+# Cost of re-parsing a hot statement on every call versus executing it
+# through the connection's prepared-statement registry. Inserts --rows
+# trades one statement at a time, the way record_trade / insert_trade do,
+# into an already loaded benchmark database:
+#
+#     python -m benchmarks.run --size tiny            # once, to load it
+#     python -m benchmarks.prepared --rows 100000
+#
+# Modes: "text" (plain cursor, statement parsed per call), "prepared"
+# (cursor(prepared=True), prepared once per connection) and, for scale,
+# "batched" (one executemany per --batch rows, the bulk import path).
+# Every mode runs in a transaction that is rolled back, so the database is
+# left as it was.
+#
+# A second run reads --pages trade history pages whose SQL is built per call
+# by trade_functions._history_query, as report and history code does, so
+# each execute gets a new (equal) string object. "text" and "prepared" are
+# compared, and the registry counters show whether the dynamic statement
+# was prepared once or on every call. On MySQL the session's Com_stmt_prepare / Com_stmt_execute
+# / Com_insert counters are reported alongside the timings.
+
+import argparse
+import sys
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+import db
+from benchmarks.synthetic import DEFAULT_DATABASE, bench_config, use_database
+from trade_functions import INSERT_TRADE_SQL, _history_query
+
+DEFAULT_ROWS = 100_000
+DEFAULT_PAGES = 20_000
+DEFAULT_BATCH = 5000
+MODES = ("text", "prepared", "batched")
+_COUNTERS = ("Com_stmt_prepare", "Com_stmt_execute", "Com_insert")
+HISTORY_MODES = ("text", "prepared")
+
+
+def _session_counters(conn) -> Optional[dict]:
+    if db.backend() != "mysql":
+        return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SHOW SESSION STATUS WHERE Variable_name IN (%s, %s, %s)", _COUNTERS)
+        return {name: int(value) for name, value in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def _rows(portfolio_id: int, security_id: int, n: int):
+    start = date(2000, 1, 3)
+    for i in range(n):
+        day = start + timedelta(days=i % 9000)
+        yield (portfolio_id, security_id, "BUY", day, day, 1 + i % 50, 10.0 + (i % 997) / 100.0,
+               0.0, "USD", None)
+
+
+def run_mode(mode: str, portfolio_id: int, security_id: int, rows: int, batch: int) -> dict:
+    conn = db.get_connection()
+    if conn is None:
+        raise RuntimeError("Could not connect to database.")
+    try:
+        before = _session_counters(conn)
+        cursor = conn.cursor(prepared=(mode == "prepared"))
+        start = time.perf_counter()
+        if mode == "batched":
+            pending = []
+            for row in _rows(portfolio_id, security_id, rows):
+                pending.append(row)
+                if len(pending) >= batch:
+                    cursor.executemany(INSERT_TRADE_SQL, pending)
+                    pending = []
+            if pending:
+                cursor.executemany(INSERT_TRADE_SQL, pending)
+        else:
+            for row in _rows(portfolio_id, security_id, rows):
+                cursor.execute(INSERT_TRADE_SQL, row)
+        seconds = time.perf_counter() - start
+        cursor.close()
+        conn.rollback()
+        after = _session_counters(conn)
+    finally:
+        conn.close()
+
+    result = {
+        "mode": mode,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_sec": rows / seconds if seconds > 0 else 0.0,
+        "us_per_row": seconds / rows * 1e6 if rows else 0.0,
+    }
+    if before is not None and after is not None:
+        # the two SHOW STATUS calls are not prepared and do not insert
+        result.update({name: after[name] - before[name] for name in _COUNTERS})
+    return result
+
+
+def run_history(mode: str, portfolio_id: int, security_id: int, pages: int) -> dict:
+    conn = db.get_connection()
+    if conn is None:
+        raise RuntimeError("Could not connect to database.")
+    try:
+        before = _session_counters(conn)
+        registry = db.pool_stats()
+        cursor = conn.cursor(prepared=(mode == "prepared"))
+        start = time.perf_counter()
+        for _ in range(pages):
+            cursor.execute(*_history_query(portfolio_id, None, None, None, [security_id], None, 20))
+            cursor.fetchall()
+        seconds = time.perf_counter() - start
+        cursor.close()
+        after = _session_counters(conn)
+    finally:
+        conn.close()
+
+    stats = db.pool_stats()
+    result = {
+        "mode": mode,
+        "pages": pages,
+        "seconds": seconds,
+        "us_per_page": seconds / pages * 1e6 if pages else 0.0,
+        "prepares": stats["prepares"] - registry["prepares"],
+        "prepared_hits": stats["prepared_hits"] - registry["prepared_hits"],
+    }
+    if before is not None and after is not None:
+        result.update({name: after[name] - before[name] for name in _COUNTERS[:2]})
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Prepared vs text-protocol insert benchmark")
+    parser.add_argument("--database", default=DEFAULT_DATABASE)
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH, help="rows per executemany in batched mode")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--pages", type=int, default=DEFAULT_PAGES,
+                        help="dynamically built history pages to read (0 skips)")
+    args = parser.parse_args(argv)
+
+    cfg = bench_config(args.database)
+    if cfg is None:
+        return 1
+    cfg["prepared_statements"] = True
+    use_database(cfg)
+
+    conn = db.get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return 1
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(PortfolioID) FROM portfolio")
+        portfolio_id = cursor.fetchall()[0][0]
+        cursor.execute("SELECT MIN(SecurityID) FROM security")
+        security_id = cursor.fetchall()[0][0]
+        cursor.close()
+    finally:
+        conn.close()
+    if portfolio_id is None or security_id is None:
+        print(f"[ERROR] {args.database} is empty; load it with python -m benchmarks.run first.")
+        return 1
+
+    print(f"=== {args.rows:,} single-row trade inserts ({db.backend()}) ===")
+    baseline = None
+    for mode in args.modes:
+        r = run_mode(mode, portfolio_id, security_id, args.rows, args.batch)
+        baseline = baseline or r["seconds"]
+        counters = "".join(f"  {name}={r[name]:,}" for name in _COUNTERS if name in r)
+        print(f"{mode:<9} {r['seconds']:>8.2f}s  {r['rows_per_sec']:>10,.0f} rows/sec  "
+              f"{r['us_per_row']:>7.1f} us/row  x{baseline / r['seconds']:.2f}{counters}")
+    stats = db.pool_stats()
+    print(f"Registry: {stats['prepares']:,} prepare(s), {stats['prepared_hits']:,} reuse(s)")
+
+    if args.pages > 0:
+        print(f"\n=== {args.pages:,} history pages, SQL built per call ({db.backend()}) ===")
+        baseline = None
+        for mode in HISTORY_MODES:
+            r = run_history(mode, portfolio_id, security_id, args.pages)
+            baseline = baseline or r["seconds"]
+            counters = "".join(f"  {name}={r[name]:,}" for name in _COUNTERS[:2] if name in r)
+            print(f"{mode:<9} {r['seconds']:>8.2f}s  {r['us_per_page']:>7.1f} us/page  "
+                  f"x{baseline / r['seconds']:.2f}  registry {r['prepares']:,} prepare(s), "
+                  f"{r['prepared_hits']:,} reuse(s){counters}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
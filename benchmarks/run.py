@@ -0,0 +1,278 @@
+# benchmarks/run.py
+#
+# Loads a deterministic synthetic dataset into a separate benchmark database
+# and times the import and report paths. Run from the repository root:
+#
+#     python -m benchmarks.run --size small --out bench_small.json
+#     python -m benchmarks.run --size small --skip-load --compare bench_small.json
+#
+# Each case records p50/p95/mean latency, and where it applies rows/sec and
+# SQL statements per call (from sql_profiler with --profile, otherwise the
+# MySQL server 'Questions' counter delta). Results carry the git commit so
+# files from different commits can be compared directly.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+import db
+import sql_profiler
+from benchmarks.synthetic import (
+    DEFAULT_DATABASE, DEFAULT_SEED, END_DATE, SIZES, SyntheticDataset, bench_config,
+    load_reference_data, prepare_database, use_database,
+)
+from history_functions import portfolio_value_series
+from lot_functions import get_realized_pnl
+from price_functions import bulk_import_price_csv
+from report_functions import get_consolidated_valuation, get_holdings, get_portfolio_snapshot
+from trade_functions import get_trade_history, import_trades_file
+
+DEFAULT_REPEATS = 20
+SAMPLE_PORTFOLIOS = 10
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _questions() -> Optional[int]:
+    """Statements the server has executed so far (all sessions)."""
+    conn = db.get_connection()
+    if conn is None:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+        row = cursor.fetchone()
+        return int(row[1]) if row else None
+    except Exception:
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def time_case(name: str, fn: Callable, calls: List[tuple]) -> dict:
+    """
+    Runs fn(*args) for every args tuple in calls and summarises latency.
+    Service output is swallowed so it does not skew the timings.
+    """
+    profiled = sql_profiler.is_enabled()
+    q0 = None if profiled else _questions()
+    timings = []
+    failures = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for args in calls:
+            t0 = time.perf_counter()
+            with sql_profiler.action(name):
+                result = fn(*args)
+            timings.append(time.perf_counter() - t0)
+            if result is None:
+                failures += 1
+    q1 = None if profiled else _questions()
+
+    timings.sort()
+    out = {
+        "case": name,
+        "calls": len(timings),
+        "failures": failures,
+        "p50_ms": _percentile(timings, 50) * 1000,
+        "p95_ms": _percentile(timings, 95) * 1000,
+        "mean_ms": sum(timings) / len(timings) * 1000 if timings else 0.0,
+    }
+    if profiled and timings:
+        actions = sql_profiler.summary(action_name=name)["Actions"]
+        if actions:
+            out["queries_per_call"] = actions[0]["Statements"] / len(timings)
+    elif q0 is not None and q1 is not None and timings:
+        # the second SHOW STATUS counts itself
+        out["queries_per_call"] = (q1 - q0 - 1) / len(timings)
+    return out
+
+
+def run_imports(dataset: SyntheticDataset, workdir: str) -> List[dict]:
+    results = []
+
+    price_dir = os.path.join(workdir, "prices")
+    dataset.write_price_csvs(price_dir)
+    q0 = _questions()
+    with contextlib.redirect_stdout(io.StringIO()), sql_profiler.action("import_prices"):
+        stats = bulk_import_price_csv(price_dir, verbose=False)
+    q1 = _questions()
+    if stats is None:
+        print("[ERROR] Price import failed.")
+    else:
+        results.append({
+            "case": "import_prices",
+            "rows": stats["written"],
+            "seconds": stats["seconds"],
+            "rows_per_sec": stats["rows_per_sec"],
+            "queries": (q1 - q0 - 1) if q0 is not None and q1 is not None else None,
+        })
+
+    total_rows = 0
+    total_seconds = 0.0
+    failed = 0
+    q0 = _questions()
+    for p in dataset.portfolios:
+        path = os.path.join(workdir, f"trades_{p.portfolio_id}.csv")
+        dataset.write_trade_csv(p, path)
+        with contextlib.redirect_stdout(io.StringIO()), sql_profiler.action("import_trades"):
+            stats = import_trades_file(p.portfolio_id, path, verbose=False)
+        if stats is None:
+            failed += 1
+            continue
+        total_rows += stats["written"]
+        total_seconds += stats["seconds"]
+    q1 = _questions()
+    results.append({
+        "case": "import_trades",
+        "rows": total_rows,
+        "seconds": total_seconds,
+        "rows_per_sec": total_rows / total_seconds if total_seconds > 0 else 0.0,
+        "failures": failed,
+        "queries": (q1 - q0 - 1) if q0 is not None and q1 is not None else None,
+    })
+    return results
+
+
+def run_reports(dataset: SyntheticDataset, repeats: int) -> List[dict]:
+    portfolios = [p.portfolio_id for p in dataset.portfolios[:SAMPLE_PORTFOLIOS]]
+    per_portfolio = [(pid,) for pid in portfolios] * max(1, repeats // len(portfolios))
+
+    # (portfolio, security) pairs that actually have trades
+    pairs = []
+    for p in dataset.portfolios[:SAMPLE_PORTFOLIOS]:
+        trades = dataset.trades(p)
+        if trades:
+            ticker, exch = trades[0][0], trades[0][1]
+            sid = next(s.security_id for s in dataset.securities
+                       if s.ticker == ticker and s.exchange == exch)
+            pairs.append((p.portfolio_id, sid))
+
+    end = END_DATE
+    start = end - timedelta(days=365)
+    users = sorted({p.user_id for p in dataset.portfolios})[:SAMPLE_PORTFOLIOS]
+    few = max(1, repeats // 4)
+
+    return [
+        time_case("holdings", get_holdings, per_portfolio),
+        time_case("snapshot_value", get_portfolio_snapshot, per_portfolio),
+        time_case("trade_history", get_trade_history, pairs * max(1, repeats // max(1, len(pairs)))),
+        time_case("value_history_1y", portfolio_value_series,
+                  [(pid, start, end) for pid in portfolios][:few]),
+        time_case("realized_pnl_fifo", get_realized_pnl, [(pid, "FIFO") for pid in portfolios][:few]),
+        time_case("consolidated_value", get_consolidated_valuation, [(u,) for u in users]),
+    ]
+
+
+def compare(current: dict, baseline: dict):
+    base = {r["case"]: r for r in baseline.get("results", [])}
+    print(f"\nComparison with {baseline.get('commit')} ({baseline.get('size')}, seed {baseline.get('seed')}):")
+    print(f"{'Case':<22} {'Metric':<14} {'Before':>12} {'After':>12} {'Change':>9}")
+    print("-" * 73)
+    for r in current["results"]:
+        b = base.get(r["case"])
+        if b is None:
+            continue
+        for metric in ("p50_ms", "p95_ms", "rows_per_sec", "queries_per_call"):
+            if metric not in r or metric not in b or b[metric] in (None, 0):
+                continue
+            change = (r[metric] - b[metric]) / b[metric] * 100.0
+            print(f"{r['case']:<22} {metric:<14} {b[metric]:>12,.2f} {r[metric]:>12,.2f} {change:>+8.1f}%")
+
+
+def print_results(report: dict):
+    print(f"\n=== Benchmark: {report['size']} seed={report['seed']} commit={report['commit']} ===")
+    for r in report["results"]:
+        if "rows_per_sec" in r:
+            print(f"{r['case']:<22} {r['rows']:>10,} rows in {r['seconds']:>8.2f}s "
+                  f"({r['rows_per_sec']:>10,.0f} rows/sec)")
+        else:
+            q = r.get("queries_per_call")
+            qtxt = f" {q:>7.1f} q/call" if q is not None else ""
+            print(f"{r['case']:<22} p50 {r['p50_ms']:>9.2f} ms  p95 {r['p95_ms']:>9.2f} ms  "
+                  f"n={r['calls']:<4}{qtxt}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Portfolio Manager benchmarks")
+    parser.add_argument("--size", choices=sorted(SIZES), default="small")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--database", default=DEFAULT_DATABASE,
+                        help="benchmark database (never the one in db_config.json)")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--skip-load", action="store_true",
+                        help="reuse an already loaded benchmark database")
+    parser.add_argument("--profile", action="store_true",
+                        help="count statements with sql_profiler and print the top ones")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="earlier results JSON to diff against")
+    args = parser.parse_args(argv)
+
+    dataset = SyntheticDataset(args.size, args.seed)
+    results = []
+    if args.profile:
+        sql_profiler.enable()
+
+    if args.skip_load:
+        cfg = bench_config(args.database)
+        if cfg is None:
+            return 1
+        use_database(cfg)
+    else:
+        print(f"Creating {args.database} and loading the '{args.size}' dataset ...")
+        if not prepare_database(args.database) or not load_reference_data(dataset):
+            return 1
+        with tempfile.TemporaryDirectory(prefix="portfolio_bench_") as workdir:
+            results += run_imports(dataset, workdir)
+
+    results += run_reports(dataset, args.repeats)
+
+    report = {
+        "commit": _git_commit(),
+        "backend": db.backend(),
+        "size": args.size,
+        "seed": args.seed,
+        "profile": SIZES[args.size]._asdict(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "results": results,
+    }
+    print_results(report)
+    if args.profile:
+        sql_profiler.print_summary()
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.out}.")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
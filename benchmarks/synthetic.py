@@ -0,0 +1,358 @@
+# benchmarks/synthetic.py
+#
+# Deterministic synthetic data for benchmarking.
+#
+# Everything is derived from (size profile, seed) with random.Random, and all
+# dates are relative to a fixed END_DATE rather than today, so two runs with
+# the same arguments produce byte-identical data and comparable timings.
+#
+# Users, accounts, portfolios, securities and tags are inserted directly;
+# prices and trades are written to CSV files so the benchmark can time the
+# real import paths (bulk_import_price_csv / import_trades_file) on them.
+
+import csv
+import math
+import os
+import random
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterator, List, Optional
+
+import mysql.connector
+
+import db
+from migrations import migrate
+from security_cache import invalidate_security
+
+END_DATE = date(2024, 12, 31)
+DEFAULT_SEED = 42
+DEFAULT_DATABASE = "portfolio_bench"
+
+Profile = namedtuple(
+    "Profile",
+    ["users", "portfolios_per_user", "securities", "positions_per_portfolio",
+     "trades_per_portfolio", "years"],
+)
+
+SIZES: Dict[str, Profile] = {
+    "tiny":   Profile(2, 2, 50, 10, 200, 1),
+    "small":  Profile(5, 4, 500, 50, 2_000, 3),
+    "medium": Profile(20, 5, 2_000, 200, 20_000, 10),
+    "large":  Profile(50, 8, 5_000, 1_000, 100_000, 10),
+}
+
+EXCHANGES = ("NASDAQ", "NYSE", "ARCA")
+SEC_TYPES = ("STOCK", "STOCK", "STOCK", "ETF", "BOND")
+SECTORS = {
+    "Technology": ("Software", "Semiconductors", "Hardware"),
+    "Financials": ("Banks", "Insurance", "Asset Management"),
+    "Health Care": ("Biotech", "Pharma", "Devices"),
+    "Energy": ("Oil & Gas", "Renewables"),
+    "Consumer": ("Retail", "Food & Beverage", "Autos"),
+    "Industrials": ("Aerospace", "Machinery", "Transport"),
+}
+TAGS = ("Growth", "Value", "Dividend", "ESG", "Large Cap", "Small Cap", "Watchlist")
+
+SyntheticSecurity = namedtuple(
+    "SyntheticSecurity",
+    ["security_id", "ticker", "exchange", "currency", "sec_type", "sector", "industry",
+     "base_price", "tags"],
+)
+SyntheticPortfolio = namedtuple("SyntheticPortfolio", ["portfolio_id", "user_id", "account_id", "name"])
+
+
+def trading_days(years: int, end: date = END_DATE) -> List[date]:
+    """Weekdays in the `years` years ending at end (holidays ignored)."""
+    start = end.replace(year=end.year - years) + timedelta(days=1)
+    days = []
+    d = start
+    while d <= end:
+        if d.weekday() < 5:
+            days.append(d)
+        d += timedelta(days=1)
+    return days
+
+
+def _ticker(i: int) -> str:
+    """Unique four-letter ticker for index i (AAAA, AAAB, ...)."""
+    letters = []
+    for _ in range(4):
+        i, r = divmod(i, 26)
+        letters.append(chr(ord("A") + r))
+    return "".join(reversed(letters))
+
+
+class SyntheticDataset:
+    """The rows for one (profile, seed); generated lazily and repeatably."""
+
+    def __init__(self, size: str = "small", seed: int = DEFAULT_SEED):
+        if size not in SIZES:
+            raise ValueError(f"size must be one of {', '.join(SIZES)}")
+        self.size = size
+        self.seed = seed
+        self.profile = SIZES[size]
+        self.days = trading_days(self.profile.years)
+        self.securities = self._make_securities()
+        self.portfolios = self._make_portfolios()
+
+    def _rng(self, *key) -> random.Random:
+        # Independent stream per (seed, key) so adding a user does not shift
+        # every price series after it.
+        return random.Random(f"{self.seed}:" + ":".join(str(k) for k in key))
+
+    def _make_securities(self) -> List[SyntheticSecurity]:
+        rng = self._rng("securities")
+        out = []
+        for i in range(self.profile.securities):
+            sector = rng.choice(sorted(SECTORS))
+            out.append(SyntheticSecurity(
+                security_id=i + 1,
+                ticker=_ticker(i),
+                exchange=EXCHANGES[i % len(EXCHANGES)],
+                currency="USD",
+                sec_type=rng.choice(SEC_TYPES),
+                sector=sector,
+                industry=rng.choice(SECTORS[sector]),
+                base_price=round(math.exp(rng.uniform(math.log(5), math.log(500))), 2),
+                tags=tuple(sorted(rng.sample(TAGS, rng.randint(0, 3)))),
+            ))
+        return out
+
+    def _make_portfolios(self) -> List[SyntheticPortfolio]:
+        out = []
+        pid = 0
+        for u in range(1, self.profile.users + 1):
+            for p in range(self.profile.portfolios_per_user):
+                pid += 1
+                # every other portfolio is managed by the user's account
+                account = u if p % 2 == 0 else None
+                out.append(SyntheticPortfolio(pid, u, account, f"Bench {u}-{p + 1}"))
+        return out
+
+    # ---------- rows ----------
+
+    def user_rows(self) -> List[tuple]:
+        return [
+            (u, f"bench{u}@example.com", "x", f"User{u}", None, "Bench")
+            for u in range(1, self.profile.users + 1)
+        ]
+
+    def account_rows(self) -> List[tuple]:
+        return [
+            (u, f"BENCH-{u:06d}", "TAXABLE", "Synthetic Brokerage", "USD", f"Account {u}", u)
+            for u in range(1, self.profile.users + 1)
+        ]
+
+    def portfolio_rows(self) -> List[tuple]:
+        return [(p.portfolio_id, p.name, "USD", p.user_id, p.account_id) for p in self.portfolios]
+
+    def security_rows(self) -> List[tuple]:
+        return [
+            (s.security_id, s.ticker, s.exchange, s.currency, s.sec_type, s.sector, s.industry)
+            for s in self.securities
+        ]
+
+    def tag_rows(self) -> List[tuple]:
+        return [(s.security_id, tag) for s in self.securities for tag in s.tags]
+
+    def price_bars(self, security: SyntheticSecurity) -> Iterator[tuple]:
+        """Daily OHLCV bars (geometric random walk) for one security."""
+        rng = self._rng("prices", security.security_id)
+        close = security.base_price
+        drift = rng.uniform(-0.0002, 0.0006)
+        vol = rng.uniform(0.008, 0.03)
+        for d in self.days:
+            open_ = close
+            close = max(0.01, open_ * math.exp(rng.gauss(drift, vol)))
+            high = max(open_, close) * (1 + abs(rng.gauss(0, vol / 2)))
+            low = min(open_, close) * (1 - abs(rng.gauss(0, vol / 2)))
+            yield (datetime.combine(d, time(16, 0)), round(open_, 4), round(high, 4),
+                   round(low, 4), round(close, 4), rng.randint(10_000, 5_000_000))
+
+    def trades(self, portfolio: SyntheticPortfolio) -> List[tuple]:
+        """
+        (ticker, exchange, type, trade_date, qty, price, fees) ordered by date.
+        SELLs never exceed the quantity held; a few DIVIDENDs are mixed in.
+        """
+        rng = self._rng("trades", portfolio.portfolio_id)
+        universe = rng.sample(self.securities, min(self.profile.positions_per_portfolio,
+                                                   len(self.securities)))
+        n = self.profile.trades_per_portfolio
+        dates = sorted(rng.choice(self.days) for _ in range(n))
+        held: Dict[int, float] = {}
+        out = []
+        for d in dates:
+            sec = rng.choice(universe)
+            price = round(sec.base_price * math.exp(rng.gauss(0, 0.25)), 4)
+            roll = rng.random()
+            pos = held.get(sec.security_id, 0.0)
+            if roll < 0.03 and pos > 0:
+                out.append((sec.ticker, sec.exchange, "DIVIDEND", d, pos,
+                            round(rng.uniform(0.05, 1.5), 4), 0.0))
+                continue
+            if roll < 0.35 and pos > 0:
+                qty = float(rng.randint(1, max(1, int(pos))))
+                held[sec.security_id] = pos - qty
+                out.append((sec.ticker, sec.exchange, "SELL", d, qty, price, round(rng.uniform(0, 5), 2)))
+            else:
+                qty = float(rng.randint(1, 200))
+                held[sec.security_id] = pos + qty
+                out.append((sec.ticker, sec.exchange, "BUY", d, qty, price, round(rng.uniform(0, 5), 2)))
+        return out
+
+    # ---------- files ----------
+
+    def write_price_csvs(self, directory: str, files: int = 8) -> int:
+        """Writes the price history as `files` CSVs; returns the row count."""
+        os.makedirs(directory, exist_ok=True)
+        header = ["Ticker", "Exchange", "Time", "Open", "High", "Low", "Close", "Volume"]
+        rows = 0
+        handles = []
+        try:
+            for i in range(files):
+                f = open(os.path.join(directory, f"prices_{i:02d}.csv"), "w", newline="", encoding="utf-8")
+                handles.append(f)
+                csv.writer(f).writerow(header)
+            writers = [csv.writer(f) for f in handles]
+            for sec in self.securities:
+                w = writers[sec.security_id % files]
+                for bar in self.price_bars(sec):
+                    w.writerow((sec.ticker, sec.exchange, bar[0].strftime("%Y-%m-%d %H:%M:%S")) + bar[1:])
+                    rows += 1
+        finally:
+            for f in handles:
+                f.close()
+        return rows
+
+    def write_trade_csv(self, portfolio: SyntheticPortfolio, path: str) -> int:
+        rows = self.trades(portfolio)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["Ticker", "Exchange", "Type", "TradeDate", "Quantity", "UnitPrice", "Fees"])
+            for ticker, exch, ttype, d, qty, price, fees in rows:
+                w.writerow([ticker, exch, ttype, d.isoformat(), qty, price, fees])
+        return len(rows)
+
+
+# ---------- DATABASE ----------
+
+def prepare_database(database: str = DEFAULT_DATABASE, drop: bool = True) -> bool:
+    """
+    Creates (or recreates) a separate benchmark database from Query.sql plus
+    migrations and points the process-wide pool at it. Refuses to touch the
+    database named in db_config.json. On the SQLite backend the benchmark
+    database is the file <database>.db.
+    """
+    cfg = bench_config(database)
+    if cfg is None:
+        return False
+
+    if cfg.get("backend") == "sqlite":
+        path = cfg["sqlite_path"]
+        if drop:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        # the schema is created on first connect
+        use_database(cfg)
+        return migrate()
+
+    try:
+        raw = mysql.connector.connect(
+            host=cfg.get("host", "localhost"),
+            port=cfg.get("port", 3306),
+            user=cfg["user"],
+            password=cfg["password"],
+        )
+    except mysql.connector.Error as e:
+        print(f"[DB ERROR] Failed to connect: {e}")
+        return False
+
+    try:
+        cursor = raw.cursor()
+        if drop:
+            cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{database}`")
+        cursor.execute(f"USE `{database}`")
+        for stmt in db.schema_statements():
+            cursor.execute(stmt)
+        raw.commit()
+    except mysql.connector.Error as e:
+        print(f"[ERROR] Failed to create benchmark schema: {e}")
+        return False
+    finally:
+        cursor.close()
+        raw.close()
+
+    use_database(cfg)
+    return migrate()
+
+
+def bench_config(database: str = DEFAULT_DATABASE) -> Optional[dict]:
+    """db_config.json re-pointed at the benchmark database (None if that is the real one)."""
+    cfg = dict(db.get_config())
+    if str(cfg.get("backend", db.DEFAULT_BACKEND)).lower() == "sqlite":
+        path = f"{database}.db"
+        if os.path.abspath(path) == os.path.abspath(cfg.get("sqlite_path", db.DEFAULT_SQLITE_PATH)):
+            print(f"[ERROR] Refusing to use the configured database '{path}' for benchmarks.")
+            return None
+        cfg["backend"] = "sqlite"
+        cfg["sqlite_path"] = path
+        return cfg
+
+    if database == cfg.get("database"):
+        print(f"[ERROR] Refusing to use the configured database '{database}' for benchmarks.")
+        return None
+    cfg["database"] = database
+    return cfg
+
+
+def use_database(cfg: dict):
+    """Re-points the pool (and drops the security cache) to cfg."""
+    db.reset_pool()
+    db.init_pool(cfg)
+    invalidate_security()
+
+
+def load_reference_data(dataset: SyntheticDataset) -> bool:
+    """Inserts users, accounts, portfolios, securities and tags."""
+    conn = db.get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return False
+
+    try:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT INTO app_user (UserID, PrimaryEmail, PasswordHash, Fname, Mname, Lname) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            dataset.user_rows()
+        )
+        cursor.executemany(
+            "INSERT INTO brokerage_account (AccountID, AccountNumber, AccountType, BrokerageName, "
+            "BaseCurrency, Nickname, OwnerUserID) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            dataset.account_rows()
+        )
+        cursor.executemany(
+            "INSERT INTO portfolio (PortfolioID, PortfolioName, BaseCurrency, OwnerUserID, "
+            "ManagedByAccountID) VALUES (%s, %s, %s, %s, %s)",
+            dataset.portfolio_rows()
+        )
+        cursor.executemany(
+            "INSERT INTO security (SecurityID, Ticker, Exchange, Currency, SecType, Sector, Industry) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            dataset.security_rows()
+        )
+        tags = dataset.tag_rows()
+        if tags:
+            cursor.executemany("INSERT INTO security_tag (SecurityID, Tag) VALUES (%s, %s)", tags)
+        conn.commit()
+        invalidate_security()
+        return True
+    except Exception as e:
+        print(f"[ERROR] Failed to load reference data: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        conn.close()
@@ -0,0 +1,450 @@
+# cli.py
+#
+# Non-interactive entry point for scripts and cron jobs. Each subcommand
+# calls the same input-free service functions the menus use, prints a
+# plain-text or --json result and exits non-zero on failure.
+#
+#     python cli.py --json holdings --portfolio 3
+#     python cli.py record-trade --portfolio 3 --ticker AAPL --type BUY --qty 10 --price 187.5
+#     python cli.py import-prices ./bars/ --interval 1D
+
+import argparse
+import contextlib
+import json
+import sys
+from datetime import datetime, time, timedelta
+from typing import Optional
+
+import sql_profiler
+from db import init_pool
+from dividend_functions import PERIODS as DIVIDEND_PERIODS, get_dividend_income, get_user_dividend_income
+from export_functions import TABLES as EXPORT_TABLES, export_tables
+from exposure_functions import get_exposure, get_user_exposure
+from fx_functions import import_fx_csv, save_fx_rates
+from history_functions import portfolio_value_series
+from holding_functions import rebuild_holdings
+from lot_functions import get_realized_pnl
+from price_cache import refresh_price_cache
+from price_functions import bulk_import_price_csv, save_price_snapshot
+from report_functions import get_consolidated_valuation, get_holdings, get_portfolio_snapshot
+from resample_functions import resample_prices
+from risk_functions import get_risk_stats
+from security_cache import find_security, get_security, security_cache
+from tag_functions import RULE_COLUMNS, find_securities_by_tags, tag_by_rule, tag_from_file
+from trade_functions import get_trade_page, import_trades_file, insert_trade
+
+
+def _date(value: str):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _datetime(value: str):
+    return datetime.fromisoformat(value)
+
+
+def _resolve_security(args) -> Optional[int]:
+    if args.security_id is not None:
+        return args.security_id if get_security(args.security_id) else None
+    sec = find_security(args.ticker, args.exchange)
+    return sec.security_id if sec else None
+
+
+def _add_security_args(p):
+    group = p.add_mutually_exclusive_group(required=True)
+    group.add_argument("--security-id", type=int)
+    group.add_argument("--ticker")
+    p.add_argument("--exchange", help="disambiguates --ticker when listed on several exchanges")
+
+
+# ---------- COMMANDS ----------
+
+def cmd_record_trade(args):
+    security_id = _resolve_security(args)
+    if security_id is None:
+        print("[ERROR] Unknown security.")
+        return None
+    trade_type = "DIVIDEND" if args.command == "record-dividend" else args.type
+    txn_id = insert_trade(
+        args.portfolio, security_id, trade_type,
+        args.date or datetime.today().date(), args.qty, args.price,
+        fees=args.fees, settle_date=args.settle_date, notes=args.notes,
+        trade_currency=args.currency,
+    )
+    if txn_id is None:
+        return None
+    return {"TransactionID": txn_id, "SecurityID": security_id, "Type": trade_type}
+
+
+def cmd_save_price(args):
+    security_id = _resolve_security(args)
+    if security_id is None:
+        print("[ERROR] Unknown security.")
+        return None
+    if args.time:
+        snapshot_time = args.time
+    else:
+        snapshot_time = datetime.combine(datetime.today().date(), time(16, 0))
+    ok = save_price_snapshot(
+        security_id, snapshot_time, args.open, args.high, args.low, args.close,
+        args.volume, source=args.source, interval_code=args.interval,
+    )
+    return {"SecurityID": security_id, "SnapshotTime": snapshot_time} if ok else None
+
+
+def cmd_import_prices(args):
+    return bulk_import_price_csv(
+        args.path, batch_size=args.batch_size, default_exchange=args.exchange,
+        source=args.source, interval_code=args.interval, verbose=False,
+    )
+
+
+def cmd_import_trades(args):
+    return import_trades_file(
+        args.portfolio, args.path, commit_size=args.commit_size,
+        default_exchange=args.exchange, verbose=False,
+    )
+
+
+def cmd_trade_history(args):
+    return get_trade_page(
+        args.portfolio, args.start, args.end, args.type, args.security_id,
+        after=args.after, limit=args.limit,
+    )
+
+
+def cmd_holdings(args):
+    return get_holdings(args.portfolio)
+
+
+def cmd_snapshot_value(args):
+    return get_portfolio_snapshot(args.portfolio, args.interval)
+
+
+def cmd_consolidated_value(args):
+    return get_consolidated_valuation(args.user, args.account, interval_code=args.interval,
+                                      currency=args.currency)
+
+
+def cmd_value_history(args):
+    end = args.end or datetime.today().date()
+    start = args.start or end - timedelta(days=365)
+    series = portfolio_value_series(args.portfolio, start, end, args.interval, use_cache=args.use_cache,
+                                    currency=args.currency)
+    if series is None:
+        return None
+    return [
+        {"Date": str(d), "Value": round(float(v), 4), "Currency": series.currency}
+        for d, v in zip(series.dates, series.values)
+    ]
+
+
+def cmd_dividend_income(args):
+    if args.portfolio is not None:
+        return get_dividend_income([args.portfolio], args.period, args.start, args.end)
+    return get_user_dividend_income(args.user, args.account, args.period, args.start, args.end)
+
+
+def cmd_exposure(args):
+    filters = dict(all_tags=args.tag or (), any_tags=args.any_tag or (), exclude_tags=args.exclude_tag or (),
+                   currency=args.currency, interval_code=args.interval)
+    if args.portfolio is not None:
+        return get_exposure([args.portfolio], **filters)
+    return get_user_exposure(args.user, args.account, **filters)
+
+
+def cmd_realized_pnl(args):
+    return get_realized_pnl(
+        args.portfolio, args.method, security_id=args.security_id,
+        include_sells=args.sells, include_lots=args.lots,
+    )
+
+
+def cmd_risk(args):
+    benchmark_id = None
+    if args.benchmark:
+        sec = find_security(args.benchmark, args.exchange)
+        if sec is None:
+            print(f"[ERROR] Unknown or ambiguous benchmark ticker '{args.benchmark}'.")
+            return None
+        benchmark_id = sec.security_id
+    return get_risk_stats(args.portfolio, args.start, args.end, benchmark_id, args.interval,
+                          use_cache=args.use_cache)
+
+
+def cmd_resample_prices(args):
+    return resample_prices(security_id=args.security_id, full=args.full, verbose=False)
+
+
+def cmd_cache_prices(args):
+    security_ids = [args.security_id] if args.security_id is not None else None
+    return refresh_price_cache(security_ids, args.interval, rebuild=args.rebuild, verbose=False)
+
+
+def cmd_export_parquet(args):
+    return export_tables(args.table, full=args.full, directory=args.dir, verbose=False)
+
+
+def cmd_save_fx(args):
+    rate_date = args.date or datetime.today().date()
+    written = save_fx_rates([(args.from_currency, args.to_currency, rate_date, args.rate)], args.source)
+    return {"written": written} if written is not None else None
+
+
+def cmd_import_fx(args):
+    written = import_fx_csv(args.path, args.source)
+    return {"written": written} if written is not None else None
+
+
+def cmd_tag_securities(args):
+    if args.file:
+        return tag_from_file(args.file, args.batch_size, args.exchange)
+    criteria = {field: getattr(args, field) for field in RULE_COLUMNS if getattr(args, field) is not None}
+    if not criteria and not args.all:
+        print("[ERROR] Give a rule (--sector, --industry, ...) or --all to tag every security.")
+        return None
+    inserted = tag_by_rule(args.tag, **criteria)
+    return {"inserted": inserted} if inserted is not None else None
+
+
+def cmd_find_tagged(args):
+    ids = find_securities_by_tags(args.expression)
+    if ids is None:
+        return None
+    info = security_cache().get_many(ids)
+    return [
+        {"SecurityID": sid, "Ticker": info[sid].ticker, "Exchange": info[sid].exchange,
+         "Tags": ";".join(sorted(info[sid].tags))}
+        for sid in ids if sid in info
+    ]
+
+
+def cmd_rebuild_holdings(args):
+    return {"rebuilt": True} if rebuild_holdings(args.portfolio) else None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Portfolio Manager command-line mode")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--sql-summary", action="store_true",
+                        help="profile SQL statements and print the top ones to stderr")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("record-trade", "record-dividend"):
+        p = sub.add_parser(name)
+        p.add_argument("--portfolio", type=int, required=True)
+        _add_security_args(p)
+        if name == "record-trade":
+            p.add_argument("--type", type=str.upper, choices=("BUY", "SELL"), required=True)
+        p.add_argument("--qty", type=float, required=True)
+        p.add_argument("--price", type=float, required=True,
+                       help="unit price (dividend per share for record-dividend)")
+        p.add_argument("--fees", type=float, default=0.0)
+        p.add_argument("--date", type=_date, help="YYYY-MM-DD, default today")
+        p.add_argument("--settle-date", type=_date)
+        p.add_argument("--currency", type=str.upper)
+        p.add_argument("--notes")
+        p.set_defaults(func=cmd_record_trade)
+
+    p = sub.add_parser("save-price", help="upsert one OHLCV bar")
+    _add_security_args(p)
+    p.add_argument("--time", type=_datetime, help="ISO timestamp, default today 16:00")
+    for field in ("open", "high", "low", "close"):
+        p.add_argument(f"--{field}", type=float, required=True)
+    p.add_argument("--volume", type=int, required=True)
+    p.add_argument("--source", default="Manual")
+    p.add_argument("--interval", type=str.upper, default="1D")
+    p.set_defaults(func=cmd_save_price)
+
+    p = sub.add_parser("import-prices", help="bulk CSV price import")
+    p.add_argument("path", help="CSV file or directory of CSV files")
+    p.add_argument("--batch-size", type=int, default=5000)
+    p.add_argument("--exchange", help="exchange for files without an Exchange column")
+    p.add_argument("--source", default="CSV")
+    p.add_argument("--interval", type=str.upper, default="1D")
+    p.set_defaults(func=cmd_import_prices)
+
+    p = sub.add_parser("import-trades", help="batched broker-export trade import")
+    p.add_argument("path", help="CSV, JSON-lines or JSON-array export")
+    p.add_argument("--portfolio", type=int, required=True)
+    p.add_argument("--commit-size", type=int, default=5000)
+    p.add_argument("--exchange", help="exchange for exports without an Exchange column")
+    p.set_defaults(func=cmd_import_trades)
+
+    p = sub.add_parser("trade-history", help="one page of filtered trade history")
+    p.add_argument("--portfolio", type=int, required=True)
+    p.add_argument("--security-id", type=int, action="append", help="repeatable; default: all securities")
+    p.add_argument("--type", type=str.upper, action="append", help="repeatable, e.g. --type BUY --type SELL")
+    p.add_argument("--start", type=_date, help="YYYY-MM-DD")
+    p.add_argument("--end", type=_date, help="YYYY-MM-DD")
+    p.add_argument("--limit", type=int, default=100, help="trades per page")
+    p.add_argument("--after", help="NextCursor printed by the previous page")
+    p.set_defaults(func=cmd_trade_history)
+
+    p = sub.add_parser("holdings")
+    p.add_argument("--portfolio", type=int, required=True)
+    p.set_defaults(func=cmd_holdings)
+
+    p = sub.add_parser("snapshot-value")
+    p.add_argument("--portfolio", type=int, required=True)
+    p.add_argument("--interval", type=str.upper, help="value at the latest bar of this IntervalCode")
+    p.set_defaults(func=cmd_snapshot_value)
+
+    p = sub.add_parser("consolidated-value", help="value all of a user's portfolios")
+    p.add_argument("--user", type=int, required=True)
+    p.add_argument("--account", type=int, help="only portfolios managed by this AccountID")
+    p.add_argument("--interval", type=str.upper, help="value at the latest bar of this IntervalCode")
+    p.add_argument("--currency", type=str.upper,
+                   help="currency of the totals (default: the most common portfolio BaseCurrency)")
+    p.set_defaults(func=cmd_consolidated_value)
+
+    p = sub.add_parser("value-history", help="daily portfolio value series")
+    p.add_argument("--portfolio", type=int, required=True)
+    p.add_argument("--start", type=_date, help="YYYY-MM-DD, default one year before --end")
+    p.add_argument("--end", type=_date, help="YYYY-MM-DD, default today")
+    p.add_argument("--interval", type=str.upper, help="only use bars with this IntervalCode")
+    p.add_argument("--use-cache", action="store_true",
+                   help="read closes from the local price cache (see cache-prices)")
+    p.add_argument("--currency", type=str.upper, help="default: the portfolio's BaseCurrency")
+    p.set_defaults(func=cmd_value_history)
+
+    p = sub.add_parser("realized-pnl", help="lot-matched realized P&L and open lots")
+    p.add_argument("--portfolio", type=int, required=True)
+    p.add_argument("--method", type=str.upper, choices=("FIFO", "LIFO", "AVERAGE"), default="FIFO")
+    p.add_argument("--security-id", type=int)
+    p.add_argument("--sells", action="store_true", help="include every matched sell")
+    p.add_argument("--lots", action="store_true", help="include every open lot")
+    p.set_defaults(func=cmd_realized_pnl)
+
+    p = sub.add_parser("dividend-income", help="gross/withholding/net dividends by period and security")
+    who = p.add_mutually_exclusive_group(required=True)
+    who.add_argument("--portfolio", type=int)
+    who.add_argument("--user", type=int, help="every portfolio the user owns")
+    p.add_argument("--account", type=int, help="with --user: only portfolios managed by this AccountID")
+    p.add_argument("--period", type=str.upper, choices=DIVIDEND_PERIODS, default="MONTH")
+    p.add_argument("--start", type=_date, help="YYYY-MM-DD, first month included")
+    p.add_argument("--end", type=_date, help="YYYY-MM-DD, last month included")
+    p.set_defaults(func=cmd_dividend_income)
+
+    p = sub.add_parser("exposure", help="market value by tag, sector, industry and SecType")
+    who = p.add_mutually_exclusive_group(required=True)
+    who.add_argument("--portfolio", type=int)
+    who.add_argument("--user", type=int, help="every portfolio the user owns")
+    p.add_argument("--account", type=int, help="with --user: only portfolios managed by this AccountID")
+    p.add_argument("--tag", action="append", help="repeatable; keep securities with ALL of these tags")
+    p.add_argument("--any-tag", action="append", help="repeatable; keep securities with ANY of these tags")
+    p.add_argument("--exclude-tag", action="append", help="repeatable; drop securities with any of these tags")
+    p.add_argument("--currency", type=str.upper, help="default: the most common portfolio BaseCurrency")
+    p.add_argument("--interval", type=str.upper, help="value at the latest bar of this IntervalCode")
+    p.set_defaults(func=cmd_exposure)
+
+    p = sub.add_parser("risk", help="volatility, beta, correlation and max drawdown over a window")
+    p.add_argument("--portfolio", type=int, required=True)
+    p.add_argument("--start", type=_date, help="YYYY-MM-DD, default one year before --end")
+    p.add_argument("--end", type=_date, help="YYYY-MM-DD as-of date, default today")
+    p.add_argument("--benchmark", help="benchmark ticker for betas, e.g. SPY")
+    p.add_argument("--exchange", help="disambiguates --benchmark")
+    p.add_argument("--interval", type=str.upper, help="only use bars with this IntervalCode")
+    p.add_argument("--use-cache", action="store_true", help="read closes from the local price cache")
+    p.set_defaults(func=cmd_risk)
+
+    p = sub.add_parser("resample-prices", help="roll 1MIN bars up into 1H and 1D bars")
+    p.add_argument("--security-id", type=int, help="default: every security")
+    p.add_argument("--full", action="store_true", help="rebuild every window, not only changed ones")
+    p.set_defaults(func=cmd_resample_prices)
+
+    p = sub.add_parser("cache-prices", help="refresh the memory-mapped local price cache")
+    p.add_argument("--interval", type=str.upper, default="1D")
+    p.add_argument("--security-id", type=int, help="default: every security with bars of --interval")
+    p.add_argument("--rebuild", action="store_true", help="discard and reload instead of appending")
+    p.set_defaults(func=cmd_cache_prices)
+
+    p = sub.add_parser("export-parquet", help="export tables to partitioned Parquet (needs pyarrow)")
+    p.add_argument("--table", action="append", choices=EXPORT_TABLES,
+                   help="repeatable; default: all of them")
+    p.add_argument("--full", action="store_true",
+                   help="re-export trade/price_snapshot instead of what changed since the last export")
+    p.add_argument("--dir", help="output directory (default: export_dir from db_config.json)")
+    p.set_defaults(func=cmd_export_parquet)
+
+    p = sub.add_parser("save-fx", help="upsert one FX rate (1 FROM = RATE TO)")
+    p.add_argument("--from", dest="from_currency", type=str.upper, required=True)
+    p.add_argument("--to", dest="to_currency", type=str.upper, required=True)
+    p.add_argument("--rate", type=float, required=True)
+    p.add_argument("--date", type=_date, help="YYYY-MM-DD, default today")
+    p.add_argument("--source", default="Manual")
+    p.set_defaults(func=cmd_save_fx)
+
+    p = sub.add_parser("import-fx", help="import FX rates from a From,To,Date,Rate CSV")
+    p.add_argument("path")
+    p.add_argument("--source", default="CSV")
+    p.set_defaults(func=cmd_import_fx)
+
+    p = sub.add_parser("tag-securities", help="bulk-add tags from a mapping CSV or by rule")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--file", help="CSV with SecurityID or Ticker[,Exchange] and Tag (several tags: a;b)")
+    src.add_argument("--tag", help="tag to add to every security matching the rule")
+    p.add_argument("--sector")
+    p.add_argument("--industry")
+    p.add_argument("--sec-type", type=str.upper)
+    p.add_argument("--exchange", type=str.upper, help="rule field, or default exchange for --file")
+    p.add_argument("--currency", type=str.upper)
+    p.add_argument("--all", action="store_true", help="with --tag and no rule: tag every security")
+    p.add_argument("--batch-size", type=int, default=5000)
+    p.set_defaults(func=cmd_tag_securities)
+
+    p = sub.add_parser("find-tagged", help="securities matching a tag expression")
+    p.add_argument("expression", help='e.g. \'Tech AND (Dividend OR "Large Cap") AND NOT Speculative\'')
+    p.set_defaults(func=cmd_find_tagged)
+
+    p = sub.add_parser("rebuild-holdings", help="repair holding rows from trade history")
+    p.add_argument("--portfolio", type=int, help="default: every portfolio")
+    p.set_defaults(func=cmd_rebuild_holdings)
+
+    return parser
+
+
+def _print_text(result):
+    if isinstance(result, list):
+        if not result:
+            print("(no rows)")
+            return
+        headers = list(result[0].keys())
+        print("\t".join(headers))
+        for row in result:
+            print("\t".join("" if row[h] is None else str(row[h]) for h in headers))
+    elif isinstance(result, dict):
+        for key, value in result.items():
+            if isinstance(value, list) and all(isinstance(v, dict) for v in value):
+                print(f"{key}:")
+                _print_text(value)
+            else:
+                print(f"{key}: {value}")
+    else:
+        print(result)
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    init_pool()
+    if args.sql_summary:
+        sql_profiler.enable()
+
+    # Services report problems with print(); keep stdout clean for the result
+    with contextlib.redirect_stdout(sys.stderr):
+        with sql_profiler.action(args.command):
+            result = args.func(args)
+        if args.sql_summary:
+            sql_profiler.print_summary()
+
+    if result is None:
+        return 1
+    if args.json:
+        json.dump(result, sys.stdout, default=str, indent=2)
+        sys.stdout.write("\n")
+    else:
+        _print_text(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,648 @@
 #Low-level DB connection helper
 import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
 import mysql.connector
 from mysql.connector import Error
 
-def load_config(path: str = "db_config.json") -> dict:
+import sql_profiler
+
+CONFIG_PATH = "db_config.json"
+SCHEMA_PATH = "Query.sql"
+
+# Storage backends, chosen with "backend" in db_config.json
+BACKENDS = ("mysql", "sqlite")
+DEFAULT_BACKEND = "mysql"
+DEFAULT_SQLITE_PATH = "portfolio.db"
+
+# Pool defaults; each can be overridden in db_config.json
+DEFAULT_POOL_SIZE = 5
+DEFAULT_POOL_TIMEOUT = 30.0         # seconds to wait for a free connection
+DEFAULT_POOL_PING_INTERVAL = 60.0   # idle seconds before a connection is re-checked
+DEFAULT_PREPARED_PER_CONNECTION = 64  # statements kept prepared per pooled connection
+
+_config = None
+_config_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def load_config(path: str = CONFIG_PATH) -> dict:
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
+
+def get_config() -> dict:
+    """
+    Returns the parsed db_config.json. The file is read once per process;
+    call reset_pool() after editing it to pick up the changes.
+    """
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                _config = load_config()
+    return _config
+
+
+def _backend_of(cfg: dict) -> str:
+    name = str(cfg.get("backend", DEFAULT_BACKEND)).lower()
+    if name not in BACKENDS:
+        raise Error(f"Unknown backend '{name}' in {CONFIG_PATH} (expected one of {', '.join(BACKENDS)}).")
+    return name
+
+
+def _connect_raw(cfg: dict):
+    if _backend_of(cfg) == "sqlite":
+        return SQLiteConnection(cfg.get("sqlite_path", DEFAULT_SQLITE_PATH))
+    return mysql.connector.connect(
+        host=cfg.get("host", "localhost"),
+        port=cfg.get("port", 3306),
+        user=cfg["user"],
+        password=cfg["password"],
+        database=cfg["database"],
+    )
+
+
+# ---------- SQLITE BACKEND ----------
+#
+# An embedded alternative to MySQL for local analytics runs and CI
+# benchmarks. SQLiteConnection exposes the small part of the
+# mysql.connector API the services use (cursor/commit/rollback/
+# in_transaction/ping), and every statement is translated on the way in:
+# %s placeholders, ON DUPLICATE KEY UPDATE / VALUES(col) upserts,
+# INSERT IGNORE and the MySQL-only bits of Query.sql DDL. DATE and DATETIME
+# columns are stored as ISO text and come back as date/datetime; YEAR() and
+# MONTH() are registered as SQL functions.
+
+_DUPLICATE_KEY_RE = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.I)
+_UPSERT_VALUES_RE = re.compile(r"\bVALUES\s*\(\s*(\w+)\s*\)", re.I)
+_SQLITE_REWRITES = [
+    (re.compile(r"\bINSERT\s+IGNORE\b", re.I), "INSERT OR IGNORE"),
+    (re.compile(r"\bINT(?:EGER)?\s+UNSIGNED\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b", re.I),
+     "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r"\s+UNSIGNED\b", re.I), ""),
+    (re.compile(r"\)\s*ENGINE\s*=\s*\w+(?:\s+DEFAULT\s+CHARSET\s*=\s*\w+)?\s*$", re.I), ")"),
+    # ALTER TABLE ... ADD COLUMN ... AFTER col: SQLite always appends
+    (re.compile(r"\s+AFTER\s+\w+\s*$", re.I), ""),
+]
+
+
+@lru_cache(maxsize=1024)
+def translate_sql(sql: str) -> str:
+    """Rewrites one MySQL-dialect statement as used in this project for SQLite."""
+    m = _DUPLICATE_KEY_RE.search(sql)
+    if m:
+        # SQLite evaluates every SET expression against the old row, the
+        # same as our upserts assume (AvgCostBasis is assigned first).
+        tail = _UPSERT_VALUES_RE.sub(r"excluded.\1", sql[m.end():])
+        sql = sql[:m.start()] + "ON CONFLICT DO UPDATE SET" + tail
+    for pattern, repl in _SQLITE_REWRITES:
+        sql = pattern.sub(repl, sql)
+    return sql.replace("%s", "?").replace("%%", "%")
+
+
+def schema_statements(path: str = SCHEMA_PATH) -> List[str]:
+    """Query.sql split into statements, minus comments and CREATE DATABASE / USE."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = "\n".join(line.split("--", 1)[0] for line in f)
+    out = []
+    for stmt in text.split(";"):
+        stmt = stmt.strip()
+        if stmt and not stmt.upper().startswith(("CREATE DATABASE", "USE ")):
+            out.append(stmt)
+    return out
+
+
+def _parse_date(value: bytes) -> date:
+    text = value.decode()
+    return datetime.fromisoformat(text).date() if len(text) > 10 else date.fromisoformat(text)
+
+
+def _parse_datetime(value: bytes) -> datetime:
+    return datetime.fromisoformat(value.decode())
+
+
+def _date_part(start: int, end: int):
+    """MySQL YEAR()/MONTH() over SQLite's ISO date text."""
+    def part(value):
+        return int(value[start:end]) if value is not None else None
+    return part
+
+
+_sqlite_types_registered = False
+
+
+def _register_sqlite_types():
+    global _sqlite_types_registered
+    if _sqlite_types_registered:
+        return
+    sqlite3.register_adapter(date, lambda d: d.isoformat())
+    sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+    sqlite3.register_converter("DATE", _parse_date)
+    sqlite3.register_converter("DATETIME", _parse_datetime)
+    _sqlite_types_registered = True
+
+
+class SQLiteCursor:
+    """DB-API cursor that translates each statement before running it."""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def execute(self, sql: str, params=()):
+        self._cursor.execute(translate_sql(sql), tuple(params or ()))
+        return self
+
+    def executemany(self, sql: str, seq_of_params):
+        self._cursor.executemany(translate_sql(sql), (tuple(p) for p in seq_of_params))
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size: int = 1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class SQLiteConnection:
+    """
+    sqlite3 connection with the mysql.connector surface the services use.
+    A new database file gets the translated Query.sql schema on first
+    connect; run migrations.py afterwards exactly as for MySQL.
+    """
+
+    def __init__(self, path: str):
+        _register_sqlite_types()
+        # Pooled connections are handed between threads (one user at a time)
+        self._conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES,
+                                     check_same_thread=False, timeout=DEFAULT_POOL_TIMEOUT)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.create_function("YEAR", 1, _date_part(0, 4), deterministic=True)
+        self._conn.create_function("MONTH", 1, _date_part(5, 7), deterministic=True)
+        self._ensure_schema()
+
+    def _ensure_schema(self):
+        row = self._conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'security'"
+        ).fetchone()
+        if row[0]:
+            return
+        cursor = self.cursor()
+        try:
+            for stmt in schema_statements():
+                cursor.execute(stmt)
+            self._conn.commit()
+        finally:
+            cursor.close()
+
+    def cursor(self, *args, **kwargs) -> SQLiteCursor:
+        return SQLiteCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._conn.in_transaction
+
+    def ping(self, reconnect: bool = False, attempts: int = 1, delay: int = 0):
+        self._conn.execute("SELECT 1")
+
+    def is_connected(self) -> bool:
+        try:
+            self.ping()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self._conn.close()
+
+
+# ---------- PREPARED STATEMENTS ----------
+#
+# cursor(prepared=True) on a pooled connection returns a PreparedCursor:
+# every distinct statement text it executes is prepared once per pooled
+# connection (server-side, binary protocol on MySQL) and re-executed by later
+# borrowers of that connection, so hot single-row writes and lookups skip
+# the parse/plan step. Statements are kept in a per-connection LRU of
+# prepared_per_connection entries and dropped whenever the connection is
+# health-checked (a reconnect loses them server-side).
+#
+# mysql-connector re-prepares whenever the statement passed to execute() is
+# not the very string object it prepared (an identity check, not equality),
+# so the registry keeps the first string seen for each statement text and
+# always executes with that object. Statements built per call (IN lists,
+# optional filters) therefore reuse their prepared handle like constant ones.
+#
+# Bulk loaders keep plain cursors: text-protocol executemany() turns an
+# INSERT batch into one multi-row statement, which beats N prepared
+# executions. sqlite3 already caches compiled statements per connection, so
+# on the SQLite backend prepared=True simply returns a plain cursor.
+
+def _drain(cursor):
+    """Reads any unfetched rows so the connection can run the next statement."""
+    try:
+        if cursor.description is not None:
+            cursor.fetchall()
+    except Exception:
+        pass
+
+
+class StatementRegistry:
+    """
+    Prepared cursors of one raw connection, keyed by statement text. Each
+    entry keeps the string the statement was prepared from, which callers
+    must execute with.
+    """
+
+    def __init__(self, raw, max_statements: int):
+        self._raw = raw
+        self._max = max_statements
+        self._cursors: "OrderedDict[str, Tuple[str, object]]" = OrderedDict()
+        self.prepares = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self._cursors)
+
+    def cursor_for(self, sql: str) -> Tuple[str, object]:
+        """(canonical statement string, prepared cursor) for sql."""
+        entry = self._cursors.get(sql)
+        if entry is not None:
+            self._cursors.move_to_end(sql)
+            self.hits += 1
+            return entry
+
+        entry = (sql, self._raw.cursor(prepared=True))
+        self._cursors[sql] = entry
+        self.prepares += 1
+        if len(self._cursors) > self._max:
+            _, (_, oldest) = self._cursors.popitem(last=False)
+            _close_quietly(oldest)
+        return entry
+
+    def close(self):
+        cursors, self._cursors = self._cursors, OrderedDict()
+        for _, cursor in cursors.values():
+            _close_quietly(cursor)
+
+
+def _close_quietly(obj):
+    try:
+        obj.close()
+    except Exception:
+        pass
+
+
+class PreparedCursor:
+    """
+    DB-API cursor over a StatementRegistry. Each execute() runs on the
+    registry's prepared cursor for that statement; close() only releases
+    the current result, the prepared statements stay with the connection.
+    """
+
+    def __init__(self, registry: StatementRegistry):
+        self._registry = registry
+        self._current = None
+        self._sql = None
+
+    def _switch(self, sql: str) -> str:
+        if self._current is not None:
+            _drain(self._current)
+            if sql == self._sql:
+                return self._sql
+        self._sql, self._current = self._registry.cursor_for(sql)
+        return self._sql
+
+    def execute(self, sql: str, params=()):
+        sql = self._switch(sql)
+        self._current.execute(sql, tuple(params or ()))
+        return self
+
+    def executemany(self, sql: str, seq_of_params):
+        sql = self._switch(sql)
+        self._current.executemany(sql, [tuple(p) for p in seq_of_params])
+        return self
+
+    def fetchone(self):
+        return self._current.fetchone()
+
+    def fetchmany(self, size: int = 1):
+        return self._current.fetchmany(size)
+
+    def fetchall(self):
+        return self._current.fetchall()
+
+    @property
+    def lastrowid(self):
+        return self._current.lastrowid if self._current is not None else None
+
+    @property
+    def rowcount(self):
+        return self._current.rowcount if self._current is not None else -1
+
+    @property
+    def description(self):
+        return self._current.description if self._current is not None else None
+
+    def close(self):
+        if self._current is not None:
+            _drain(self._current)
+            self._current = self._sql = None
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+
+class PooledConnection:
+    """
+    Thin wrapper around a pooled connection. close() hands the connection
+    back to the pool instead of tearing down the socket, so the existing
+    'conn.close()' in every finally block keeps working unchanged.
+    """
+
+    def __init__(self, pool: "ConnectionPool", raw):
+        self._pool = pool
+        self._raw = raw
+
+    def close(self):
+        if self._raw is None:
+            return
+        raw, self._raw = self._raw, None
+        self._pool.release(raw)
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def cursor(self, *args, prepared: bool = False, **kwargs):
+        """
+        A new cursor. prepared=True returns a PreparedCursor that reuses
+        this connection's prepared statements (a plain cursor when
+        prepared_statements is off in db_config.json).
+        """
+        if self._raw is None:
+            raise Error("Connection already returned to the pool.")
+        if prepared and self._pool.prepared_enabled:
+            return sql_profiler.wrap_cursor(PreparedCursor(self._pool.registry(self._raw)))
+        return sql_profiler.wrap_cursor(self._raw.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise Error("Connection already returned to the pool.")
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of MySQL connections.
+
+    Connections are opened lazily up to pool_size and reused LIFO, so a
+    quiet process keeps only the connections it actually needs warm.
+    Connections idle longer than ping_interval are pinged (and reconnected
+    if the socket went stale) before being handed out.
+    """
+
+    def __init__(self, cfg: dict):
+        self._cfg = cfg
+        self.backend = _backend_of(cfg)
+        sql_profiler.configure(cfg)
+        self.size = int(cfg.get("pool_size", DEFAULT_POOL_SIZE))
+        self.timeout = float(cfg.get("pool_timeout", DEFAULT_POOL_TIMEOUT))
+        self.ping_interval = float(cfg.get("pool_ping_interval", DEFAULT_POOL_PING_INTERVAL))
+        self.prepared_enabled = bool(cfg.get("prepared_statements", True)) and self.backend == "mysql"
+        self.prepared_per_connection = int(cfg.get("prepared_per_connection", DEFAULT_PREPARED_PER_CONNECTION))
+
+        self._cond = threading.Condition()
+        self._idle = []        # stack of (raw_conn, last_used_monotonic)
+        self._open = 0         # connections currently alive (idle + in use)
+        self._registries: Dict[int, StatementRegistry] = {}   # id(raw_conn) -> registry
+
+        # counters for pool_stats()
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._reconnects = 0
+        self._discarded = 0
+
+    def acquire(self) -> PooledConnection:
+        start = time.monotonic()
+        deadline = start + self.timeout
+        raw = None
+        last_used = None
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, last_used = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Error(
+                        f"Connection pool exhausted ({self.size} in use, "
+                        f"waited {self.timeout:.1f}s)."
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            wait = time.monotonic() - start
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+        try:
+            if raw is None:
+                raw = _connect_raw(self._cfg)
+            elif time.monotonic() - last_used > self.ping_interval:
+                raw = self._check_health(raw)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, raw)
+
+    def registry(self, raw) -> StatementRegistry:
+        """The statement registry of a raw connection (only its borrower uses it)."""
+        with self._cond:
+            reg = self._registries.get(id(raw))
+            if reg is None:
+                reg = self._registries[id(raw)] = StatementRegistry(raw, self.prepared_per_connection)
+            return reg
+
+    def _forget_statements(self, raw):
+        with self._cond:
+            reg = self._registries.pop(id(raw), None)
+        if reg is not None:
+            reg.close()
+
+    def _check_health(self, raw):
+        # a ping may reconnect, which silently drops server-side statements
+        self._forget_statements(raw)
+        try:
+            raw.ping(reconnect=True, attempts=1, delay=0)
+            return raw
+        except Exception:
+            pass
+
+        # Socket is dead and a reconnect on it failed: start over
+        with self._cond:
+            self._reconnects += 1
+        try:
+            raw.close()
+        except Exception:
+            pass
+        return _connect_raw(self._cfg)
+
+    def release(self, raw):
+        try:
+            # never leak an open transaction (or a stale REPEATABLE READ
+            # snapshot) to the next borrower
+            if raw.in_transaction:
+                raw.rollback()
+            healthy = True
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            if healthy:
+                self._idle.append((raw, time.monotonic()))
+            else:
+                self._open -= 1
+                self._discarded += 1
+            self._cond.notify()
+
+        if not healthy:
+            self._forget_statements(raw)
+            try:
+                raw.close()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        with self._cond:
+            idle = len(self._idle)
+            registries = list(self._registries.values())
+            return {
+                "size": self.size,
+                "open": self._open,
+                "in_use": self._open - idle,
+                "idle": idle,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_total_s": self._wait_total,
+                "wait_max_s": self._wait_max,
+                "wait_avg_s": (self._wait_total / self._checkouts) if self._checkouts else 0.0,
+                "reconnects": self._reconnects,
+                "discarded": self._discarded,
+                "prepared_statements": sum(len(r) for r in registries),
+                "prepares": sum(r.prepares for r in registries),
+                "prepared_hits": sum(r.hits for r in registries),
+            }
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for raw, _ in idle:
+            self._forget_statements(raw)
+            try:
+                raw.close()
+            except Exception:
+                pass
+
+
+def init_pool(cfg: Optional[dict] = None) -> ConnectionPool:
+    """
+    Builds the process-wide pool. Called lazily by get_connection(); call it
+    explicitly at startup to parse the config before the first menu action.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(cfg if cfg is not None else get_config())
+        return _pool
+
+
+def reset_pool():
+    """Closes idle pooled connections and forgets the cached config."""
+    global _pool, _config
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = None
+        _config = None
+
+
+def backend() -> str:
+    """Name of the storage backend the pool connects to ('mysql' or 'sqlite')."""
+    pool = _pool if _pool is not None else init_pool()
+    return pool.backend
+
+
+def pool_stats() -> dict:
+    pool = _pool
+    if pool is None:
+        return {}
+    return pool.stats()
+
+
 def get_connection():
-    cfg = load_config()
     try:
-        conn = mysql.connector.connect(
-            host=cfg.get("host", "localhost"),
-            port=cfg.get("port", 3306),
-            user=cfg["user"],
-            password=cfg["password"],
-            database=cfg["database"],
-        )
-        return conn
-    except Error as e:
+        pool = _pool if _pool is not None else init_pool()
+        return pool.acquire()
+    except (Error, sqlite3.Error) as e:
         print(f"[DB ERROR] Failed to connect: {e}")
         return None
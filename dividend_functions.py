@@ -0,0 +1,240 @@
+# dividend_functions.py
+#
+# Dividend income: gross (Quantity * UnitPrice), withholding (Fees) and net
+# per month / quarter / year and per security, for one portfolio or every
+# portfolio a user owns.
+#
+# One grouped query per batch of portfolios reduces the DIVIDEND rows to
+# monthly buckets per (portfolio, security, currency) - a range on
+# idx_trade_portfolio_type_date (migration 4) - and the buckets are cached
+# per portfolio. Quarters, years and per-security totals are folded from the
+# cached buckets in memory, so decades of history cost at most
+# 12 * years * securities rows per portfolio.
+#
+# Code that writes DIVIDEND rows must call invalidate_dividends(portfolio_id)
+# after committing so the next report sees them.
+
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from db import get_connection
+from report_functions import _choose_portfolio, _load_portfolio_name
+from security_cache import security_cache
+
+PERIODS = ("MONTH", "QUARTER", "YEAR")
+IN_LIST_CHUNK = 500
+
+DIVIDEND_BUCKETS_SQL = """
+    SELECT PortfolioID, SecurityID, TradeCurrency,
+           YEAR(TradeDate), MONTH(TradeDate),
+           SUM(Quantity * UnitPrice), SUM(Fees), COUNT(*)
+    FROM trade
+    WHERE PortfolioID IN ({placeholders})
+      AND Type = 'DIVIDEND'
+    GROUP BY PortfolioID, SecurityID, TradeCurrency, YEAR(TradeDate), MONTH(TradeDate)
+"""
+
+# PortfolioID -> [(SecurityID, Currency, Year, Month, Gross, Withholding, Payments)]
+_buckets: Dict[int, List[tuple]] = {}
+_generation = 0       # bumped by every invalidation
+_lock = threading.Lock()
+
+
+def invalidate_dividends(portfolio_id: Optional[int] = None):
+    """Drops cached buckets for one portfolio, or all of them."""
+    global _generation
+    with _lock:
+        _generation += 1
+        if portfolio_id is None:
+            _buckets.clear()
+        else:
+            _buckets.pop(portfolio_id, None)
+
+
+def _load_buckets(portfolio_ids: List[int]) -> Optional[Dict[int, List[tuple]]]:
+    """Cached buckets for portfolio_ids, querying only the missing ones."""
+    with _lock:
+        found = {pid: _buckets[pid] for pid in portfolio_ids if pid in _buckets}
+        generation = _generation
+    missing = [pid for pid in portfolio_ids if pid not in found]
+    if not missing:
+        return found
+
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    loaded: Dict[int, List[tuple]] = {pid: [] for pid in missing}
+    try:
+        cursor = conn.cursor()
+        for i in range(0, len(missing), IN_LIST_CHUNK):
+            chunk = missing[i:i + IN_LIST_CHUNK]
+            sql = DIVIDEND_BUCKETS_SQL.format(placeholders=", ".join(["%s"] * len(chunk)))
+            cursor.execute(sql, tuple(chunk))
+            for pid, sid, curr, year, month, gross, fees, payments in cursor.fetchall():
+                loaded[pid].append((sid, curr, int(year), int(month), float(gross or 0),
+                                    float(fees or 0), int(payments)))
+    except Exception as e:
+        print(f"[ERROR] Failed to load dividends: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+    # a dividend written while we were reading may be missing from loaded
+    with _lock:
+        if generation == _generation:
+            _buckets.update(loaded)
+    found.update(loaded)
+    return found
+
+
+def _period_label(year: int, month: int, period: str) -> str:
+    if period == "MONTH":
+        return f"{year}-{month:02d}"
+    if period == "QUARTER":
+        return f"{year}-Q{(month - 1) // 3 + 1}"
+    return str(year)
+
+
+def _amounts() -> dict:
+    return {"Gross": 0.0, "Withholding": 0.0, "Net": 0.0, "Payments": 0}
+
+
+def _add(target: dict, gross: float, fees: float, payments: int):
+    target["Gross"] += gross
+    target["Withholding"] += fees
+    target["Net"] += gross - fees
+    target["Payments"] += payments
+
+
+def get_dividend_income(
+    portfolio_ids: Iterable[int],
+    period: str = "MONTH",
+    start=None,
+    end=None,
+) -> Optional[dict]:
+    """
+    Dividend income across portfolio_ids grouped by period (MONTH, QUARTER
+    or YEAR) and by security, kept separate per currency. start/end
+    (dates, optional) select whole months. Returns None on failure.
+    """
+    period = period.upper()
+    if period not in PERIODS:
+        print(f"[ERROR] Period must be one of {', '.join(PERIODS)}.")
+        return None
+
+    portfolio_ids = sorted(set(portfolio_ids))
+    buckets = _load_buckets(portfolio_ids)
+    if buckets is None:
+        return None
+
+    lo = (start.year, start.month) if start is not None else None
+    hi = (end.year, end.month) if end is not None else None
+
+    periods: Dict[tuple, dict] = {}
+    securities: Dict[tuple, dict] = {}
+    totals: Dict[str, dict] = {}
+    for pid in portfolio_ids:
+        for sid, curr, year, month, gross, fees, payments in buckets[pid]:
+            if (lo is not None and (year, month) < lo) or (hi is not None and (year, month) > hi):
+                continue
+            _add(periods.setdefault((_period_label(year, month, period), curr), _amounts()), gross, fees, payments)
+            _add(securities.setdefault((sid, curr), _amounts()), gross, fees, payments)
+            _add(totals.setdefault(curr, _amounts()), gross, fees, payments)
+
+    info = security_cache().get_many(sid for sid, _ in securities)
+    return {
+        "PortfolioIDs": portfolio_ids,
+        "Period": period,
+        "Periods": [
+            {"Period": label, "Currency": curr, **amounts}
+            for (label, curr), amounts in sorted(periods.items())
+        ],
+        "Securities": sorted(
+            (
+                {"SecurityID": sid, "Ticker": info[sid].ticker if sid in info else str(sid),
+                 "Currency": curr, **amounts}
+                for (sid, curr), amounts in securities.items()
+            ),
+            key=lambda e: -e["Net"],
+        ),
+        "Totals": [{"Currency": curr, **amounts} for curr, amounts in sorted(totals.items())],
+    }
+
+
+def get_user_dividend_income(
+    user_id: int,
+    account_id: Optional[int] = None,
+    period: str = "MONTH",
+    start=None,
+    end=None,
+) -> Optional[dict]:
+    """get_dividend_income over every portfolio the user owns (optionally one AccountID's)."""
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    try:
+        cursor = conn.cursor()
+        sql = "SELECT PortfolioID FROM portfolio WHERE OwnerUserID = %s"
+        params = [user_id]
+        if account_id is not None:
+            sql += " AND ManagedByAccountID = %s"
+            params.append(account_id)
+        cursor.execute(sql, tuple(params))
+        portfolio_ids = [r[0] for r in cursor.fetchall()]
+    except Exception as e:
+        print(f"[ERROR] Failed to list portfolios: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+    result = get_dividend_income(portfolio_ids, period, start, end)
+    if result is not None:
+        result["UserID"] = user_id
+    return result
+
+
+def dividend_income_report(current_user_id: int):
+    print("\n=== Dividend Income ===")
+    scope = input("Report on one portfolio (P) or all your portfolios (A)? [P/A]: ").strip().upper()
+    period = input("Group by MONTH, QUARTER or YEAR (blank = YEAR): ").strip().upper() or "YEAR"
+
+    if scope == "A":
+        result = get_user_dividend_income(current_user_id, period=period)
+        title = "all portfolios"
+    else:
+        portfolio_id = _choose_portfolio(current_user_id)
+        if portfolio_id is None:
+            return
+        result = get_dividend_income([portfolio_id], period)
+        title = f"{_load_portfolio_name(portfolio_id)} (ID={portfolio_id})"
+    if result is None:
+        return
+
+    if not result["Totals"]:
+        print("\nNo dividends recorded yet.")
+        return
+
+    print(f"\n=== Dividend income by {result['Period'].lower()} for {title} ===")
+    print(f"{'Period':<10} {'Curr':<5} {'Gross':>14} {'Withholding':>14} {'Net':>14} {'Payments':>9}")
+    print("-" * 70)
+    for p in result["Periods"]:
+        print(f"{p['Period']:<10} {p['Currency']:<5} {p['Gross']:>14,.2f} {p['Withholding']:>14,.2f} "
+              f"{p['Net']:>14,.2f} {p['Payments']:>9}")
+
+    print("\nBy security:")
+    print(f"{'Ticker':<10} {'Curr':<5} {'Gross':>14} {'Withholding':>14} {'Net':>14} {'Payments':>9}")
+    print("-" * 70)
+    for s in result["Securities"]:
+        print(f"{s['Ticker']:<10} {s['Currency']:<5} {s['Gross']:>14,.2f} {s['Withholding']:>14,.2f} "
+              f"{s['Net']:>14,.2f} {s['Payments']:>9}")
+
+    print("-" * 70)
+    for t in result["Totals"]:
+        print(f"{'Total':<10} {t['Currency']:<5} {t['Gross']:>14,.2f} {t['Withholding']:>14,.2f} "
+              f"{t['Net']:>14,.2f} {t['Payments']:>9}")
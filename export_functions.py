@@ -0,0 +1,414 @@
+# export_functions.py
+#
+# Columnar export of trade, price_snapshot, holding and security to Parquet
+# for notebook work, so analysts read files instead of scanning portfolio_db.
+#
+#     <export_dir>/security/part-<run>.parquet
+#     <export_dir>/holding/part-<run>.parquet
+#     <export_dir>/trade/PortfolioID=<id>/part-<run>.parquet
+#     <export_dir>/price_snapshot/SecurityID=<id>/Year=<yyyy>/part-<run>.parquet
+#
+# The directories use hive-style key=value names and, as usual for that
+# layout, the partition columns live only in the path:
+# pyarrow.dataset / pandas.read_parquet(<export_dir>/trade) add them back.
+#
+# security and holding are small current-state tables and are rewritten on
+# every run. trade and price_snapshot are exported incrementally, and the
+# state of each run is kept in <export_dir>/_export_state.json. It only
+# advances once every file of the run is in place.
+#
+# * trade is append-only. Each run writes one new part file per touched
+#   PortfolioID with the rows above the previous run's TransactionID
+#   high-water mark. AUTO_INCREMENT ids can commit out of order: a lower
+#   id still in flight when the mark is read commits after it. So the
+#   state also keeps the ids in the TRADE_LOOKBACK ids below the mark that
+#   were not seen yet ("gaps"), and the next run exports any of them that
+#   have since appeared. Edited or deleted trades need full=True.
+# * price_snapshot is not append-only. Bars are upserted in place, and
+#   rolled-up bars are stamped behind the minute bars already exported.
+#   Every price write bumps the Version of its (SecurityID, year) in
+#   price_snapshot_change (migration 7). A run rewrites each partition
+#   whose Version differs from the one recorded at the last export, and
+#   then removes that partition's older part files.
+#
+# Rows are streamed with fetchmany() on an unbuffered cursor (results stay
+# on the server) and written out in row groups of ROW_GROUP rows, so
+# memory stays bounded regardless of table size.
+#
+# pyarrow is optional: pip install pyarrow
+
+import json
+import os
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from db import get_config, get_connection
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pq = None
+
+DEFAULT_EXPORT_DIR = "export"
+STATE_FILE = "_export_state.json"
+FETCH_CHUNK = 50_000
+ROW_GROUP = 100_000
+TRADE_LOOKBACK = 10_000      # ids below the trade high-water mark re-checked for late commits
+TABLES = ("security", "holding", "trade", "price_snapshot")
+PARTITION_COLUMNS = {"trade": ("PortfolioID",), "price_snapshot": ("SecurityID",)}
+
+# column -> kind; kinds map to Arrow types in _arrow_type()
+COLUMNS: Dict[str, List[tuple]] = {
+    "security": [
+        ("SecurityID", "int"), ("Ticker", "str"), ("Exchange", "str"), ("Currency", "str"),
+        ("SecType", "str"), ("Sector", "str"), ("Industry", "str"),
+    ],
+    "holding": [
+        ("PortfolioID", "int"), ("SecurityID", "int"), ("BuyQty", "decimal"), ("SellQty", "decimal"),
+        ("NetQty", "decimal"), ("TotalBuyCost", "decimal"), ("AvgCostBasis", "decimal"),
+    ],
+    "trade": [
+        ("TransactionID", "int"), ("PortfolioID", "int"), ("SecurityID", "int"), ("Type", "str"),
+        ("TradeDate", "date"), ("SettleDate", "date"), ("Quantity", "decimal"), ("UnitPrice", "decimal"),
+        ("Fees", "decimal"), ("TradeCurrency", "str"), ("Notes", "str"),
+    ],
+    "price_snapshot": [
+        ("SecurityID", "int"), ("SnapshotTime", "datetime"), ("OpenPrice", "decimal"),
+        ("HighPrice", "decimal"), ("LowPrice", "decimal"), ("ClosePrice", "decimal"),
+        ("Volume", "int"), ("Source", "str"), ("IntervalCode", "str"),
+    ],
+}
+
+
+def export_dir() -> str:
+    return get_config().get("export_dir", DEFAULT_EXPORT_DIR)
+
+
+def _arrow_type(kind: str):
+    return {
+        "int": pa.int64(),
+        "str": pa.string(),
+        "decimal": pa.decimal128(18, 4),
+        "date": pa.date32(),
+        "datetime": pa.timestamp("s"),
+    }[kind]
+
+
+def _schema(table: str, exclude: Iterable[str] = ()):
+    return pa.schema([(name, _arrow_type(kind)) for name, kind in COLUMNS[table] if name not in exclude])
+
+
+def _select_list(table: str) -> str:
+    return ", ".join(name for name, _ in COLUMNS[table])
+
+
+def _as_decimal(value):
+    # mysql.connector returns Decimal; SQLite hands back int/float
+    if value is None or isinstance(value, Decimal):
+        return value
+    return Decimal(str(value)).quantize(Decimal("0.0001"))
+
+
+# ---------- STATE ----------
+
+def load_state(directory: Optional[str] = None) -> dict:
+    """
+    table -> {"high_water": ..., "exported_at": ..., "rows": ...}; for
+    price_snapshot also "partitions": {"<SecurityID>:<year>": Version}.
+    """
+    path = os.path.join(directory or export_dir(), STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_state(directory: str, state: dict):
+    path = os.path.join(directory, STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True, default=str)
+    os.replace(tmp, path)
+
+
+# ---------- WRITING ----------
+
+class PartitionWriter:
+    """
+    Writes the rows of one table into one part file per partition. Rows
+    must arrive grouped by partition: a new partition closes the previous
+    file, so only one file and at most ROW_GROUP buffered rows are open.
+    Files are written as .tmp and renamed on close; discard() removes
+    everything this writer produced. partition_columns are left out of
+    the files (they are in the directory names).
+    """
+
+    def __init__(self, root: str, table: str, run_id: str, partition_columns: Iterable[str] = ()):
+        self.root = root
+        self.table = table
+        self.run_id = run_id
+        self.schema = _schema(table, partition_columns)
+        self._keep = [i for i, (name, _) in enumerate(COLUMNS[table]) if name not in partition_columns]
+        self.kinds = [COLUMNS[table][i][1] for i in self._keep]
+        self.files: List[str] = []
+        self.rows = 0
+        self._partition = None
+        self._writer = None
+        self._tmp = None
+        self._buffer: List[tuple] = []
+
+    def write(self, partition: tuple, rows: Iterable[tuple]):
+        if partition != self._partition:
+            self._close_file()
+            self._partition = partition
+        self._buffer.extend(rows)
+        if len(self._buffer) >= ROW_GROUP:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        columns = list(zip(*self._buffer))
+        arrays = []
+        for i, kind, field in zip(self._keep, self.kinds, self.schema):
+            values = columns[i]
+            if kind == "decimal":
+                values = [_as_decimal(v) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        batch = pa.record_batch(arrays, schema=self.schema)
+
+        if self._writer is None:
+            directory = os.path.join(self.root, *(f"{k}={v}" for k, v in self._partition))
+            os.makedirs(directory, exist_ok=True)
+            self._tmp = os.path.join(directory, f"part-{self.run_id}.parquet.tmp")
+            self._writer = pq.ParquetWriter(self._tmp, self.schema, compression="zstd")
+        self._writer.write_batch(batch)
+        self.rows += len(self._buffer)
+        self._buffer = []
+
+    def _close_file(self):
+        self._flush()
+        if self._writer is None:
+            return
+        self._writer.close()
+        final = self._tmp[:-len(".tmp")]
+        os.replace(self._tmp, final)
+        self.files.append(final)
+        self._writer = self._tmp = None
+
+    def close(self):
+        self._close_file()
+        self._partition = None
+
+    def discard(self):
+        if self._writer is not None:
+            self._writer.close()
+            os.remove(self._tmp)
+            self._writer = self._tmp = None
+        for path in self.files:
+            if os.path.exists(path):
+                os.remove(path)
+        self.files = []
+        self._buffer = []
+
+
+def _stream(cursor, sql: str, params: tuple = ()):
+    cursor.execute(sql, params)
+    while True:
+        chunk = cursor.fetchmany(FETCH_CHUNK)
+        if not chunk:
+            break
+        yield chunk
+
+
+# ---------- TABLES ----------
+
+def _export_snapshot_table(cursor, writer: PartitionWriter, key: str):
+    """security / holding: the whole table into one file, replacing the old one."""
+    table = writer.table
+    for chunk in _stream(cursor, f"SELECT {_select_list(table)} FROM {table} ORDER BY {key}"):
+        writer.write((), chunk)
+    writer.close()
+
+
+def _export_trades(cursor, writer: PartitionWriter, after: Optional[int], upto: int,
+                   gaps: Iterable[int] = ()) -> List[int]:
+    """
+    Rows with after < TransactionID <= upto, plus the ids in gaps (unseen
+    ids below after) that exist now. Returns the new gaps: ids within
+    TRADE_LOOKBACK of upto that are still missing.
+    """
+    gaps = set(gaps)
+    lower = min(gaps, default=after) - 1 if gaps else after
+    sql = f"SELECT {_select_list('trade')} FROM trade WHERE TransactionID <= %s"
+    params = [upto]
+    if lower is not None:
+        sql += " AND TransactionID > %s"
+        params.append(lower)
+    sql += " ORDER BY PortfolioID, TransactionID"
+
+    window = upto - TRADE_LOOKBACK
+    seen = set()
+    for chunk in _stream(cursor, sql, tuple(params)):
+        if lower != after:
+            chunk = [r for r in chunk if after is None or r[0] > after or r[0] in gaps]
+        seen.update(r[0] for r in chunk if r[0] > window)
+        start = 0
+        for i in range(1, len(chunk) + 1):
+            if i == len(chunk) or chunk[i][1] != chunk[start][1]:
+                writer.write((("PortfolioID", chunk[start][1]),), chunk[start:i])
+                start = i
+    writer.close()
+
+    fresh = range(max(window, after if after is not None else 0) + 1, upto + 1)
+    missing = {g for g in gaps if g > window} | {i for i in fresh if i not in seen}
+    return sorted(missing - seen)
+
+
+def _price_partitions(cursor) -> Dict[str, int]:
+    cursor.execute("SELECT SecurityID, SnapshotYear, Version FROM price_snapshot_change")
+    return {f"{sid}:{year}": int(version) for sid, year, version in cursor.fetchall()}
+
+
+def _price_partition_dir(root: str, key: str) -> str:
+    sid, year = key.split(":")
+    return os.path.join(root, f"SecurityID={sid}", f"Year={year}")
+
+
+def _export_prices(cursor, writer: PartitionWriter, keys: List[str]):
+    """Each (SecurityID, year) in full: one range query on idx_price_security_time."""
+    sql = f"""
+        SELECT {_select_list('price_snapshot')}
+        FROM price_snapshot
+        WHERE SecurityID = %s
+          AND SnapshotTime >= %s
+          AND SnapshotTime < %s
+        ORDER BY SnapshotTime
+    """
+    for key in keys:
+        sid, year = (int(v) for v in key.split(":"))
+        partition = (("SecurityID", sid), ("Year", year))
+        for chunk in _stream(cursor, sql, (sid, datetime(year, 1, 1), datetime(year + 1, 1, 1))):
+            writer.write(partition, chunk)
+        writer.close()
+
+
+def _max(cursor, sql: str):
+    cursor.execute(sql)
+    return cursor.fetchall()[0][0]
+
+
+def _remove_old_parts(root: str, keep: List[str]):
+    keep = set(keep)
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if path not in keep:
+                os.remove(path)
+
+
+def export_tables(
+    tables: Optional[Iterable[str]] = None,
+    full: bool = False,
+    directory: Optional[str] = None,
+    verbose: bool = True,
+) -> Optional[dict]:
+    """
+    Exports the given tables (default: all four) to Parquet under
+    directory (default: export_dir from db_config.json). trade and
+    price_snapshot are incremental unless full=True, which rewrites them.
+    Returns {table: {"rows", "files", "high_water"}} or None on failure.
+    """
+    if pa is None:
+        print("[ERROR] Parquet export needs pyarrow (pip install pyarrow).")
+        return None
+
+    tables = list(tables or TABLES)
+    unknown = [t for t in tables if t not in TABLES]
+    if unknown:
+        print(f"[ERROR] Unknown table(s): {', '.join(unknown)}. Expected: {', '.join(TABLES)}.")
+        return None
+
+    directory = directory or export_dir()
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    os.makedirs(directory, exist_ok=True)
+    state = load_state(directory)
+    run_id = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    result = {}
+    writers: List[PartitionWriter] = []
+    start = time.perf_counter()
+
+    try:
+        cursor = conn.cursor()
+        for table in tables:
+            root = os.path.join(directory, table)
+            previous_state = {} if full else state.get(table, {})
+            previous = previous_state.get("high_water")
+            writer = PartitionWriter(root, table, run_id, PARTITION_COLUMNS.get(table, ()))
+            writers.append(writer)
+
+            if table in ("security", "holding"):
+                key = "SecurityID" if table == "security" else "PortfolioID, SecurityID"
+                _export_snapshot_table(cursor, writer, key)
+                high_water = None
+            elif table == "trade":
+                high_water = _max(cursor, "SELECT MAX(TransactionID) FROM trade")
+                gaps = previous_state.get("gaps", [])
+                if high_water is not None and (previous is None or high_water > previous or gaps):
+                    gaps = _export_trades(cursor, writer, previous, max(high_water, previous or 0), gaps)
+                high_water = max(high_water or 0, previous or 0) or None
+            else:
+                partitions = _price_partitions(cursor)
+                exported = previous_state.get("partitions", {})
+                changed = sorted((k for k, v in partitions.items() if exported.get(k) != v),
+                                 key=lambda k: tuple(int(v) for v in k.split(":")))
+                _export_prices(cursor, writer, changed)
+                high_water = None
+
+            result[table] = {"rows": writer.rows, "files": len(writer.files), "high_water": high_water}
+            if table == "price_snapshot":
+                result[table]["partitions"] = len(changed)
+            if verbose:
+                print(f"  {table:<15} {writer.rows:>12,} row(s) in {len(writer.files):,} file(s)")
+
+        # everything is on disk: drop superseded files and advance the marks
+        for table, writer in zip(tables, writers):
+            root = os.path.join(directory, table)
+            if table in ("security", "holding") or full:
+                _remove_old_parts(root, writer.files)
+            elif table == "price_snapshot":
+                for key in changed:
+                    _remove_old_parts(_price_partition_dir(root, key), writer.files)
+            state[table] = {
+                "high_water": result[table]["high_water"],
+                "exported_at": datetime.now().isoformat(timespec="seconds"),
+                "rows": result[table]["rows"],
+            }
+            if table == "trade":
+                state[table]["gaps"] = gaps
+            if table == "price_snapshot":
+                state[table]["partitions"] = partitions
+        _save_state(directory, state)
+
+    except Exception as e:
+        print(f"[ERROR] Export failed: {e}")
+        for writer in writers:
+            writer.discard()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+    result["seconds"] = time.perf_counter() - start
+    if verbose:
+        print(f"✅ Export finished in {result['seconds']:.1f}s ({directory}).")
+    return result
+
+
@@ -0,0 +1,209 @@
+# exposure_functions.py
+#
+# Market-value exposure of a portfolio (or every portfolio a user owns)
+# broken down by tag, sector, industry and SecType.
+#
+# Positions are valued with the same two set-based queries as consolidated
+# valuation and converted into one currency in a single FX pass. Security
+# attributes come from the security cache and tag filters from the
+# inverted tag index (tag_functions), so the breakdowns are pure in-memory
+# work: each dimension is one np.unique + np.bincount over the position
+# arrays, whatever the number of positions.
+#
+# A security with several tags counts in full under each of them, so the
+# tag weights can add up to more than 100%.
+
+from collections import Counter
+from datetime import date
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from db import get_connection
+from fx_functions import fx_rates, missing_pairs
+from report_functions import _choose_portfolio, _load_portfolio_name, _value_portfolio_chunk
+from security_cache import security_cache
+from tag_functions import tag_index
+
+IN_LIST_CHUNK = 500
+DIMENSIONS = ("Tag", "Sector", "Industry", "SecType")
+NO_VALUE = "(none)"
+
+
+def _breakdown(labels: list, position_idx: np.ndarray, mv: np.ndarray, total: float) -> List[dict]:
+    """Sums mv[position_idx] per label; labels[i] belongs to position_idx[i]."""
+    if not labels:
+        return []
+    names, codes = np.unique(np.array(labels, dtype=object), return_inverse=True)
+    values = np.bincount(codes, weights=mv[position_idx], minlength=len(names))
+    counts = np.bincount(codes, minlength=len(names))
+    out = [
+        {"Name": name, "MarketValue": float(value),
+         "Weight": float(value / total * 100.0) if total else 0.0, "Positions": int(n)}
+        for name, value, n in zip(names, values, counts)
+    ]
+    return sorted(out, key=lambda e: e["MarketValue"], reverse=True)
+
+
+def get_exposure(
+    portfolio_ids: Iterable[int],
+    all_tags: Iterable[str] = (),
+    any_tags: Iterable[str] = (),
+    exclude_tags: Iterable[str] = (),
+    currency: Optional[str] = None,
+    interval_code: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    Exposure of the open positions in portfolio_ids by tag, sector,
+    industry and SecType, in `currency` (default the BaseCurrency most of
+    the portfolios share). Tag filters keep positions carrying all of
+    all_tags, at least one of any_tags and none of exclude_tags; weights
+    are relative to the unfiltered market value. Returns None on failure.
+    """
+    portfolio_ids = sorted(set(portfolio_ids))
+    all_tags, any_tags, exclude_tags = list(all_tags), list(any_tags), list(exclude_tags)
+
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    bases = Counter()
+    try:
+        cursor = conn.cursor()
+        for i in range(0, len(portfolio_ids), IN_LIST_CHUNK):
+            chunk = portfolio_ids[i:i + IN_LIST_CHUNK]
+            cursor.execute(
+                f"SELECT BaseCurrency FROM portfolio WHERE PortfolioID IN ({', '.join(['%s'] * len(chunk))})",
+                tuple(chunk)
+            )
+            bases.update(row[0] for row in cursor.fetchall())
+    except Exception as e:
+        print(f"[ERROR] Failed to load portfolios: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+    currency = (currency or (bases.most_common(1)[0][0] if bases else "USD")).upper()
+
+    try:
+        positions = []
+        for i in range(0, len(portfolio_ids), IN_LIST_CHUNK):
+            chunk, _lots = _value_portfolio_chunk(portfolio_ids[i:i + IN_LIST_CHUNK], interval_code, with_costs=False)
+            positions.extend(chunk)
+
+        info = security_cache().get_many({row[1] for row in positions})
+        filtered = all_tags or any_tags or exclude_tags
+        selected = (tag_index().match(all_tags, any_tags, exclude_tags, within=info.keys())
+                    if filtered else None)
+    except Exception as e:
+        print(f"[ERROR] Failed to compute exposure: {e}")
+        return None
+
+    positions = [row for row in positions if row[1] in info]
+    currencies = [info[row[1]].currency for row in positions]
+    today = date.today()
+    rates = fx_rates().rates_to(currencies, currency, [row[6] or today for row in positions])
+    local_mv = np.array([row[3] * row[5] if row[5] is not None else 0.0 for row in positions])
+    mv = np.nan_to_num(local_mv * rates)
+    portfolio_mv = float(mv.sum())
+
+    keep = [i for i, row in enumerate(positions) if selected is None or row[1] in selected]
+    keep_idx = np.array(keep, dtype=np.int64)
+    total = float(mv[keep_idx].sum())
+
+    tag_labels, tag_idx = [], []
+    for i in keep:
+        tags = info[positions[i][1]].tags or (NO_VALUE,)
+        tag_labels.extend(tags)
+        tag_idx.extend([i] * len(tags))
+
+    def labels(field):
+        return [getattr(info[positions[i][1]], field) or NO_VALUE for i in keep]
+
+    return {
+        "PortfolioIDs": portfolio_ids,
+        "Currency": currency,
+        "Filter": {"AllTags": all_tags, "AnyTags": any_tags, "ExcludeTags": exclude_tags},
+        "PortfolioMarketValue": portfolio_mv,
+        "TotalMarketValue": total,
+        "Weight": total / portfolio_mv * 100.0 if portfolio_mv else 0.0,
+        "Positions": len(keep),
+        "MissingFx": missing_pairs(currencies, currency, rates),
+        "ByTag": _breakdown(tag_labels, np.array(tag_idx, dtype=np.int64), mv, portfolio_mv),
+        "BySector": _breakdown(labels("sector"), keep_idx, mv, portfolio_mv),
+        "ByIndustry": _breakdown(labels("industry"), keep_idx, mv, portfolio_mv),
+        "BySecType": _breakdown(labels("sec_type"), keep_idx, mv, portfolio_mv),
+    }
+
+
+def get_user_exposure(user_id: int, account_id: Optional[int] = None, **kwargs) -> Optional[dict]:
+    """get_exposure over every portfolio the user owns (optionally one AccountID's)."""
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    try:
+        cursor = conn.cursor()
+        sql = "SELECT PortfolioID FROM portfolio WHERE OwnerUserID = %s"
+        params = [user_id]
+        if account_id is not None:
+            sql += " AND ManagedByAccountID = %s"
+            params.append(account_id)
+        cursor.execute(sql, tuple(params))
+        portfolio_ids = [r[0] for r in cursor.fetchall()]
+    except Exception as e:
+        print(f"[ERROR] Failed to list portfolios: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+    result = get_exposure(portfolio_ids, **kwargs)
+    if result is not None:
+        result["UserID"] = user_id
+    return result
+
+
+def _tag_list(prompt: str) -> List[str]:
+    return [t.strip() for t in input(prompt).split(",") if t.strip()]
+
+
+def exposure_report(current_user_id: int):
+    print("\n=== Exposure by Tag / Sector / Industry / Type ===")
+    scope = input("Report on one portfolio (P) or all your portfolios (A)? [P/A]: ").strip().upper()
+    all_tags = _tag_list("Only securities with ALL of these tags (comma-separated, blank = no filter): ")
+    any_tags = _tag_list("... and ANY of these tags (blank = no filter): ")
+    exclude_tags = _tag_list("... and NONE of these tags (blank = no filter): ")
+    filters = dict(all_tags=all_tags, any_tags=any_tags, exclude_tags=exclude_tags)
+
+    if scope == "A":
+        result = get_user_exposure(current_user_id, **filters)
+        title = "all portfolios"
+    else:
+        portfolio_id = _choose_portfolio(current_user_id)
+        if portfolio_id is None:
+            return
+        result = get_exposure([portfolio_id], **filters)
+        title = f"{_load_portfolio_name(portfolio_id)} (ID={portfolio_id})"
+    if result is None:
+        return
+
+    if not result["Positions"]:
+        print("\nNo open positions match.")
+        return
+
+    curr = result["Currency"]
+    print(f"\n=== Exposure for {title} ({curr}) ===")
+    print(f"Selected market value : {result['TotalMarketValue']:,.2f} of {result['PortfolioMarketValue']:,.2f} "
+          f"({result['Weight']:.2f}%) in {result['Positions']} position(s)")
+    for dimension in DIMENSIONS:
+        print(f"\nBy {dimension.lower()}:")
+        print(f"{'Name':<30} {'Pos':>5} {'MktValue':>16} {'Weight':>8}")
+        print("-" * 62)
+        for e in result["By" + dimension]:
+            print(f"{str(e['Name'])[:30]:<30} {e['Positions']:>5} {e['MarketValue']:>16,.2f} {e['Weight']:>7.2f}%")
+    if result["MissingFx"]:
+        print(f"\n[WARN] No FX rate for {', '.join(result['MissingFx'])}; those positions count as 0.")
@@ -0,0 +1,308 @@
+# fx_functions.py
+#
+# Foreign-exchange rates and currency conversion.
+#
+# fx_rate (migration 6) holds one rate per (FromCurrency, ToCurrency,
+# RateDate): 1 FromCurrency = Rate ToCurrency. The whole table is loaded
+# once per process into a date-indexed cache - per currency pair a sorted
+# datetime64[D] array of rate dates and a parallel float64 array of rates -
+# so a valuation never queries rates row by row.
+#
+# Lookups are as-of: the rate for day d is the latest rate dated on or
+# before d, found with np.searchsorted over the pair's dates for a whole
+# array of days at once (NaN before the pair's first rate). A pair that is
+# not stored is served from its inverse (1 / rate) or crossed through the
+# pivot currency (db_config.json "fx_pivot", default USD).
+#
+# Code that writes to fx_rate must call invalidate_fx() after committing.
+
+import csv
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from db import get_config, get_connection
+
+DEFAULT_PIVOT = "USD"
+DEFAULT_BATCH_SIZE = 5000
+
+UPSERT_FX_SQL = """
+    INSERT INTO fx_rate (FromCurrency, ToCurrency, RateDate, Rate, Source)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        Rate   = VALUES(Rate),
+        Source = VALUES(Source)
+"""
+
+# Accepted CSV header spellings (case-insensitive)
+_CSV_COLUMNS = {
+    "from": ("from", "fromcurrency", "base"),
+    "to": ("to", "tocurrency", "quote"),
+    "date": ("date", "ratedate"),
+    "rate": ("rate",),
+    "source": ("source",),
+}
+
+# (FromCurrency, ToCurrency) -> (dates datetime64[D], rates float64)
+RateSeries = Tuple[np.ndarray, np.ndarray]
+
+
+def _as_days(days) -> np.ndarray:
+    """date / datetime / datetime64, or a sequence of them, as datetime64[D]."""
+    if isinstance(days, (date, np.datetime64)):
+        return np.array([np.datetime64(days, "D")])
+    if isinstance(days, np.ndarray):
+        return days.astype("datetime64[D]")
+    return np.array([np.datetime64(d, "D") for d in days], dtype="datetime64[D]")
+
+
+class FxRates:
+
+    def __init__(self, pivot: str = DEFAULT_PIVOT):
+        self.pivot = pivot.upper()
+        self._lock = threading.Lock()
+        self._series: Optional[Dict[Tuple[str, str], RateSeries]] = None
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """Bumped by every invalidation; lets callers tell converted results are stale."""
+        return self._generation
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._series = None
+
+    def _load(self) -> Dict[Tuple[str, str], RateSeries]:
+        with self._lock:
+            if self._series is not None:
+                return self._series
+            generation = self._generation
+
+        conn = get_connection()
+        if conn is None:
+            print("[ERROR] Could not connect to database.")
+            return {}
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT FromCurrency, ToCurrency, RateDate, Rate
+                FROM fx_rate
+                ORDER BY FromCurrency, ToCurrency, RateDate
+                """
+            )
+            rows = cursor.fetchall()
+        except Exception as e:
+            print(f"[ERROR] Failed to load FX rates: {e}")
+            return {}
+        finally:
+            cursor.close()
+            conn.close()
+
+        series: Dict[Tuple[str, str], RateSeries] = {}
+        start = 0
+        for i in range(1, len(rows) + 1):
+            if i == len(rows) or rows[i][:2] != rows[start][:2]:
+                pair = rows[start:i]
+                series[(pair[0][0], pair[0][1])] = (
+                    np.array([r[2] for r in pair], dtype="datetime64[D]"),
+                    np.fromiter((float(r[3]) for r in pair), dtype=np.float64, count=len(pair)),
+                )
+                start = i
+
+        # a rate written while we were reading may be missing from series
+        with self._lock:
+            if generation == self._generation:
+                self._series = series
+        return series
+
+    @staticmethod
+    def _as_of(pair: RateSeries, days: np.ndarray) -> np.ndarray:
+        dates, rates = pair
+        idx = np.searchsorted(dates, days, side="right") - 1
+        return np.where(idx >= 0, rates[np.maximum(idx, 0)], np.nan)
+
+    def _stored(self, series, src: str, dst: str, days: np.ndarray) -> Optional[np.ndarray]:
+        if (src, dst) in series:
+            return self._as_of(series[(src, dst)], days)
+        if (dst, src) in series:
+            return 1.0 / self._as_of(series[(dst, src)], days)
+        return None
+
+    def rates(self, src: str, dst: str, days) -> np.ndarray:
+        """
+        Rate from src to dst in force on each of days (as-of lookup), NaN
+        where no rate is known yet. Same-currency pairs are 1 without
+        touching the table.
+        """
+        days = _as_days(days)
+        if src == dst:
+            return np.ones(len(days))
+        return self._lookup(self._load(), src, dst, days)
+
+    def _lookup(self, series, src: str, dst: str, days: np.ndarray) -> np.ndarray:
+        out = self._stored(series, src, dst, days)
+        if out is None and self.pivot not in (src, dst):
+            leg1 = self._stored(series, src, self.pivot, days)
+            leg2 = self._stored(series, self.pivot, dst, days)
+            if leg1 is not None and leg2 is not None:
+                out = leg1 * leg2
+        return out if out is not None else np.full(len(days), np.nan)
+
+    def rates_to(self, currencies: Sequence[str], dst: str, days) -> np.ndarray:
+        """
+        Per-element rate into dst for parallel arrays of currencies and
+        days (or one day for all), one as-of lookup per distinct currency.
+        """
+        currencies = np.asarray(currencies, dtype=object)
+        days = _as_days(days)
+        if len(days) == 1 and len(currencies) != 1:
+            days = np.repeat(days, len(currencies))
+
+        out = np.ones(len(currencies))
+        foreign = set(currencies.tolist()) - {dst}
+        if foreign:
+            series = self._load()
+            for curr in foreign:
+                mask = currencies == curr
+                out[mask] = self._lookup(series, curr, dst, days[mask])
+        return out
+
+
+_fx = None
+_fx_lock = threading.Lock()
+
+
+def fx_rates() -> FxRates:
+    global _fx
+    if _fx is None:
+        with _fx_lock:
+            if _fx is None:
+                _fx = FxRates(get_config().get("fx_pivot", DEFAULT_PIVOT))
+    return _fx
+
+
+def invalidate_fx():
+    """Drops the cached rate table; the next lookup reloads it."""
+    fx_rates().invalidate()
+
+
+def convert(amounts, currencies: Sequence[str], to_currency: str, days) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts parallel arrays of amounts in currencies into to_currency at
+    the as-of rate for days (one per amount, or one for all).
+    Returns (converted, rates); both are NaN where no rate is known.
+    """
+    rates = fx_rates().rates_to(currencies, to_currency, days)
+    return np.asarray(amounts, dtype=np.float64) * rates, rates
+
+
+def missing_pairs(currencies: Sequence[str], to_currency: str, rates: np.ndarray) -> List[str]:
+    """'EUR/USD' labels for the currencies whose rate came back NaN."""
+    return sorted({f"{c}/{to_currency}" for c, r in zip(currencies, rates) if np.isnan(r)})
+
+
+# ---------- WRITES ----------
+
+def _parse_rate_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value.strip()[:10], "%Y-%m-%d").date()
+
+
+def _fx_row(row, source: str) -> tuple:
+    """One (From, To, Date, Rate[, Source]) row normalized for UPSERT_FX_SQL; ValueError if invalid."""
+    src, dst, rate_date, rate = row[:4]
+    src, dst, rate = src.strip().upper(), dst.strip().upper(), float(rate)
+    if len(src) != 3 or len(dst) != 3 or src == dst or rate <= 0:
+        raise ValueError(f"invalid rate {src}/{dst} = {rate}")
+    return (src, dst, _parse_rate_date(rate_date), rate, (row[4] if len(row) > 4 else None) or source)
+
+
+def save_fx_rates(rows: Iterable[tuple], source: str = "Manual",
+                  batch_size: int = DEFAULT_BATCH_SIZE) -> Optional[int]:
+    """
+    Upserts (FromCurrency, ToCurrency, RateDate, Rate[, Source]) rows in
+    batches. Returns the number of rows written, or None on failure.
+    """
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    written = 0
+    try:
+        cursor = conn.cursor()
+        batch = []
+        for row in rows:
+            batch.append(_fx_row(row, source))
+            if len(batch) >= batch_size:
+                cursor.executemany(UPSERT_FX_SQL, batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(UPSERT_FX_SQL, batch)
+            written += len(batch)
+        conn.commit()
+        return written
+
+    except Exception as e:
+        print(f"[ERROR] Failed to save FX rates: {e}")
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+        invalidate_fx()
+
+
+def save_fx_rate(from_currency: str, to_currency: str, rate_date, rate: float,
+                 source: str = "Manual") -> bool:
+    return save_fx_rates([(from_currency, to_currency, rate_date, rate)], source) is not None
+
+
+def import_fx_csv(path: str, source: str = "CSV") -> Optional[int]:
+    """
+    Imports a CSV of From, To, Date, Rate[, Source] rows (header names as in
+    _CSV_COLUMNS, any order). Short or malformed rows are skipped and
+    counted; the rest are written in one transaction.
+    """
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            header = [h.strip().lower() for h in next(reader, [])]
+            cols = {}
+            for field, names in _CSV_COLUMNS.items():
+                cols[field] = next((header.index(n) for n in names if n in header), None)
+            missing = [field for field in ("from", "to", "date", "rate") if cols[field] is None]
+            if missing:
+                print(f"[ERROR] CSV is missing column(s): {', '.join(missing)}")
+                return None
+            i_source = cols["source"]
+            rows = []
+            rejected = 0
+            for r in reader:
+                if not r:
+                    continue
+                try:
+                    rows.append(_fx_row(
+                        (r[cols["from"]], r[cols["to"]], r[cols["date"]], r[cols["rate"]],
+                         r[i_source].strip() if i_source is not None else None),
+                        source,
+                    ))
+                except (IndexError, ValueError):
+                    rejected += 1
+    except OSError as e:
+        print(f"[ERROR] Could not read {path}: {e}")
+        return None
+
+    if rejected:
+        print(f"[WARN] {rejected:,} malformed row(s) skipped.")
+    return save_fx_rates(rows, source)
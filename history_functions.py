@@ -0,0 +1,329 @@
+# history_functions.py
+#
+# Portfolio value over time.
+#
+# For a date window the engine builds two (days x securities) NumPy
+# matrices - positions (cumulative sum of daily net BUY/SELL quantity on
+# top of the position held before the window) and closes (last bar of each
+# day, forward-filled over weekends, holidays and gaps) - and multiplies
+# them. Memory is proportional to days-in-window x securities held.
+# Closes are converted into the portfolio's BaseCurrency before the
+# multiply: each security column is scaled by the day-by-day as-of FX rate
+# series of its currency (fx_functions), one lookup per currency.
+
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import numpy as np
+
+from db import get_connection
+from fx_functions import fx_rates
+from price_cache import close_before, open_series, slice_series
+from report_functions import _choose_portfolio, _load_portfolio_name
+from security_cache import security_cache
+
+ValueSeries = namedtuple("ValueSeries", ["dates", "values", "security_ids", "positions", "prices", "currency"])
+
+FETCH_CHUNK = 50_000
+
+
+def _ffill(matrix: np.ndarray) -> np.ndarray:
+    """Forward-fill NaNs down each column (axis 0), vectorized."""
+    mask = np.isnan(matrix)
+    idx = np.where(~mask, np.arange(matrix.shape[0])[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return matrix[idx, np.arange(matrix.shape[1])[None, :]]
+
+
+def _to_days(values, origin: np.datetime64) -> np.ndarray:
+    """Day offsets from origin for a list of date/datetime values."""
+    return (np.array(values, dtype="datetime64[D]") - origin).astype(np.int64)
+
+
+def load_position_matrix(cursor, portfolio_id: int, start: date, end: date):
+    """
+    Returns (security_ids, positions) where positions[d, s] is the quantity
+    of security_ids[s] held at the end of day start + d. Two grouped
+    queries: opening positions before the window, then daily net deltas.
+    """
+    n_days = (end - start).days + 1
+    origin = np.datetime64(start, "D")
+
+    cursor.execute(
+        """
+        SELECT SecurityID,
+               SUM(CASE WHEN Type = 'BUY' THEN Quantity ELSE -Quantity END)
+        FROM trade
+        WHERE PortfolioID = %s
+          AND Type IN ('BUY','SELL')
+          AND SecurityID IS NOT NULL
+          AND TradeDate < %s
+        GROUP BY SecurityID
+        """,
+        (portfolio_id, start)
+    )
+    opening = {sid: float(qty) for sid, qty in cursor.fetchall() if float(qty) != 0}
+
+    cursor.execute(
+        """
+        SELECT SecurityID, TradeDate,
+               SUM(CASE WHEN Type = 'BUY' THEN Quantity ELSE -Quantity END)
+        FROM trade
+        WHERE PortfolioID = %s
+          AND Type IN ('BUY','SELL')
+          AND SecurityID IS NOT NULL
+          AND TradeDate BETWEEN %s AND %s
+        GROUP BY SecurityID, TradeDate
+        """,
+        (portfolio_id, start, end)
+    )
+    deltas = cursor.fetchall()
+
+    security_ids = sorted(set(opening) | {row[0] for row in deltas})
+    col = {sid: i for i, sid in enumerate(security_ids)}
+
+    # row 0 holds the opening position; rows 1..n_days the daily deltas
+    positions = np.zeros((n_days + 1, len(security_ids)), dtype=np.float64)
+    for sid, qty in opening.items():
+        positions[0, col[sid]] = qty
+    if deltas:
+        sec_idx = np.fromiter((col[r[0]] for r in deltas), dtype=np.int64, count=len(deltas))
+        day_idx = _to_days([r[1] for r in deltas], origin) + 1
+        qty = np.fromiter((float(r[2]) for r in deltas), dtype=np.float64, count=len(deltas))
+        np.add.at(positions, (day_idx, sec_idx), qty)
+
+    np.cumsum(positions, axis=0, out=positions)
+    return security_ids, positions[1:]
+
+
+def load_price_matrix(
+    cursor,
+    security_ids: list,
+    start: date,
+    end: date,
+    interval_code: Optional[str] = None,
+) -> np.ndarray:
+    """
+    prices[d, s] = last close of security_ids[s] on or before day start + d
+    (NaN until the first known close). The bar in force when the window
+    opens is fetched with one grouped-max query; bars inside the window are
+    streamed in chunks straight into the matrix.
+    """
+    n_days = (end - start).days + 1
+    origin = np.datetime64(start, "D")
+    prices = np.full((n_days + 1, len(security_ids)), np.nan, dtype=np.float64)
+    if not security_ids:
+        return prices[1:]
+
+    col = {sid: i for i, sid in enumerate(security_ids)}
+    placeholders = ", ".join(["%s"] * len(security_ids))
+    interval_sql = "AND IntervalCode = %s" if interval_code else ""
+    seed_interval_sql = "WHERE ps.IntervalCode = %s" if interval_code else ""
+    interval_params = (interval_code,) if interval_code else ()
+    window_start = datetime.combine(start, datetime.min.time())
+    window_end = datetime.combine(end + timedelta(days=1), datetime.min.time())
+
+    # Seed row: most recent close before the window
+    cursor.execute(
+        f"""
+        SELECT ps.SecurityID, ps.ClosePrice
+        FROM price_snapshot ps
+        JOIN (
+            SELECT SecurityID, MAX(SnapshotTime) AS LastTime
+            FROM price_snapshot
+            WHERE SecurityID IN ({placeholders})
+              AND SnapshotTime < %s
+              {interval_sql}
+            GROUP BY SecurityID
+        ) prev
+            ON prev.SecurityID = ps.SecurityID
+           AND prev.LastTime = ps.SnapshotTime
+        {seed_interval_sql}
+        """,
+        tuple(security_ids) + (window_start,) + interval_params * 2
+    )
+    for sid, close in cursor.fetchall():
+        prices[0, col[sid]] = float(close)
+
+    cursor.execute(
+        f"""
+        SELECT SecurityID, SnapshotTime, ClosePrice
+        FROM price_snapshot
+        WHERE SecurityID IN ({placeholders})
+          AND SnapshotTime >= %s
+          AND SnapshotTime < %s
+          {interval_sql}
+        ORDER BY SecurityID, SnapshotTime
+        """,
+        tuple(security_ids) + (window_start, window_end) + interval_params
+    )
+    while True:
+        chunk = cursor.fetchmany(FETCH_CHUNK)
+        if not chunk:
+            break
+        sec_idx = np.fromiter((col[r[0]] for r in chunk), dtype=np.int64, count=len(chunk))
+        day_idx = _to_days([r[1] for r in chunk], origin) + 1
+        close = np.fromiter((float(r[2]) for r in chunk), dtype=np.float64, count=len(chunk))
+        # rows are (SecurityID, SnapshotTime)-ordered: keep the last bar of
+        # each security-day run so every cell is written exactly once
+        new_run = (day_idx[1:] != day_idx[:-1]) | (sec_idx[1:] != sec_idx[:-1])
+        last = np.flatnonzero(np.append(new_run, True))
+        prices[day_idx[last], sec_idx[last]] = close[last]
+
+    return _ffill(prices)[1:]
+
+
+def load_price_matrix_cached(
+    cursor,
+    security_ids: list,
+    start: date,
+    end: date,
+    interval_code: str = "1D",
+) -> np.ndarray:
+    """
+    Same matrix as load_price_matrix, read from the memory-mapped local
+    price cache (binary search per security, no row conversion).
+    Securities missing from the cache are loaded from the database.
+    """
+    n_days = (end - start).days + 1
+    origin = np.datetime64(start, "D")
+    prices = np.full((n_days + 1, len(security_ids)), np.nan, dtype=np.float64)
+    window_start = datetime.combine(start, datetime.min.time())
+    window_end = datetime.combine(end + timedelta(days=1), datetime.min.time())
+
+    missing = []
+    for col, sid in enumerate(security_ids):
+        series = open_series(sid, interval_code)
+        if series is None:
+            missing.append(col)
+            continue
+        seed = close_before(series, window_start)
+        if seed is not None:
+            prices[0, col] = seed
+        part = slice_series(series, window_start, window_end)
+        if len(part.times):
+            day_idx = (part.times.astype("datetime64[D]") - origin).astype(np.int64) + 1
+            last_of_day = np.flatnonzero(np.append(day_idx[1:] != day_idx[:-1], True))
+            prices[day_idx[last_of_day], col] = part.close[last_of_day]
+
+    prices = _ffill(prices)[1:]
+    if missing:
+        fallback = load_price_matrix(cursor, [security_ids[c] for c in missing], start, end, interval_code)
+        prices[:, missing] = fallback
+    return prices
+
+
+def convert_price_matrix(prices: np.ndarray, security_ids: list, dates: np.ndarray, currency: str):
+    """
+    Converts prices[d, s] in place from each security's currency into
+    currency at the rate in force on dates[d] (NaN before the first rate).
+    """
+    info = security_cache().get_many(security_ids)
+    columns = {}
+    for i, sid in enumerate(security_ids):
+        curr = info[sid].currency if sid in info else currency
+        if curr != currency:
+            columns.setdefault(curr, []).append(i)
+
+    fx = fx_rates()
+    for curr, cols in columns.items():
+        rates = fx.rates(curr, currency, dates)
+        if np.isnan(rates).all():
+            print(f"[WARN] No FX rate for {curr}/{currency}; those positions are valued at 0.")
+        prices[:, cols] *= rates[:, None]
+
+
+def portfolio_value_series(
+    portfolio_id: int,
+    start: date,
+    end: date,
+    interval_code: Optional[str] = None,
+    use_cache: bool = False,
+    currency: Optional[str] = None,
+) -> Optional[ValueSeries]:
+    """
+    Daily end-of-day market value of a portfolio from start to end
+    (inclusive), in currency (default the portfolio's BaseCurrency).
+    Positions without any known close, or on days before their currency's
+    first FX rate, contribute 0. use_cache reads closes from the local
+    price cache (interval_code, default 1D) instead of price_snapshot.
+    Returns None on failure.
+    """
+    if end < start:
+        print("[ERROR] End date is before start date.")
+        return None
+
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    try:
+        cursor = conn.cursor()
+        if currency is None:
+            cursor.execute("SELECT BaseCurrency FROM portfolio WHERE PortfolioID = %s", (portfolio_id,))
+            row = cursor.fetchone()
+            if row is None:
+                print(f"[ERROR] Portfolio {portfolio_id} not found.")
+                return None
+            currency = row[0]
+
+        security_ids, positions = load_position_matrix(cursor, portfolio_id, start, end)
+        if use_cache:
+            prices = load_price_matrix_cached(cursor, security_ids, start, end, interval_code or "1D")
+        else:
+            prices = load_price_matrix(cursor, security_ids, start, end, interval_code)
+
+        dates = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+        convert_price_matrix(prices, security_ids, dates, currency)
+
+        values = np.nansum(positions * prices, axis=1)
+        return ValueSeries(dates, values, security_ids, positions, prices, currency)
+
+    except Exception as e:
+        print(f"[ERROR] Failed to compute value history: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def portfolio_value_history(current_user_id: int):
+    portfolio_id = _choose_portfolio(current_user_id)
+    if portfolio_id is None:
+        return
+
+    today = datetime.today().date()
+    try:
+        start_str = input("Start date (YYYY-MM-DD, blank = one year ago): ").strip()
+        start = datetime.strptime(start_str, "%Y-%m-%d").date() if start_str else today - timedelta(days=365)
+        end_str = input("End date (YYYY-MM-DD, blank = today): ").strip()
+        end = datetime.strptime(end_str, "%Y-%m-%d").date() if end_str else today
+    except ValueError:
+        print("Invalid date format.")
+        return
+    interval_code = input("Bar interval (e.g. 1D, 1H; blank = any): ").strip().upper() or None
+
+    series = portfolio_value_series(portfolio_id, start, end, interval_code)
+    if series is None:
+        return
+
+    pname = _load_portfolio_name(portfolio_id)
+    print(f"\n=== Value History for {pname} (ID={portfolio_id}) ===")
+    print(f"{'Month end':<12} {'Value ' + series.currency:>16}")
+    print("-" * 30)
+
+    # one line per month (last day in the window for each month)
+    months = series.dates.astype("datetime64[M]")
+    last_of_month = np.flatnonzero(np.append(months[1:] != months[:-1], True))
+    for i in last_of_month:
+        print(f"{str(series.dates[i]):<12} {series.values[i]:>16,.2f}")
+
+    print("-" * 30)
+    first, last = series.values[0], series.values[-1]
+    change = last - first
+    pct = (change / first * 100.0) if first else 0.0
+    print(f"Start {first:,.2f} -> End {last:,.2f} ({change:+,.2f}, {pct:+.2f}%)")
+    print(f"High  {series.values.max():,.2f} on {series.dates[series.values.argmax()]}")
+    print(f"Low   {series.values.min():,.2f} on {series.dates[series.values.argmin()]}")
@@ -0,0 +1,140 @@
+# holding_functions.py
+#
+# The holding table is a running aggregate of BUY/SELL trades per
+# (portfolio, security). Every code path that inserts trades calls
+# apply_trades_to_holdings() inside the same transaction, so reports can
+# read positions by primary key instead of re-scanning trade history.
+
+from typing import Iterable, Optional, Tuple
+
+from db import get_connection
+
+UPSERT_HOLDING_DELTA_SQL = """
+    INSERT INTO holding
+        (PortfolioID, SecurityID, BuyQty, SellQty, NetQty, TotalBuyCost, AvgCostBasis)
+    VALUES
+        (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        AvgCostBasis = CASE
+                           WHEN BuyQty + VALUES(BuyQty) > 0
+                           THEN (TotalBuyCost + VALUES(TotalBuyCost)) / (BuyQty + VALUES(BuyQty))
+                           ELSE 0
+                       END,
+        BuyQty       = BuyQty + VALUES(BuyQty),
+        SellQty      = SellQty + VALUES(SellQty),
+        NetQty       = NetQty + VALUES(NetQty),
+        TotalBuyCost = TotalBuyCost + VALUES(TotalBuyCost)
+"""
+
+
+def apply_trades_to_holdings(
+    cursor,
+    portfolio_id: int,
+    trades: Iterable[Tuple[int, str, float, float, float]],
+):
+    """
+    Folds newly inserted trades into the holding table.
+
+    trades is an iterable of (SecurityID, Type, Quantity, UnitPrice, Fees).
+    Deltas are summed per security first, so a batch of N trades costs one
+    executemany over its distinct securities. Only BUY/SELL rows move a
+    position; DIVIDEND and other types are ignored. The caller commits.
+    """
+    deltas = {}
+    for security_id, trade_type, qty, price, fees in trades:
+        if trade_type not in ("BUY", "SELL") or security_id is None:
+            continue
+        d = deltas.setdefault(security_id, [0.0, 0.0, 0.0])
+        if trade_type == "BUY":
+            d[0] += qty
+            d[2] += qty * price + fees
+        else:
+            d[1] += qty
+
+    if not deltas:
+        return
+
+    rows = []
+    for security_id, (buy_qty, sell_qty, buy_cost) in deltas.items():
+        avg_cost = buy_cost / buy_qty if buy_qty > 0 else 0.0
+        rows.append((portfolio_id, security_id, buy_qty, sell_qty,
+                     buy_qty - sell_qty, buy_cost, avg_cost))
+
+    cursor.executemany(UPSERT_HOLDING_DELTA_SQL, rows)
+
+
+def rebuild_holdings_in_tx(cursor, portfolio_id: Optional[int] = None) -> int:
+    """
+    Deletes and recomputes holding rows from trade for one portfolio (or all
+    portfolios when portfolio_id is None) in one set-based INSERT ... SELECT.
+    Returns the number of rows written. The caller commits.
+    """
+    where = "" if portfolio_id is None else "AND t.PortfolioID = %s"
+    params = () if portfolio_id is None else (portfolio_id,)
+
+    if portfolio_id is None:
+        cursor.execute("DELETE FROM holding")
+    else:
+        cursor.execute(
+            "DELETE FROM holding WHERE PortfolioID = %s",
+            (portfolio_id,)
+        )
+
+    cursor.execute(
+        f"""
+        INSERT INTO holding
+            (PortfolioID, SecurityID, BuyQty, SellQty, NetQty, TotalBuyCost, AvgCostBasis)
+        SELECT
+            agg.PortfolioID,
+            agg.SecurityID,
+            agg.BuyQty,
+            agg.SellQty,
+            agg.BuyQty - agg.SellQty,
+            agg.TotalBuyCost,
+            CASE WHEN agg.BuyQty > 0 THEN agg.TotalBuyCost / agg.BuyQty ELSE 0 END
+        FROM (
+            SELECT
+                t.PortfolioID,
+                t.SecurityID,
+                SUM(CASE WHEN t.Type = 'BUY'  THEN t.Quantity ELSE 0 END) AS BuyQty,
+                SUM(CASE WHEN t.Type = 'SELL' THEN t.Quantity ELSE 0 END) AS SellQty,
+                SUM(CASE WHEN t.Type = 'BUY'
+                         THEN (t.Quantity * t.UnitPrice + t.Fees)
+                         ELSE 0 END) AS TotalBuyCost
+            FROM trade t
+            WHERE t.Type IN ('BUY','SELL')
+              AND t.SecurityID IS NOT NULL
+              {where}
+            GROUP BY t.PortfolioID, t.SecurityID
+        ) agg
+        """,
+        params
+    )
+    return cursor.rowcount
+
+
+def rebuild_holdings(portfolio_id: Optional[int] = None) -> bool:
+    """
+    Repair path: recomputes holding rows from the full trade history for one
+    portfolio (or every portfolio when portfolio_id is None). Reports never
+    call this; use it after manual edits to the trade table.
+    """
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database to rebuild holdings.")
+        return False
+
+    try:
+        cursor = conn.cursor()
+        rebuilt = rebuild_holdings_in_tx(cursor, portfolio_id)
+        conn.commit()
+        print(f"[INFO] Holding table rebuilt from trades ({rebuilt} position row(s)).")
+        return True
+
+    except Exception as e:
+        print(f"[ERROR] Failed to rebuild holdings table: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        conn.close()
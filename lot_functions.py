@@ -0,0 +1,269 @@
+# lot_functions.py
+#
+# Lot matching over the trade table: realized P&L per SELL and remaining
+# open lots, by FIFO, LIFO, average cost or specific-lot identification.
+#
+# Trades are streamed ordered by (PortfolioID, SecurityID, TradeDate,
+# TransactionID), so only the lot book of the (portfolio, security) being
+# processed is in memory at any time - a deque of [qty, unit_cost, date,
+# txn_id] lists - no matter how many trades the table holds.
+
+from collections import deque, namedtuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from db import get_connection
+from report_functions import _choose_portfolio, _load_portfolio_name
+from security_cache import security_cache
+
+METHODS = ("FIFO", "LIFO", "AVERAGE", "SPECIFIC")
+FETCH_CHUNK = 10_000
+_EPS = 1e-9
+
+SellResult = namedtuple(
+    "SellResult",
+    ["portfolio_id", "security_id", "transaction_id", "trade_date", "quantity",
+     "proceeds", "cost_basis", "realized_pl", "unmatched_qty"],
+)
+OpenLot = namedtuple(
+    "OpenLot",
+    ["portfolio_id", "security_id", "transaction_id", "trade_date", "quantity", "unit_cost"],
+)
+
+
+def _take(book: deque, qty: float, from_left: bool) -> Tuple[float, float]:
+    """Consumes qty from one end of the book; returns (matched_qty, cost)."""
+    matched = cost = 0.0
+    while qty > _EPS and book:
+        lot = book[0] if from_left else book[-1]
+        used = min(lot[0], qty)
+        matched += used
+        cost += used * lot[1]
+        lot[0] -= used
+        qty -= used
+        if lot[0] <= _EPS:
+            if from_left:
+                book.popleft()
+            else:
+                book.pop()
+    return matched, cost
+
+
+def _take_specific(book: deque, qty: float, lot_ids: List[int]) -> Tuple[float, float]:
+    """Consumes the named buy lots first, then falls back to FIFO."""
+    matched = cost = 0.0
+    for lot_id in lot_ids:
+        for lot in book:
+            if lot[3] == lot_id and qty > _EPS:
+                used = min(lot[0], qty)
+                matched += used
+                cost += used * lot[1]
+                lot[0] -= used
+                qty -= used
+        if qty <= _EPS:
+            break
+    for lot in [lot for lot in book if lot[0] <= _EPS]:
+        book.remove(lot)
+    if qty > _EPS:
+        m, c = _take(book, qty, from_left=True)
+        matched += m
+        cost += c
+    return matched, cost
+
+
+def match_lots(
+    trades: Iterable[tuple],
+    method: str = "FIFO",
+    specific: Optional[Dict[int, List[int]]] = None,
+) -> Iterator[Union[SellResult, OpenLot]]:
+    """
+    Core engine. trades yields (PortfolioID, SecurityID, TransactionID,
+    Type, TradeDate, Quantity, UnitPrice, Fees) ordered by portfolio,
+    security, date, transaction. Yields a SellResult for every SELL as it
+    is matched and, when a (portfolio, security) group ends, an OpenLot
+    for every lot still held.
+
+    Buy fees are capitalised into the lot's unit cost; sell fees reduce
+    proceeds. For SPECIFIC, `specific` maps a SELL TransactionID to the
+    BUY TransactionIDs it closes; unmapped sells fall back to FIFO.
+    A SELL larger than the book reports the excess as unmatched_qty.
+    """
+    method = method.upper()
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    specific = specific or {}
+
+    key = None
+    book: deque = deque()
+
+    def close_group():
+        for qty, unit_cost, tdate, txn_id in book:
+            if qty > _EPS:
+                yield OpenLot(key[0], key[1], txn_id, tdate, qty, unit_cost)
+
+    for pid, sid, txn_id, ttype, tdate, qty, price, fees in trades:
+        if (pid, sid) != key:
+            if key is not None:
+                yield from close_group()
+            key = (pid, sid)
+            book = deque()
+
+        qty = float(qty)
+        price = float(price)
+        fees = float(fees or 0)
+
+        if ttype == "BUY":
+            if qty <= _EPS:
+                continue
+            unit_cost = (qty * price + fees) / qty
+            if method == "AVERAGE" and book:
+                lot = book[0]
+                total = lot[0] + qty
+                lot[1] = (lot[0] * lot[1] + qty * unit_cost) / total
+                lot[0] = total
+            else:
+                book.append([qty, unit_cost, tdate, None if method == "AVERAGE" else txn_id])
+
+        elif ttype == "SELL":
+            if method == "LIFO":
+                matched, cost = _take(book, qty, from_left=False)
+            elif method == "SPECIFIC" and txn_id in specific:
+                matched, cost = _take_specific(book, qty, specific[txn_id])
+            else:
+                # FIFO, AVERAGE (single pooled lot) and unmapped SPECIFIC
+                matched, cost = _take(book, qty, from_left=True)
+
+            proceeds = matched * price - fees * (matched / qty if qty else 0.0)
+            yield SellResult(pid, sid, txn_id, tdate, qty, proceeds, cost,
+                             proceeds - cost, qty - matched)
+
+    if key is not None:
+        yield from close_group()
+
+
+def iter_trades_for_lots(cursor, portfolio_id: int, security_id: Optional[int] = None) -> Iterator[tuple]:
+    """Streams BUY/SELL rows in lot-matching order with fetchmany()."""
+    sql = """
+        SELECT PortfolioID, SecurityID, TransactionID, Type, TradeDate,
+               Quantity, UnitPrice, Fees
+        FROM trade
+        WHERE PortfolioID = %s
+          AND Type IN ('BUY','SELL')
+          AND SecurityID IS NOT NULL
+    """
+    params = [portfolio_id]
+    if security_id is not None:
+        sql += " AND SecurityID = %s"
+        params.append(security_id)
+    sql += " ORDER BY PortfolioID, SecurityID, TradeDate, TransactionID"
+
+    cursor.execute(sql, tuple(params))
+    while True:
+        chunk = cursor.fetchmany(FETCH_CHUNK)
+        if not chunk:
+            break
+        yield from chunk
+
+
+def get_realized_pnl(
+    portfolio_id: int,
+    method: str = "FIFO",
+    security_id: Optional[int] = None,
+    specific: Optional[Dict[int, List[int]]] = None,
+    include_sells: bool = False,
+    include_lots: bool = False,
+) -> Optional[dict]:
+    """
+    Runs the lot engine over a portfolio in one streaming pass and returns
+    realized P&L and open cost per security (plus, on request, every
+    matched sell and every open lot). Returns None on failure.
+    """
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    per_security: Dict[int, dict] = {}
+    sells: List[dict] = []
+    lots: List[dict] = []
+
+    def entry(sid):
+        return per_security.setdefault(sid, {
+            "SecurityID": sid, "RealizedPL": 0.0, "Proceeds": 0.0, "SoldCost": 0.0,
+            "SoldQty": 0.0, "UnmatchedQty": 0.0, "OpenQty": 0.0, "OpenCost": 0.0, "OpenLots": 0,
+        })
+
+    try:
+        cursor = conn.cursor()
+        events = match_lots(iter_trades_for_lots(cursor, portfolio_id, security_id), method, specific)
+        for ev in events:
+            e = entry(ev.security_id)
+            if isinstance(ev, SellResult):
+                e["RealizedPL"] += ev.realized_pl
+                e["Proceeds"] += ev.proceeds
+                e["SoldCost"] += ev.cost_basis
+                e["SoldQty"] += ev.quantity
+                e["UnmatchedQty"] += ev.unmatched_qty
+                if include_sells:
+                    sells.append(ev._asdict())
+            else:
+                e["OpenQty"] += ev.quantity
+                e["OpenCost"] += ev.quantity * ev.unit_cost
+                e["OpenLots"] += 1
+                if include_lots:
+                    lots.append(ev._asdict())
+
+    except Exception as e:
+        print(f"[ERROR] Failed to compute realized P&L: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+    info = security_cache().get_many(per_security.keys())
+    for sid, e in per_security.items():
+        e["Ticker"] = info[sid].ticker if sid in info else str(sid)
+
+    result = {
+        "PortfolioID": portfolio_id,
+        "Method": method.upper(),
+        "RealizedPL": sum(e["RealizedPL"] for e in per_security.values()),
+        "OpenCost": sum(e["OpenCost"] for e in per_security.values()),
+        "Securities": sorted(per_security.values(), key=lambda e: e["Ticker"]),
+    }
+    if include_sells:
+        result["Sells"] = sells
+    if include_lots:
+        result["OpenLots"] = lots
+    return result
+
+
+def realized_pnl_report(current_user_id: int):
+    portfolio_id = _choose_portfolio(current_user_id)
+    if portfolio_id is None:
+        return
+
+    method = input("Cost method (FIFO, LIFO, AVERAGE; blank = FIFO): ").strip().upper() or "FIFO"
+    if method not in ("FIFO", "LIFO", "AVERAGE"):
+        print("Cost method must be FIFO, LIFO or AVERAGE.")
+        return
+
+    result = get_realized_pnl(portfolio_id, method)
+    if result is None:
+        return
+
+    if not result["Securities"]:
+        print("\nNo BUY/SELL trades recorded for this portfolio yet.")
+        return
+
+    pname = _load_portfolio_name(portfolio_id)
+    print(f"\n=== Realized P/L ({method}) for {pname} (ID={portfolio_id}) ===")
+    print(f"{'Ticker':<8} {'SoldQty':>10} {'Proceeds':>14} {'Cost':>14} {'Realized':>14} {'OpenQty':>10} {'OpenCost':>14}")
+    print("-" * 90)
+    for e in result["Securities"]:
+        print(f"{e['Ticker']:<8} {e['SoldQty']:>10.2f} {e['Proceeds']:>14,.2f} {e['SoldCost']:>14,.2f} "
+              f"{e['RealizedPL']:>14,.2f} {e['OpenQty']:>10.2f} {e['OpenCost']:>14,.2f}")
+        if e["UnmatchedQty"] > _EPS:
+            print(f"         [WARN] {e['UnmatchedQty']:.4f} shares sold with no matching buy lot")
+    print("-" * 90)
+    print(f"Total realized P/L : {result['RealizedPL']:,.2f}")
+    print(f"Open cost basis    : {result['OpenCost']:,.2f}")
@@ -1,9 +1,17 @@
-from db import get_connection
+from db import get_connection, init_pool
 from portfolio_functions import create_portfolio, move_portfolio_to_account
 from security_functions import add_security_tag
-from trade_functions import record_trade, record_dividend, trade_history_by_security
-from price_functions import import_price_snapshot_manual
-from report_functions import holdings_report, portfolio_snapshot_value
+from trade_functions import record_trade, record_dividend, trade_history_by_security, import_trades
+from price_functions import import_price_snapshot_manual, import_price_snapshot_csv
+from report_functions import holdings_report, portfolio_snapshot_value, repair_holdings, consolidated_valuation
+from history_functions import portfolio_value_history
+from lot_functions import realized_pnl_report
+from resample_functions import resample_prices_menu
+from dividend_functions import dividend_income_report
+from exposure_functions import exposure_report
+from tag_functions import bulk_tag_menu, tag_query_menu
+from risk_functions import risk_report
+import sql_profiler
 
 #Global Session Variables
 current_user_id = None
@@ -144,8 +152,34 @@ def require_login():
 
 # ---------- MAIN APP MENU ----------
 
+# choice -> (function, takes current_user_id)
+MENU_ACTIONS = {
+    "1": (create_portfolio, True),
+    "2": (record_trade, True),
+    "3": (record_dividend, True),
+    "4": (import_price_snapshot_manual, False),
+    "5": (portfolio_snapshot_value, True),
+    "6": (holdings_report, True),
+    "7": (trade_history_by_security, True),
+    "8": (move_portfolio_to_account, True),
+    "9": (add_security_tag, True),
+    "10": (import_price_snapshot_csv, False),
+    "11": (import_trades, True),
+    "12": (repair_holdings, True),
+    "13": (portfolio_value_history, True),
+    "14": (consolidated_valuation, True),
+    "15": (realized_pnl_report, True),
+    "16": (sql_profiler.print_summary, False),
+    "17": (resample_prices_menu, False),
+    "18": (dividend_income_report, True),
+    "19": (exposure_report, True),
+    "20": (bulk_tag_menu, False),
+    "21": (tag_query_menu, False),
+    "22": (risk_report, True),
+}
+
+
 def app_menu():
-    from time import sleep
     global current_user_id, current_user_email
 
     if not require_login():
@@ -164,31 +198,33 @@ def app_menu():
         print("4. Import price snapshot")
         print("5. Show portfolio snapshot value")
         print("6. View holdings report")
-        print("7. View trade history by security")
+        print("7. View trade history")
         print("8. Move portfolio to another account")
         print("9. Add security tag to a security")
+        print("10. Bulk import price snapshots from CSV")
+        print("11. Import trades from broker export")
+        print("12. Rebuild holdings from trade history (repair)")
+        print("13. Portfolio value history")
+        print("14. Consolidated valuation (all portfolios)")
+        print("15. Realized P/L by lot (FIFO/LIFO/average)")
+        print("16. SQL statement summary (profiling)")
+        print("17. Roll up intraday bars (1MIN -> 1H -> 1D)")
+        print("18. Dividend income report")
+        print("19. Exposure by tag / sector / industry")
+        print("20. Bulk tag securities (file or rule)")
+        print("21. Find securities by tag expression")
+        print("22. Risk statistics (volatility, beta, drawdown)")
         print("L. Log in as a different user")
         print("0. Exit")
         choice = input("Enter choice: ").strip()
 
-        if choice == "1":
-            create_portfolio(current_user_id)
-        elif choice == "2":
-            record_trade(current_user_id)
-        elif choice == "3":
-            record_dividend(current_user_id)
-        elif choice == "4":
-            import_price_snapshot_manual()
-        elif choice == "5":
-            portfolio_snapshot_value(current_user_id)
-        elif choice == "6":
-            holdings_report(current_user_id)
-        elif choice == "7":
-            trade_history_by_security(current_user_id)
-        elif choice == "8":
-            move_portfolio_to_account(current_user_id)
-        elif choice == "9":
-            add_security_tag(current_user_id)
+        if choice in MENU_ACTIONS:
+            func, needs_user = MENU_ACTIONS[choice]
+            with sql_profiler.action(func.__name__):
+                if needs_user:
+                    func(current_user_id)
+                else:
+                    func()
         elif choice.lower() == "l":
             current_user_id = None
             current_user_email = None
@@ -201,8 +237,7 @@ def app_menu():
         else:
             print("Invalid choice. Please try again.")
 
-        sleep(0.3)
-
 
 if __name__ == "__main__":
+    init_pool()
     app_menu()
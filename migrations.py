@@ -0,0 +1,598 @@
+# migrations.py
+#
+# Versioned schema changes on top of Query.sql.
+#
+# Query.sql creates the base tables; everything added after that lives here
+# as a numbered migration. The applied version is tracked in schema_version,
+# so running this file against an existing portfolio_db applies only what
+# is missing:
+#
+#     python migrations.py                 apply pending migrations
+#     python migrations.py --status        show current / latest version
+#     python migrations.py --explain FILE  also capture EXPLAIN of the hot
+#                                          queries before and after, into FILE
+#
+# The same migrations run on the SQLite backend (db_config.json
+# "backend": "sqlite"); the guards use PRAGMA there instead of
+# information_schema.
+#
+# MySQL commits DDL implicitly, so a migration cannot be rolled back as a
+# unit. Every step is therefore guarded (column/index existence checks) and
+# a half-applied migration can simply be re-run.
+
+import sys
+from collections import namedtuple
+from typing import Callable, List, Optional
+
+from db import backend, get_connection
+from holding_functions import rebuild_holdings_in_tx
+
+Migration = namedtuple("Migration", ["version", "description", "steps", "notes"])
+
+
+# ---------- GUARDS ----------
+
+def _column_exists(cursor, table: str, column: str) -> bool:
+    if backend() == "sqlite":
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row[1] == column for row in cursor.fetchall())
+    cursor.execute(
+        """
+        SELECT COUNT(*)
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_NAME = %s
+          AND COLUMN_NAME = %s
+        """,
+        (table, column)
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def _index_exists(cursor, table: str, index: str) -> bool:
+    if backend() == "sqlite":
+        cursor.execute(f"PRAGMA index_list({table})")
+        return any(row[1] == index for row in cursor.fetchall())
+    cursor.execute(
+        """
+        SELECT COUNT(*)
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_NAME = %s
+          AND INDEX_NAME = %s
+        """,
+        (table, index)
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def add_column(table: str, column: str, definition: str) -> Callable:
+    def step(cursor):
+        if not _column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    step.__doc__ = f"ADD COLUMN {table}.{column}"
+    return step
+
+
+def add_index(table: str, index: str, columns: str) -> Callable:
+    def step(cursor):
+        if not _index_exists(cursor, table, index):
+            cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+    step.__doc__ = f"CREATE INDEX {index} ON {table}"
+    return step
+
+
+def _primary_key(cursor, table: str) -> List[str]:
+    if backend() == "sqlite":
+        cursor.execute(f"PRAGMA table_info({table})")
+        return [row[1] for row in sorted(cursor.fetchall(), key=lambda r: r[5]) if row[5] > 0]
+    cursor.execute(
+        """
+        SELECT COLUMN_NAME
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_NAME = %s
+          AND INDEX_NAME = 'PRIMARY'
+        ORDER BY SEQ_IN_INDEX
+        """,
+        (table,)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def create_table(ddl: str) -> Callable:
+    def step(cursor):
+        cursor.execute(ddl)
+    step.__doc__ = ddl.strip().splitlines()[0]
+    return step
+
+
+# price_snapshot as created by Query.sql, used to rebuild it on SQLite
+# (which cannot ALTER a primary key)
+_PRICE_SNAPSHOT_COLUMNS = """
+    SecurityID    INT UNSIGNED NOT NULL,
+    SnapshotTime  DATETIME     NOT NULL,
+    OpenPrice     DECIMAL(18,4) NOT NULL,
+    HighPrice     DECIMAL(18,4) NOT NULL,
+    LowPrice      DECIMAL(18,4) NOT NULL,
+    ClosePrice    DECIMAL(18,4) NOT NULL,
+    Volume        BIGINT       NOT NULL,
+    Source        VARCHAR(50)  NOT NULL,
+    IntervalCode  VARCHAR(20)  NOT NULL
+"""
+
+
+def _price_snapshot_interval_key(cursor):
+    """PRIMARY KEY (SecurityID, SnapshotTime) -> (SecurityID, IntervalCode, SnapshotTime)."""
+    wanted = ["SecurityID", "IntervalCode", "SnapshotTime"]
+    if _primary_key(cursor, "price_snapshot") == wanted:
+        return
+    if backend() != "sqlite":
+        cursor.execute(
+            "ALTER TABLE price_snapshot DROP PRIMARY KEY, "
+            "ADD PRIMARY KEY (SecurityID, IntervalCode, SnapshotTime)"
+        )
+        return
+
+    cursor.execute("DROP TABLE IF EXISTS price_snapshot_rebuild")
+    cursor.execute(
+        f"""
+        CREATE TABLE price_snapshot_rebuild (
+            {_PRICE_SNAPSHOT_COLUMNS},
+            PRIMARY KEY (SecurityID, IntervalCode, SnapshotTime),
+            CONSTRAINT fk_price_snapshot_security
+                FOREIGN KEY (SecurityID)
+                    REFERENCES security(SecurityID)
+                    ON DELETE CASCADE
+        )
+        """
+    )
+    cursor.execute(
+        "INSERT INTO price_snapshot_rebuild "
+        "SELECT SecurityID, SnapshotTime, OpenPrice, HighPrice, LowPrice, ClosePrice, "
+        "Volume, Source, IntervalCode FROM price_snapshot"
+    )
+    cursor.execute("DROP TABLE price_snapshot")
+    cursor.execute("ALTER TABLE price_snapshot_rebuild RENAME TO price_snapshot")
+
+
+def _backfill_holdings(cursor):
+    """Recompute holding running totals from the trade table."""
+    rebuild_holdings_in_tx(cursor)
+
+
+def _backfill_price_partitions(cursor):
+    """One price_snapshot_change row for every (SecurityID, year) already stored."""
+    cursor.execute(
+        """
+        INSERT IGNORE INTO price_snapshot_change (SecurityID, SnapshotYear, Version)
+        SELECT SecurityID, YEAR(SnapshotTime), 1
+        FROM price_snapshot
+        GROUP BY SecurityID, YEAR(SnapshotTime)
+        """
+    )
+
+
+# ---------- MIGRATIONS ----------
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        version=1,
+        description="holding running totals (BuyQty/SellQty/NetQty/TotalBuyCost)",
+        steps=[
+            add_column("holding", "BuyQty", "DECIMAL(18,4) NOT NULL DEFAULT 0 AFTER SecurityID"),
+            add_column("holding", "SellQty", "DECIMAL(18,4) NOT NULL DEFAULT 0 AFTER BuyQty"),
+            add_column("holding", "NetQty", "DECIMAL(18,4) NOT NULL DEFAULT 0 AFTER SellQty"),
+            add_column("holding", "TotalBuyCost", "DECIMAL(18,4) NOT NULL DEFAULT 0 AFTER NetQty"),
+            _backfill_holdings,
+        ],
+        notes="""
+Columns already present on databases created from the current Query.sql;
+the guards make this a backfill-only step there.
+""",
+    ),
+    Migration(
+        version=2,
+        description="trade (PortfolioID, SecurityID, TradeDate, TransactionID, ...) covering index",
+        steps=[
+            add_index(
+                "trade",
+                "idx_trade_portfolio_security_date",
+                "PortfolioID, SecurityID, TradeDate, TransactionID, Type, Quantity, UnitPrice, Fees",
+            ),
+        ],
+        notes="""
+One index serves both hot trade access paths:
+
+* Position aggregation (holdings rebuild, per-portfolio BUY/SELL sums):
+      WHERE PortfolioID = ? AND Type IN ('BUY','SELL') GROUP BY SecurityID
+  Rows arrive in SecurityID order and every referenced column is in the
+  index, so the GROUP BY needs no temporary table and no table rows.
+
+* trade_history_by_security:
+      WHERE PortfolioID = ? AND SecurityID = ? ORDER BY TradeDate, TransactionID
+  TransactionID sits directly after TradeDate (not after the covering
+  columns, where the implicit primary key would land), so the two
+  equalities leave the index in ORDER BY order and nothing is sorted.
+
+The FK on trade.PortfolioID is satisfied by the new index's prefix.
+
+Recorded with EXPLAIN QUERY PLAN on SQLite (200k trades, ANALYZE run):
+  aggregation  SEARCH trade USING COVERING INDEX
+               idx_trade_portfolio_security_date (PortfolioID=?)
+  by security  SEARCH trade USING COVERING INDEX
+               idx_trade_portfolio_security_date (PortfolioID=? AND SecurityID=?)
+The earlier shape (covering columns before the primary key) added
+"USE TEMP B-TREE FOR RIGHT PART OF ORDER BY" to the second query.
+MySQL plans were not recorded; run with --explain FILE to capture them
+on your data.
+""",
+    ),
+    Migration(
+        version=3,
+        description="price_snapshot keyed by IntervalCode + rollup dirty-window queue",
+        steps=[
+            _price_snapshot_interval_key,
+            add_index("price_snapshot", "idx_price_security_time", "SecurityID, SnapshotTime"),
+            create_table(
+                """
+                CREATE TABLE IF NOT EXISTS price_rollup_dirty (
+                    IntervalCode VARCHAR(20)  NOT NULL,
+                    SecurityID   INT UNSIGNED NOT NULL,
+                    WindowStart  DATETIME     NOT NULL,
+                    MarkedAt     BIGINT       NOT NULL,
+                    PRIMARY KEY (IntervalCode, SecurityID, WindowStart)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """
+            ),
+        ],
+        notes="""
+Rolled-up 1H/1D bars share timestamps with the 1MIN bars they come from
+(a 1H bar is stamped 10:00 like the 10:00 minute bar), so IntervalCode
+joins the price_snapshot primary key. Interval-filtered reads
+(WHERE SecurityID = ? AND IntervalCode = ? AND SnapshotTime range) are
+clustered range scans on the new key; reads across all intervals use
+idx_price_security_time.
+
+price_rollup_dirty is the queue of (target interval, security, window)
+touched by price writes since the last resample run; MarkedAt (epoch
+microseconds) lets a run clear only the marks it has processed.
+On MySQL the key change rebuilds price_snapshot; on SQLite the table is
+copied into a new one.
+""",
+    ),
+    Migration(
+        version=4,
+        description="trade (PortfolioID, Type, TradeDate, TransactionID) index",
+        steps=[
+            add_index(
+                "trade",
+                "idx_trade_portfolio_type_date",
+                "PortfolioID, Type, TradeDate, TransactionID",
+            ),
+        ],
+        notes="""
+Reads of one trade Type go straight to that Type's rows instead of every
+trade of the portfolio:
+
+* Dividend income buckets:
+      WHERE PortfolioID IN (...) AND Type = 'DIVIDEND'
+      GROUP BY PortfolioID, SecurityID, TradeCurrency, YEAR(TradeDate), MONTH(TradeDate)
+* Trade history pages filtered to one Type:
+      WHERE PortfolioID = ? AND Type = ? AND TradeDate >= ? ...
+      ORDER BY TradeDate, TransactionID LIMIT ?
+  After the two equalities the index is in ORDER BY order, so a page
+  stops after LIMIT rows.
+
+The index is deliberately narrow. idx_trade_portfolio_security_date
+already covers the BUY/SELL aggregation, and copying the covering columns
+here as well would make a third wide index to maintain on every trade
+insert. The dividend query instead reads one table row per dividend, and
+its result is cached per portfolio (dividend_functions).
+
+Measured on SQLite (200k trades, 10% dividends, ANALYZE run):
+                  no index   covering (PortfolioID, Type,   this index
+                             TradeDate, SecurityID, ...)
+  dividend report  41.2 ms    28.0 ms                         37.0 ms
+  one-Type page     1.26 ms    0.87 ms                         0.31 ms
+  200k inserts                 2.71 s                          2.52 s
+Plans: the report is "SEARCH trade USING INDEX idx_trade_portfolio_type_date
+(PortfolioID=? AND Type=?)" and the page is "... (PortfolioID=? AND Type=? AND
+TradeDate>?)" with no temp B-tree. MySQL plans were not recorded; run with
+--explain FILE to capture them.
+""",
+    ),
+    Migration(
+        version=5,
+        description="trade (PortfolioID, TradeDate) index for paged trade history",
+        steps=[
+            add_index("trade", "idx_trade_portfolio_date", "PortfolioID, TradeDate"),
+        ],
+        notes="""
+Paged trade history across all securities:
+      WHERE PortfolioID = ? AND TradeDate >= ? AND (TradeDate > ? OR TransactionID > ?)
+      ORDER BY TradeDate, TransactionID LIMIT ?
+The implicit primary key (TransactionID) follows TradeDate in the index,
+so rows come out in ORDER BY order and a page stops after LIMIT rows.
+
+Recorded with EXPLAIN QUERY PLAN on SQLite (200k trades over 20
+portfolios, ANALYZE run, 20-row pages, indexes of migrations 2 and 4
+present):
+                without this index              with it
+  first page    SEARCH trade USING INDEX        SEARCH trade USING INDEX
+                idx_trade_portfolio_type_date   idx_trade_portfolio_date
+                (PortfolioID=?)                 (PortfolioID=?)
+                USE TEMP B-TREE FOR ORDER BY
+                2.25 ms                         0.07 ms
+  later page    same plan as above              ... (PortfolioID=? AND TradeDate>?)
+                2.96 ms                         0.07 ms
+MySQL plans were not recorded; run with --explain FILE to capture them
+on your data.
+""",
+    ),
+    Migration(
+        version=6,
+        description="fx_rate table for multi-currency valuation",
+        steps=[
+            create_table(
+                """
+                CREATE TABLE IF NOT EXISTS fx_rate (
+                    FromCurrency CHAR(3)       NOT NULL,
+                    ToCurrency   CHAR(3)       NOT NULL,
+                    RateDate     DATE          NOT NULL,
+                    Rate         DECIMAL(18,8) NOT NULL,
+                    Source       VARCHAR(50)   NOT NULL,
+                    PRIMARY KEY (FromCurrency, ToCurrency, RateDate)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """
+            ),
+        ],
+        notes="""
+One rate per currency pair and day (1 FromCurrency = Rate ToCurrency).
+fx_functions loads the table once, in primary-key order, into per-pair
+sorted arrays and answers as-of lookups in memory; no valuation query
+touches fx_rate.
+""",
+    ),
+    Migration(
+        version=7,
+        description="price_snapshot_change: write version per (SecurityID, year)",
+        steps=[
+            create_table(
+                """
+                CREATE TABLE IF NOT EXISTS price_snapshot_change (
+                    SecurityID   INT UNSIGNED      NOT NULL,
+                    SnapshotYear SMALLINT UNSIGNED NOT NULL,
+                    Version      BIGINT UNSIGNED   NOT NULL,
+                    PRIMARY KEY (SecurityID, SnapshotYear)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """
+            ),
+            _backfill_price_partitions,
+        ],
+        notes="""
+price_snapshot is not append-only: bars are upserted in place, and rolled-up
+1H/1D bars are stamped at the start of their window, behind minute bars
+that were already exported. Every price write therefore bumps the Version
+of the (SecurityID, year) it lands in, and the Parquet export rewrites the
+partitions whose Version differs from the one it last exported. The table
+holds one small row per security-year, and existing data is backfilled at
+Version 1.
+""",
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+# Representative parameterised hot queries captured by --explain
+HOT_QUERIES = [
+    (
+        "position aggregation",
+        """
+        SELECT t.SecurityID,
+               SUM(CASE WHEN t.Type = 'BUY'  THEN t.Quantity ELSE 0 END),
+               SUM(CASE WHEN t.Type = 'SELL' THEN t.Quantity ELSE 0 END),
+               SUM(CASE WHEN t.Type = 'BUY'  THEN t.Quantity * t.UnitPrice + t.Fees ELSE 0 END)
+        FROM trade t
+        WHERE t.PortfolioID = %s
+          AND t.Type IN ('BUY','SELL')
+        GROUP BY t.SecurityID
+        """,
+        "portfolio",
+    ),
+    (
+        "trade history by security",
+        """
+        SELECT t.TransactionID, t.Type, t.TradeDate, t.Quantity, t.UnitPrice
+        FROM trade t
+        WHERE t.PortfolioID = %s
+          AND t.SecurityID = %s
+        ORDER BY t.TradeDate, t.TransactionID
+        """,
+        "portfolio_security",
+    ),
+    (
+        "latest close per held security",
+        """
+        SELECT ps.SecurityID, ps.ClosePrice, ps.SnapshotTime
+        FROM price_snapshot ps
+        JOIN (
+            SELECT SecurityID, MAX(SnapshotTime) AS LastTime
+            FROM price_snapshot
+            WHERE SecurityID IN (
+                SELECT SecurityID FROM holding WHERE PortfolioID = %s AND NetQty > 0
+            )
+            GROUP BY SecurityID
+        ) latest
+            ON latest.SecurityID = ps.SecurityID
+           AND latest.LastTime = ps.SnapshotTime
+        """,
+        "portfolio",
+    ),
+    (
+        "trade history page",
+        """
+        SELECT TransactionID, SecurityID, Type, TradeDate, SettleDate,
+               Quantity, UnitPrice, Fees, TradeCurrency, Notes
+        FROM trade
+        WHERE PortfolioID = %s
+        ORDER BY TradeDate, TransactionID
+        LIMIT 100
+        """,
+        "portfolio",
+    ),
+    (
+        "dividend income buckets",
+        """
+        SELECT SecurityID, TradeCurrency, YEAR(TradeDate), MONTH(TradeDate),
+               SUM(Quantity * UnitPrice), SUM(Fees), COUNT(*)
+        FROM trade
+        WHERE PortfolioID = %s
+          AND Type = 'DIVIDEND'
+        GROUP BY SecurityID, TradeCurrency, YEAR(TradeDate), MONTH(TradeDate)
+        """,
+        "portfolio",
+    ),
+]
+
+
+# ---------- RUNNER ----------
+
+def _ensure_version_table(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            Version     INT UNSIGNED NOT NULL PRIMARY KEY,
+            Description VARCHAR(255) NOT NULL,
+            AppliedAt   DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """
+    )
+
+
+def _current_version(cursor) -> int:
+    cursor.execute("SELECT COALESCE(MAX(Version), 0) FROM schema_version")
+    return int(cursor.fetchone()[0])
+
+
+def _explain_hot_queries(cursor) -> str:
+    # Use a real portfolio/security pair so the optimizer sees realistic stats
+    cursor.execute("SELECT PortfolioID, SecurityID FROM trade LIMIT 1")
+    row = cursor.fetchone()
+    portfolio_id, security_id = row if row else (1, 1)
+
+    explain = "EXPLAIN QUERY PLAN " if backend() == "sqlite" else "EXPLAIN "
+    lines = []
+    for label, sql, params_kind in HOT_QUERIES:
+        params = (portfolio_id,) if params_kind == "portfolio" else (portfolio_id, security_id)
+        lines.append(f"-- {label}")
+        try:
+            cursor.execute(explain + sql, params)
+        except Exception as e:
+            # an older schema may lack a column the query reads (holding.NetQty
+            # before migration 1); that query simply has no "before" plan
+            lines.append(f"(not available on this schema: {e})")
+            lines.append("")
+            continue
+        headers = [d[0] for d in cursor.description]
+        lines.append(" | ".join(headers))
+        for r in cursor.fetchall():
+            lines.append(" | ".join("NULL" if v is None else str(v) for v in r))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def migration_status() -> Optional[int]:
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    try:
+        cursor = conn.cursor()
+        _ensure_version_table(cursor)
+        current = _current_version(cursor)
+        print(f"Schema version: {current} (latest: {LATEST_VERSION})")
+        for m in MIGRATIONS:
+            state = "applied" if m.version <= current else "pending"
+            print(f"  {m.version:>3}  {state:<8} {m.description}")
+        return current
+    except Exception as e:
+        print(f"[ERROR] Failed to read schema version: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def migrate(target: Optional[int] = None, explain_path: Optional[str] = None) -> bool:
+    """
+    Applies every migration above the recorded schema version, up to target
+    (default: latest). Returns True when the database ends at the target.
+    """
+    target = LATEST_VERSION if target is None else target
+
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return False
+
+    try:
+        cursor = conn.cursor()
+        _ensure_version_table(cursor)
+        current = _current_version(cursor)
+
+        pending = [m for m in MIGRATIONS if current < m.version <= target]
+        if not pending:
+            print(f"Schema is up to date (version {current}).")
+            return True
+
+        before = _explain_hot_queries(cursor) if explain_path else None
+
+        for m in pending:
+            print(f"Applying migration {m.version}: {m.description} ...")
+            for step in m.steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            cursor.execute(
+                "INSERT INTO schema_version (Version, Description) VALUES (%s, %s)",
+                (m.version, m.description)
+            )
+            conn.commit()
+
+        print(f"✅ Schema migrated from version {current} to {pending[-1].version}.")
+
+        if explain_path:
+            after = _explain_hot_queries(cursor)
+            with open(explain_path, "w", encoding="utf-8") as f:
+                for m in pending:
+                    f.write(f"== Migration {m.version}: {m.description} ==\n")
+                    f.write(m.notes.strip() + "\n\n")
+                f.write("== EXPLAIN before ==\n\n" + before + "\n")
+                f.write("== EXPLAIN after ==\n\n" + after + "\n")
+            print(f"EXPLAIN before/after written to {explain_path}.")
+
+        return True
+
+    except Exception as e:
+        print(f"[ERROR] Migration failed: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if "--status" in args:
+        migration_status()
+    else:
+        explain_file = None
+        if "--explain" in args:
+            i = args.index("--explain")
+            explain_file = args[i + 1] if i + 1 < len(args) else "migration_explain.txt"
+        ok = migrate(explain_path=explain_file)
+        sys.exit(0 if ok else 1)
@@ -0,0 +1,427 @@
+# price_cache.py
+#
+# Local on-disk cache of price_snapshot for analytics.
+#
+# One file per (IntervalCode, SecurityID) under price_cache_dir, holding the
+# bars column by column so each column can be memory-mapped as a NumPy
+# array without copying or converting anything:
+#
+#     header (64 bytes): magic, version, capacity, count
+#     time[capacity]    int64, seconds since 1970-01-01 (naive timestamps)
+#     open/high/low/close[capacity]  float64
+#     volume[capacity]  int64
+#
+# Files are allocated with spare capacity so refresh_price_cache() appends
+# new bars in place (anything newer than the last cached bar) and only
+# rewrites a file when it has to grow. index.json records count and
+# first/last bar per file, plus the price_snapshot_change Version
+# (migration 7) of every year the file covers. Bars are not only appended:
+# the resampler rewrites the current 1H/1D bar at its window start and
+# any upsert can replace an older bar. So a refresh re-reads every cached
+# year whose Version has moved since it was cached and replaces the file
+# from the start of that year.
+#
+# Readers map the first `count` rows read-only; an append never moves
+# existing rows, and a grow or re-read replaces the file atomically, so
+# open series stay valid while the cache is refreshed. One refresh at a
+# time per cache directory.
+
+import json
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from db import get_config, get_connection
+
+DEFAULT_CACHE_DIR = "price_cache"
+FETCH_CHUNK = 50_000
+IN_LIST_CHUNK = 500
+MIN_CAPACITY = 1024
+
+_MAGIC = b"PXC1"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIqq")      # magic, version, capacity, count
+_HEADER_SIZE = 64
+_COLUMNS = (
+    ("time", np.int64),
+    ("open", np.float64),
+    ("high", np.float64),
+    ("low", np.float64),
+    ("close", np.float64),
+    ("volume", np.int64),
+)
+
+PriceSeries = namedtuple("PriceSeries", ["security_id", "interval_code", "times", "open", "high", "low",
+                                         "close", "volume"])
+
+_lock = threading.Lock()
+
+
+def cache_dir() -> str:
+    return get_config().get("price_cache_dir", DEFAULT_CACHE_DIR)
+
+
+def _path(directory: str, security_id: int, interval_code: str) -> str:
+    return os.path.join(directory, interval_code, f"{security_id}.bin")
+
+
+def _read_header(path: str):
+    with open(path, "rb") as f:
+        magic, version, capacity, count = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"{path} is not a price cache file")
+    return capacity, count
+
+
+def _write_header(f, capacity: int, count: int):
+    f.seek(0)
+    f.write(_HEADER.pack(_MAGIC, _VERSION, capacity, count).ljust(_HEADER_SIZE, b"\0"))
+
+
+def _map_columns(path: str, capacity: int, count: int, mode: str = "r") -> Dict[str, np.ndarray]:
+    """Zero-copy views of the first count rows of every column."""
+    if count == 0:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in _COLUMNS}
+    out = {}
+    for i, (name, dtype) in enumerate(_COLUMNS):
+        offset = _HEADER_SIZE + i * capacity * 8
+        out[name] = np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(count,))
+    return out
+
+
+def _create(path: str, capacity: int, columns: Optional[Dict[str, np.ndarray]] = None):
+    """Writes a new file (via a temp file + rename) holding columns."""
+    count = len(columns["time"]) if columns else 0
+    tmp = path + ".tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(tmp, "wb") as f:
+        _write_header(f, capacity, count)
+        f.truncate(_HEADER_SIZE + len(_COLUMNS) * capacity * 8)
+        for i, (name, dtype) in enumerate(_COLUMNS):
+            if count:
+                f.seek(_HEADER_SIZE + i * capacity * 8)
+                f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+    os.replace(tmp, path)
+
+
+def _append(path: str, new: Dict[str, np.ndarray]) -> int:
+    """Appends rows in place, growing the file first if needed. Returns the new count."""
+    n = len(new["time"])
+    if not os.path.exists(path):
+        _create(path, max(MIN_CAPACITY, 2 * n), new)
+        return n
+
+    capacity, count = _read_header(path)
+    if count + n > capacity:
+        old = _map_columns(path, capacity, count)
+        merged = {name: np.concatenate([old[name], new[name].astype(dtype)]) for name, dtype in _COLUMNS}
+        del old
+        _create(path, max(MIN_CAPACITY, 2 * (count + n)), merged)
+        return count + n
+
+    for i, (name, dtype) in enumerate(_COLUMNS):
+        offset = _HEADER_SIZE + i * capacity * 8 + count * 8
+        mm = np.memmap(path, dtype=dtype, mode="r+", offset=offset, shape=(n,))
+        mm[:] = new[name]
+        mm.flush()
+        del mm
+    # publish the rows only after they are on disk
+    with open(path, "r+b") as f:
+        _write_header(f, capacity, count + n)
+    return count + n
+
+
+def _replace_from(path: str, cut: int, new: Dict[str, np.ndarray]) -> int:
+    """
+    Replaces every cached row at or after cut (epoch seconds) with new,
+    writing a new file. Returns the new count.
+    """
+    capacity, count = _read_header(path)
+    old = _map_columns(path, capacity, count)
+    keep = int(np.searchsorted(old["time"], cut, side="left"))
+    merged = {name: np.concatenate([old[name][:keep], new[name].astype(dtype)]) for name, dtype in _COLUMNS}
+    del old
+    n = len(merged["time"])
+    _create(path, max(MIN_CAPACITY, 2 * n), merged)
+    return n
+
+
+# ---------- INDEX ----------
+
+def _index_path(directory: str) -> str:
+    return os.path.join(directory, "index.json")
+
+
+def load_index(directory: Optional[str] = None) -> dict:
+    """"<interval>/<security_id>" -> {count, first, last, refreshed, versions}."""
+    path = _index_path(directory or cache_dir())
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_index(directory: str, index: dict):
+    os.makedirs(directory, exist_ok=True)
+    tmp = _index_path(directory) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(tmp, _index_path(directory))
+
+
+# ---------- REFRESH ----------
+
+def _to_epoch_seconds(values: list) -> np.ndarray:
+    return np.array(values, dtype="datetime64[s]").astype(np.int64)
+
+
+def _last_cached(directory: str, security_id: int, interval_code: str) -> Optional[int]:
+    path = _path(directory, security_id, interval_code)
+    if not os.path.exists(path):
+        return None
+    capacity, count = _read_header(path)
+    if count == 0:
+        return None
+    return int(_map_columns(path, capacity, count)["time"][-1])
+
+
+def _partition_versions(cursor, security_ids: List[int]) -> Dict[int, Dict[int, int]]:
+    """SecurityID -> {year: Version} from price_snapshot_change."""
+    out: Dict[int, Dict[int, int]] = {}
+    for i in range(0, len(security_ids), IN_LIST_CHUNK):
+        chunk = security_ids[i:i + IN_LIST_CHUNK]
+        cursor.execute(
+            "SELECT SecurityID, SnapshotYear, Version FROM price_snapshot_change "
+            f"WHERE SecurityID IN ({', '.join(['%s'] * len(chunk))})",
+            tuple(chunk)
+        )
+        for sid, year, version in cursor.fetchall():
+            out.setdefault(sid, {})[int(year)] = int(version)
+    return out
+
+
+def _year_start(year: int) -> int:
+    return int(np.datetime64(f"{year:04d}-01-01", "s").astype(np.int64))
+
+
+def _stream_new_bars(cursor, security_ids: List[int], interval_code: str, after: Optional[int]):
+    """Yields (security_id, columns) per security, bars ordered by time."""
+    placeholders = ", ".join(["%s"] * len(security_ids))
+    sql = f"""
+        SELECT SecurityID, SnapshotTime, OpenPrice, HighPrice, LowPrice, ClosePrice, Volume
+        FROM price_snapshot
+        WHERE SecurityID IN ({placeholders})
+          AND IntervalCode = %s
+    """
+    params = list(security_ids) + [interval_code]
+    if after is not None:
+        sql += " AND SnapshotTime > %s"
+        params.append(np.datetime64(after, "s").astype(datetime))
+    cursor.execute(sql + " ORDER BY SecurityID, SnapshotTime", tuple(params))
+
+    current, rows = None, []
+
+    def columns():
+        return {
+            "time": _to_epoch_seconds([r[1] for r in rows]),
+            "open": np.fromiter((float(r[2]) for r in rows), np.float64, len(rows)),
+            "high": np.fromiter((float(r[3]) for r in rows), np.float64, len(rows)),
+            "low": np.fromiter((float(r[4]) for r in rows), np.float64, len(rows)),
+            "close": np.fromiter((float(r[5]) for r in rows), np.float64, len(rows)),
+            "volume": np.fromiter((int(r[6]) for r in rows), np.int64, len(rows)),
+        }
+
+    while True:
+        chunk = cursor.fetchmany(FETCH_CHUNK)
+        if not chunk:
+            break
+        for row in chunk:
+            if row[0] != current:
+                if rows:
+                    yield current, columns()
+                current, rows = row[0], []
+            rows.append(row)
+        if len(rows) >= FETCH_CHUNK:
+            # keep memory bounded for very long single-security histories
+            yield current, columns()
+            rows = []
+    if rows:
+        yield current, columns()
+
+
+def refresh_price_cache(
+    security_ids: Optional[Iterable[int]] = None,
+    interval_code: str = "1D",
+    rebuild: bool = False,
+    verbose: bool = True,
+) -> Optional[dict]:
+    """
+    Brings the cache up to date with price_snapshot for the given
+    securities (default: every security with bars of interval_code):
+    years whose price_snapshot_change Version moved since they were
+    cached are re-read and replaced, and bars newer than each file's last
+    one are appended. rebuild=True discards the files and reloads them.
+    Returns stats or None on failure.
+    """
+    directory = cache_dir()
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    stats = {"securities": 0, "bars": 0, "seconds": 0.0}
+    start = time.perf_counter()
+
+    with _lock:
+        try:
+            cursor = conn.cursor()
+            if security_ids is None:
+                cursor.execute(
+                    "SELECT DISTINCT SecurityID FROM price_snapshot WHERE IntervalCode = %s",
+                    (interval_code,)
+                )
+                security_ids = [r[0] for r in cursor.fetchall()]
+            security_ids = sorted(set(security_ids))
+
+            index = load_index(directory)
+            if rebuild:
+                for sid in security_ids:
+                    path = _path(directory, sid, interval_code)
+                    if os.path.exists(path):
+                        os.remove(path)
+                    index.pop(f"{interval_code}/{sid}", None)
+
+            # read before the bars: a write that lands after this moves a
+            # Version again and is picked up by the next refresh
+            versions = _partition_versions(cursor, security_ids)
+            last = {sid: _last_cached(directory, sid, interval_code) for sid in security_ids}
+
+            # SecurityID -> start of the earliest cached year that changed
+            cut: Dict[int, int] = {}
+            for sid in security_ids:
+                if last[sid] is None:
+                    continue
+                seen = index.get(f"{interval_code}/{sid}", {}).get("versions", {})
+                last_year = np.datetime64(last[sid], "s").astype(datetime).year
+                changed = [y for y, v in versions.get(sid, {}).items()
+                           if y <= last_year and seen.get(str(y)) != v]
+                if changed:
+                    cut[sid] = _year_start(min(changed))
+
+            # Securities not cached yet are read in full, changed ones from
+            # their cut and the rest from the oldest "last bar" among them,
+            # filtering per security.
+            appended = [sid for sid in security_ids if last[sid] is not None and sid not in cut]
+            groups = [
+                ([sid for sid in security_ids if last[sid] is None], None),
+                (sorted(cut), min(cut.values()) - 1 if cut else None),
+                (appended, min((last[sid] for sid in appended), default=None)),
+            ]
+
+            touched = set()
+            for ids, after in groups:
+                for i in range(0, len(ids), IN_LIST_CHUNK):
+                    for sid, cols in _stream_new_bars(cursor, ids[i:i + IN_LIST_CHUNK], interval_code, after):
+                        path = _path(directory, sid, interval_code)
+                        since = cut[sid] if sid in cut and sid not in touched else None
+                        bound = since - 1 if since is not None else last[sid]
+                        if bound is not None:
+                            keep = cols["time"] > bound
+                            if not keep.all():
+                                cols = {k: v[keep] for k, v in cols.items()}
+                        if since is not None:
+                            # first rows from the cut replace the cached tail
+                            _replace_from(path, since, cols)
+                        elif len(cols["time"]) == 0:
+                            continue
+                        else:
+                            _append(path, cols)
+                        if len(cols["time"]):
+                            last[sid] = int(cols["time"][-1])
+                        touched.add(sid)
+                        stats["bars"] += len(cols["time"])
+
+            # changed years whose bars are all gone now
+            for sid in set(cut) - touched:
+                _replace_from(_path(directory, sid, interval_code), cut[sid],
+                              {name: np.empty(0, dtype=dtype) for name, dtype in _COLUMNS})
+                touched.add(sid)
+
+            now = datetime.now().isoformat(timespec="seconds")
+            for sid in touched:
+                path = _path(directory, sid, interval_code)
+                capacity, count = _read_header(path)
+                times = _map_columns(path, capacity, count)["time"]
+                index[f"{interval_code}/{sid}"] = {
+                    "count": count,
+                    "first": str(np.datetime64(int(times[0]), "s")) if count else None,
+                    "last": str(np.datetime64(int(times[-1]), "s")) if count else None,
+                    "refreshed": now,
+                }
+            for sid in security_ids:
+                entry = index.get(f"{interval_code}/{sid}")
+                if entry is not None:
+                    entry["versions"] = {str(y): v for y, v in versions.get(sid, {}).items()}
+            _save_index(directory, index)
+            stats["securities"] = len(touched)
+
+        except Exception as e:
+            print(f"[ERROR] Price cache refresh failed: {e}")
+            return None
+        finally:
+            cursor.close()
+            conn.close()
+
+    stats["seconds"] = time.perf_counter() - start
+    if verbose:
+        print(f"✅ Price cache: {stats['bars']:,} new bar(s) for {stats['securities']:,} "
+              f"security(ies) in {stats['seconds']:.1f}s ({directory}).")
+    return stats
+
+
+# ---------- READ ----------
+
+def open_series(security_id: int, interval_code: str = "1D",
+                directory: Optional[str] = None) -> Optional[PriceSeries]:
+    """
+    Memory-maps the cached bars of one security read-only (no copy, no
+    conversion). times is a datetime64[s] view. None if not cached.
+    """
+    path = _path(directory or cache_dir(), security_id, interval_code)
+    if not os.path.exists(path):
+        return None
+    capacity, count = _read_header(path)
+    cols = _map_columns(path, capacity, count)
+    return PriceSeries(security_id, interval_code, cols["time"].view("datetime64[s]"),
+                       cols["open"], cols["high"], cols["low"], cols["close"], cols["volume"])
+
+
+def _as_datetime64(value) -> np.datetime64:
+    if isinstance(value, datetime):
+        return np.datetime64(value, "s")
+    if isinstance(value, date):
+        return np.datetime64(datetime.combine(value, datetime.min.time()), "s")
+    return np.datetime64(value, "s")
+
+
+def slice_series(series: PriceSeries, start=None, end=None) -> PriceSeries:
+    """
+    Bars with start <= time < end (either bound optional), found by binary
+    search over the time column. The result is still a view.
+    """
+    lo = 0 if start is None else int(np.searchsorted(series.times, _as_datetime64(start), side="left"))
+    hi = len(series.times) if end is None else int(np.searchsorted(series.times, _as_datetime64(end), side="left"))
+    return PriceSeries(series.security_id, series.interval_code,
+                       *(col[lo:hi] for col in series[2:]))
+
+
+def close_before(series: PriceSeries, when) -> Optional[float]:
+    """Close of the last bar strictly before when, or None."""
+    i = int(np.searchsorted(series.times, _as_datetime64(when), side="left"))
+    return float(series.close[i - 1]) if i > 0 else None
@@ -1,117 +1,366 @@
+import csv
+import os
+import time
 from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
 from db import get_connection
+from risk_functions import invalidate_risk
+from security_cache import security_cache
+from security_functions import choose_security
 
+UPSERT_PRICE_SQL = """
+    INSERT INTO price_snapshot
+        (SecurityID, SnapshotTime, OpenPrice, HighPrice, LowPrice, ClosePrice,
+         Volume, Source, IntervalCode)
+    VALUES
+        (%s, %s, %s, %s, %s, %s,
+         %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        OpenPrice   = VALUES(OpenPrice),
+        HighPrice   = VALUES(HighPrice),
+        LowPrice    = VALUES(LowPrice),
+        ClosePrice  = VALUES(ClosePrice),
+        Volume      = VALUES(Volume),
+        Source      = VALUES(Source),
+        IntervalCode= VALUES(IntervalCode)
+"""
 
-def import_price_snapshot_manual():
+DEFAULT_BATCH_SIZE = 5000
+
+# IntervalCode rollups rebuilt by resample_functions (source -> target).
+# Writing a source-interval bar marks the target window containing it in
+# price_rollup_dirty so the next resample run only redoes touched windows.
+ROLLUPS = {"1MIN": "1H", "1H": "1D"}
+
+MARK_ROLLUP_SQL = """
+    INSERT INTO price_rollup_dirty (IntervalCode, SecurityID, WindowStart, MarkedAt)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE MarkedAt = VALUES(MarkedAt)
+"""
+
+# Every price write bumps the Version of the (SecurityID, year) partition it
+# lands in, so the Parquet export can find changed partitions whatever their
+# timestamps (rolled-up bars are stamped at the start of their window).
+MARK_PARTITION_SQL = """
+    INSERT INTO price_snapshot_change (SecurityID, SnapshotYear, Version)
+    VALUES (%s, %s, 1)
+    ON DUPLICATE KEY UPDATE Version = Version + 1
+"""
+
+# Accepted CSV header spellings (case-insensitive) for each price_snapshot field
+_CSV_COLUMNS = {
+    "ticker": ("ticker", "symbol"),
+    "exchange": ("exchange",),
+    "time": ("time", "snapshottime", "date", "datetime", "timestamp"),
+    "open": ("open", "openprice"),
+    "high": ("high", "highprice"),
+    "low": ("low", "lowprice"),
+    "close": ("close", "closeprice"),
+    "volume": ("volume",),
+    "source": ("source",),
+    "interval": ("interval", "intervalcode"),
+}
+
+
+def rollup_window_start(ts: datetime, interval_code: str) -> datetime:
+    """Start of the 1H or 1D window containing ts."""
+    if interval_code == "1H":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if interval_code == "1D":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"No rollup window for interval {interval_code}")
+
+
+def mark_rollup_windows(cursor, bars: Iterable[tuple]):
+    """
+    bars are price rows in UPSERT_PRICE_SQL order. Marks the rollup window
+    of every bar whose IntervalCode feeds a rollup; one executemany over
+    the distinct windows. The caller commits.
+    """
+    windows = set()
+    for bar in bars:
+        target = ROLLUPS.get(bar[8])
+        if target is not None:
+            windows.add((target, bar[0], rollup_window_start(bar[1], target)))
+    if not windows:
+        return
+    marked_at = time.time_ns() // 1000
+    cursor.executemany(MARK_ROLLUP_SQL, [w + (marked_at,) for w in windows])
+
+
+def mark_price_partitions(cursor, bars: Iterable[tuple]):
+    """
+    bars are price rows in UPSERT_PRICE_SQL order. Bumps the export
+    version of each distinct (SecurityID, year) they touch. The caller
+    commits.
+    """
+    partitions = sorted({(bar[0], bar[1].year) for bar in bars})
+    if partitions:
+        cursor.executemany(MARK_PARTITION_SQL, partitions)
+
+
+def save_price_snapshot(
+    security_id: int,
+    snapshot_time: datetime,
+    open_price: float,
+    high_price: float,
+    low_price: float,
+    close_price: float,
+    volume: int,
+    source: str = "Manual",
+    interval_code: str = "1D",
+) -> bool:
+    """Input-free service: upserts one OHLCV bar. Returns True on success."""
     conn = get_connection()
     if conn is None:
         print("[ERROR] Could not connect to database.")
+        return False
+
+    row = (
+        security_id,
+        snapshot_time,
+        open_price,
+        high_price,
+        low_price,
+        close_price,
+        volume,
+        source,
+        interval_code,
+    )
+
+    try:
+        cursor = conn.cursor(prepared=True)
+        cursor.execute(UPSERT_PRICE_SQL, row)
+        mark_rollup_windows(cursor, [row])
+        mark_price_partitions(cursor, [row])
+        conn.commit()
+        invalidate_risk(security_ids=[security_id])
+        return True
+
+    except Exception as e:
+        print(f"[ERROR] Failed to import price snapshot: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def import_price_snapshot_manual():
+    print("\n=== Import Price Snapshot ===")
+    security_id = choose_security(allow_create=False)
+    if security_id is None:
         return
 
+    date_str = input("Snapshot date (YYYY-MM-DD, blank = today): ").strip()
+    if date_str == "":
+        date_str = datetime.today().strftime("%Y-%m-%d")
+
     try:
-        cursor = conn.cursor()
+        snapshot_time = datetime.strptime(date_str + " 16:00:00", "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        print("Invalid date format.")
+        return
 
-        print("\n=== Import Price Snapshot ===")
-
-        cursor.execute(
-            """
-            SELECT SecurityID, Ticker, Exchange, SecType, Currency
-            FROM security
-            ORDER BY SecurityID
-            """
-        )
-        securities = cursor.fetchall()
-
-        if not securities:
-            print("No securities exist yet. Create some securities first.")
-            return
-
-        print("\nAvailable securities:")
-        for sid, ticker, exch, sec_type, curr in securities:
-            print(f"  ID={sid} | {ticker} ({sec_type}) on {exch} [{curr}]")
-
-        sec_choice = input("\nEnter SecurityID for the snapshot (or press Enter to cancel): ").strip()
-        if sec_choice == "":
-            print("Cancelled.")
-            return
-
-        try:
-            security_id = int(sec_choice)
-        except ValueError:
-            print("Invalid SecurityID.")
-            return
-
-        valid_ids = {row[0] for row in securities}
-        if security_id not in valid_ids:
-            print("That SecurityID is not in the list.")
-            return
-
-        date_str = input("Snapshot date (YYYY-MM-DD, blank = today): ").strip()
-        if date_str == "":
-            date_str = datetime.today().strftime("%Y-%m-%d")
-
-        try:
-            snapshot_time = datetime.strptime(date_str + " 16:00:00", "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            print("Invalid date format.")
-            return
-
-        try:
-            open_price = float(input("Open price: ").strip())
-            high_price = float(input("High price: ").strip())
-            low_price  = float(input("Low price: ").strip())
-            close_price = float(input("Close price: ").strip())
-        except ValueError:
-            print("One of the price inputs was invalid.")
-            return
-
-        try:
-            volume = int(input("Volume (integer): ").strip())
-        except ValueError:
-            print("Invalid volume.")
-            return
-
-        source = "Manual"
-        interval_code = "1D"
-
-        sql = """
-            INSERT INTO price_snapshot
-                (SecurityID, SnapshotTime, OpenPrice, HighPrice, LowPrice, ClosePrice,
-                 Volume, Source, IntervalCode)
-            VALUES
-                (%s, %s, %s, %s, %s, %s,
-                 %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                OpenPrice   = VALUES(OpenPrice),
-                HighPrice   = VALUES(HighPrice),
-                LowPrice    = VALUES(LowPrice),
-                ClosePrice  = VALUES(ClosePrice),
-                Volume      = VALUES(Volume),
-                Source      = VALUES(Source),
-                IntervalCode= VALUES(IntervalCode);
-        """
-
-        cursor.execute(
-            sql,
-            (
-                security_id,
-                snapshot_time,
-                open_price,
-                high_price,
-                low_price,
-                close_price,
-                volume,
-                source,
-                interval_code,
-            )
-        )
-        conn.commit()
+    try:
+        open_price = float(input("Open price: ").strip())
+        high_price = float(input("High price: ").strip())
+        low_price  = float(input("Low price: ").strip())
+        close_price = float(input("Close price: ").strip())
+    except ValueError:
+        print("One of the price inputs was invalid.")
+        return
+
+    try:
+        volume = int(input("Volume (integer): ").strip())
+    except ValueError:
+        print("Invalid volume.")
+        return
 
+    if save_price_snapshot(security_id, snapshot_time, open_price, high_price,
+                           low_price, close_price, volume):
         print(f"\n✅ Price snapshot saved for SecurityID={security_id} at {snapshot_time}.")
 
+
+# ---------- BULK CSV IMPORT ----------
+
+def _map_csv_header(header: List[str]) -> Dict[str, int]:
+    lowered = [h.strip().lower() for h in header]
+    positions = {}
+    for field, names in _CSV_COLUMNS.items():
+        for name in names:
+            if name in lowered:
+                positions[field] = lowered.index(name)
+                break
+
+    missing = [f for f in ("ticker", "time", "open", "high", "low", "close", "volume")
+               if f not in positions]
+    if missing:
+        raise ValueError(f"CSV header is missing column(s): {', '.join(missing)}")
+    return positions
+
+
+def _parse_snapshot_time(value: str) -> datetime:
+    value = value.strip()
+    if len(value) == 10:
+        # Daily bar with no time component: stamp at market close like the manual import
+        return datetime.strptime(value + " 16:00:00", "%Y-%m-%d %H:%M:%S")
+    return datetime.fromisoformat(value)
+
+
+def _iter_csv_files(path: str) -> Iterator[str]:
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(".csv"):
+                yield os.path.join(path, name)
+    else:
+        yield path
+
+
+def bulk_import_price_csv(
+    path: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    default_exchange: Optional[str] = None,
+    source: str = "CSV",
+    interval_code: str = "1D",
+    verbose: bool = True,
+) -> Optional[dict]:
+    """
+    Streams a CSV file (or every *.csv in a directory) of
+    Ticker, Exchange, Time, Open, High, Low, Close, Volume rows into
+    price_snapshot with batched ON DUPLICATE KEY upserts.
+
+    Rows are read lazily and at most batch_size rows are held in memory,
+    so file size does not matter. Each distinct ticker is resolved once
+    through the security cache; unknown tickers are skipped.
+    Source/IntervalCode columns are optional and fall back to the arguments.
+    """
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    stats = {"files": 0, "rows": 0, "written": 0, "unknown": 0, "rejected": 0, "seconds": 0.0}
+    unknown_tickers = set()
+    written_ids = set()
+    start = time.perf_counter()
+
+    try:
+        cursor = conn.cursor()
+        default_exchange = default_exchange.upper() if default_exchange else None
+        cache = security_cache()
+        resolved: Dict[Tuple[str, Optional[str]], Optional[int]] = {}
+
+        batch = []
+
+        def flush():
+            if not batch:
+                return
+            cursor.executemany(UPSERT_PRICE_SQL, batch)
+            mark_rollup_windows(cursor, batch)
+            mark_price_partitions(cursor, batch)
+            conn.commit()
+            written_ids.update(row[0] for row in batch)
+            stats["written"] += len(batch)
+            batch.clear()
+
+        for file_path in _iter_csv_files(path):
+            stats["files"] += 1
+            with open(file_path, "r", encoding="utf-8", newline="") as f:
+                reader = csv.reader(f)
+                header = next(reader, None)
+                if header is None:
+                    continue
+                cols = _map_csv_header(header)
+                i_ticker, i_time = cols["ticker"], cols["time"]
+                i_open, i_high, i_low, i_close = cols["open"], cols["high"], cols["low"], cols["close"]
+                i_volume = cols["volume"]
+                i_exch = cols.get("exchange")
+                i_source = cols.get("source")
+                i_interval = cols.get("interval")
+
+                for row in reader:
+                    if not row:
+                        continue
+                    stats["rows"] += 1
+
+                    ticker = row[i_ticker].strip().upper()
+                    exch = row[i_exch].strip().upper() if i_exch is not None else default_exchange
+                    key = (ticker, exch)
+                    if key in resolved:
+                        sid = resolved[key]
+                    else:
+                        sec = cache.find(ticker, exch)
+                        sid = resolved[key] = sec.security_id if sec else None
+                    if sid is None:
+                        stats["unknown"] += 1
+                        unknown_tickers.add(f"{ticker}:{exch}" if exch else ticker)
+                        continue
+
+                    try:
+                        batch.append((
+                            sid,
+                            _parse_snapshot_time(row[i_time]),
+                            float(row[i_open]),
+                            float(row[i_high]),
+                            float(row[i_low]),
+                            float(row[i_close]),
+                            int(float(row[i_volume])),
+                            (row[i_source].strip() if i_source is not None else "") or source,
+                            (row[i_interval].strip().upper() if i_interval is not None else "") or interval_code,
+                        ))
+                    except (ValueError, IndexError):
+                        stats["rejected"] += 1
+                        continue
+
+                    if len(batch) >= batch_size:
+                        flush()
+                        if verbose and stats["written"] % (batch_size * 20) == 0:
+                            elapsed = time.perf_counter() - start
+                            print(f"  ... {stats['written']:,} rows written "
+                                  f"({stats['written'] / elapsed:,.0f} rows/sec)")
+
+        flush()
+
     except Exception as e:
-        print(f"[ERROR] Failed to import price snapshot: {e}")
+        print(f"[ERROR] Bulk price import failed: {e}")
         conn.rollback()
+        return None
     finally:
         cursor.close()
         conn.close()
+        # earlier batches may have been committed even if a later one failed
+        if written_ids:
+            invalidate_risk(security_ids=written_ids)
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_sec"] = stats["written"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+
+    if verbose:
+        print(f"\n✅ Imported {stats['written']:,} price rows from {stats['files']} file(s) "
+              f"in {stats['seconds']:.1f}s ({stats['rows_per_sec']:,.0f} rows/sec).")
+        if stats["rejected"]:
+            print(f"[WARN] {stats['rejected']:,} malformed row(s) skipped.")
+        if stats["unknown"]:
+            sample = ", ".join(sorted(unknown_tickers)[:10])
+            print(f"[WARN] {stats['unknown']:,} row(s) skipped for unknown securities: {sample}"
+                  + (" ..." if len(unknown_tickers) > 10 else ""))
+
+    return stats
+
+
+def import_price_snapshot_csv():
+    print("\n=== Bulk Import Price Snapshots (CSV) ===")
+    print("Expected columns: Ticker, Exchange, Time, Open, High, Low, Close, Volume")
+    path = input("CSV file or directory of CSV files (or press Enter to cancel): ").strip()
+    if path == "":
+        print("Cancelled.")
+        return
+
+    if not os.path.exists(path):
+        print("That path does not exist.")
+        return
+
+    interval_code = input("Interval code for rows without one (blank = 1D): ").strip().upper() or "1D"
+    bulk_import_price_csv(path, interval_code=interval_code)
@@ -1,6 +1,15 @@
-from typing import Optional
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import List, Optional, Tuple
 
-from db import get_connection
+import numpy as np
+
+from db import get_connection, init_pool
+from fx_functions import convert, fx_rates, missing_pairs
+from holding_functions import rebuild_holdings
+from security_cache import security_cache
 
 
 def _choose_portfolio(current_user_id: int) -> Optional[int]:
@@ -82,7 +91,7 @@ def _load_portfolio_name(portfolio_id: int) -> str:
         return f"Portfolio {portfolio_id}"
 
     try:
-        cursor = conn.cursor()
+        cursor = conn.cursor(prepared=True)
         cursor.execute(
             "SELECT PortfolioName FROM portfolio WHERE PortfolioID = %s",
             (portfolio_id,)
@@ -98,60 +107,171 @@ def _load_portfolio_name(portfolio_id: int) -> str:
         conn.close()
 
 
-def _rebuild_holdings_for_portfolio(portfolio_id: int):
+def _load_positions(cursor, portfolio_id: int, open_only: bool = False) -> list:
+    """
+    Reads the incrementally maintained holding rows for a portfolio
+    (primary-key range scan) joined to the security master.
+    Returns (SecurityID, Ticker, SecType, BuyQty, SellQty, NetQty, TotalBuyCost).
+    """
+    cursor.execute(
+        f"""
+        SELECT
+            s.SecurityID,
+            s.Ticker,
+            s.SecType,
+            h.BuyQty,
+            h.SellQty,
+            h.NetQty,
+            h.TotalBuyCost
+        FROM holding h
+        JOIN security s ON h.SecurityID = s.SecurityID
+        WHERE h.PortfolioID = %s
+          AND {"h.NetQty > 0" if open_only else "h.NetQty <> 0"}
+        ORDER BY s.Ticker
+        """,
+        (portfolio_id,)
+    )
+    return cursor.fetchall()
+
+
+def _latest_closes(cursor, portfolio_ids, interval_code: Optional[str] = None) -> dict:
+    """
+    SecurityID -> (ClosePrice, SnapshotTime) of the most recent snapshot for
+    every open position in the portfolio (or list of portfolios), in a
+    single grouped-max query (the inner MAX is answered from the
+    price_snapshot primary key). With interval_code only bars of that
+    IntervalCode are considered.
+    """
+    if isinstance(portfolio_ids, int):
+        portfolio_ids = [portfolio_ids]
+    placeholders = ", ".join(["%s"] * len(portfolio_ids))
+    inner_interval = "AND IntervalCode = %s" if interval_code else ""
+    outer_interval = "WHERE ps.IntervalCode = %s" if interval_code else ""
+    params = tuple(portfolio_ids)
+    if interval_code:
+        params += (interval_code, interval_code)
+
+    cursor.execute(
+        f"""
+        SELECT ps.SecurityID, ps.ClosePrice, ps.SnapshotTime
+        FROM price_snapshot ps
+        JOIN (
+            SELECT SecurityID, MAX(SnapshotTime) AS LastTime
+            FROM price_snapshot
+            WHERE SecurityID IN (
+                SELECT SecurityID
+                FROM holding
+                WHERE PortfolioID IN ({placeholders})
+                  AND NetQty > 0
+            )
+              {inner_interval}
+            GROUP BY SecurityID
+        ) latest
+            ON latest.SecurityID = ps.SecurityID
+           AND latest.LastTime = ps.SnapshotTime
+        {outer_interval}
+        """,
+        params
+    )
+    return {sid: (float(close), snap_time) for sid, close, snap_time in cursor.fetchall()}
+
+
+def _buy_lots(cursor, portfolio_ids) -> list:
+    """
+    (PortfolioID, SecurityID, TradeCurrency, TradeDate, Cost) of every BUY
+    of an open position in the portfolio (or list of portfolios), Cost
+    being Quantity * UnitPrice + Fees as summed into holding.TotalBuyCost.
+    """
+    if isinstance(portfolio_ids, int):
+        portfolio_ids = [portfolio_ids]
+    placeholders = ", ".join(["%s"] * len(portfolio_ids))
+    cursor.execute(
+        f"""
+        SELECT t.PortfolioID, t.SecurityID, t.TradeCurrency, t.TradeDate,
+               t.Quantity * t.UnitPrice + t.Fees
+        FROM trade t
+        JOIN holding h
+            ON h.PortfolioID = t.PortfolioID
+           AND h.SecurityID = t.SecurityID
+        WHERE t.PortfolioID IN ({placeholders})
+          AND t.Type = 'BUY'
+          AND h.NetQty > 0
+        """,
+        tuple(portfolio_ids)
+    )
+    return cursor.fetchall()
+
+
+def _buy_costs_in(lots: list, to_currency) -> Tuple[dict, List[str]]:
     """
-    Rebuilds holding table for this portfolio based on BUY trades.
+    (PortfolioID, SecurityID) -> total BUY cost of the lots, each converted
+    into to_currency (one code, or a PortfolioID -> code dict) at the rate
+    in force on its TradeDate. A total is NaN if any of its rates is
+    missing; the missing pairs are returned alongside.
+    """
+    if not lots:
+        return {}, []
+    targets = np.array([to_currency if isinstance(to_currency, str) else to_currency[pid]
+                        for pid, *_ in lots], dtype=object)
+    currencies = np.array([curr for _pid, _sid, curr, _day, _cost in lots], dtype=object)
+    days = np.array([np.datetime64(day, "D") for _pid, _sid, _curr, day, _cost in lots])
+    amounts = np.array([float(cost) for *_, cost in lots])
+
+    rates = np.empty(len(lots))
+    missing = set()
+    for target in set(targets.tolist()):
+        mask = targets == target
+        rates[mask] = fx_rates().rates_to(currencies[mask], target, days[mask])
+        missing.update(missing_pairs(currencies[mask], target, rates[mask]))
+
+    totals = {}
+    for (pid, sid, *_), cost in zip(lots, amounts * rates):
+        totals[(pid, sid)] = totals.get((pid, sid), 0.0) + cost
+    return totals, sorted(missing)
+
+
+def get_holdings(portfolio_id: int) -> Optional[list]:
+    """
+    Input-free service behind holdings_report and the CLI: one dict per
+    non-zero position, or None on failure.
     """
     conn = get_connection()
     if conn is None:
-        print("[ERROR] Could not connect to database to rebuild holdings.")
-        return
+        print("[ERROR] Could not connect to database.")
+        return None
 
     try:
-        cursor = conn.cursor()
+        cursor = conn.cursor(prepared=True)
 
-        cursor.execute(
-            "DELETE FROM holding WHERE PortfolioID = %s",
-            (portfolio_id,)
-        )
+        rows = _load_positions(cursor, portfolio_id)
 
-        cursor.execute(
-            """
-            SELECT
-                t.SecurityID,
-                SUM(CASE WHEN t.Type = 'BUY' THEN t.Quantity ELSE 0 END) AS BuyQty,
-                SUM(CASE WHEN t.Type = 'BUY'
-                         THEN (t.Quantity * t.UnitPrice + t.Fees)
-                         ELSE 0 END) AS TotalBuyCost
-            FROM trade t
-            WHERE t.PortfolioID = %s
-              AND t.Type IN ('BUY','SELL')
-            GROUP BY t.SecurityID
-            """,
-            (portfolio_id,)
-        )
-        rows = cursor.fetchall()
-
-        insert_sql = """
-            INSERT INTO holding (PortfolioID, SecurityID, AvgCostBasis)
-            VALUES (%s, %s, %s)
-        """
-
-        for security_id, buy_qty, total_buy_cost in rows:
+        holdings = []
+        for sid, ticker, sec_type, buy_qty, sell_qty, net_qty, total_buy_cost in rows:
             buy_qty = float(buy_qty or 0)
-            if buy_qty <= 0:
-                continue
-
+            sell_qty = float(sell_qty or 0)
+            net_qty = float(net_qty or 0)
             total_buy_cost = float(total_buy_cost or 0.0)
-            avg_cost_basis = total_buy_cost / buy_qty
-            cursor.execute(insert_sql, (portfolio_id, security_id, avg_cost_basis))
 
-        conn.commit()
-        print("[INFO] Holding table refreshed for this portfolio based on trades.")
+            avg_cost_per_share = None
+            if buy_qty > 0:
+                avg_cost_per_share = total_buy_cost / buy_qty
+
+            holdings.append(
+                {
+                    "SecurityID": sid,
+                    "Ticker": ticker,
+                    "SecType": sec_type,
+                    "BuyQty": buy_qty,
+                    "SellQty": sell_qty,
+                    "NetQty": net_qty,
+                    "AvgCost": avg_cost_per_share,
+                }
+            )
+        return holdings
 
     except Exception as e:
-        print(f"[ERROR] Failed to rebuild holdings table: {e}")
-        conn.rollback()
+        print(f"[ERROR] Failed to generate holdings report: {e}")
+        return None
     finally:
         cursor.close()
         conn.close()
@@ -162,125 +282,75 @@ def holdings_report(current_user_id: int):
     if portfolio_id is None:
         return
 
-    _rebuild_holdings_for_portfolio(portfolio_id)
-
-    conn = get_connection()
-    if conn is None:
-        print("[ERROR] Could not connect to database.")
+    holdings = get_holdings(portfolio_id)
+    if holdings is None:
         return
 
-    try:
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            SELECT
-                s.SecurityID,
-                s.Ticker,
-                s.SecType,
-                SUM(CASE WHEN t.Type = 'BUY'  THEN t.Quantity ELSE 0 END) AS BuyQty,
-                SUM(CASE WHEN t.Type = 'SELL' THEN t.Quantity ELSE 0 END) AS SellQty,
-                SUM(CASE WHEN t.Type = 'BUY'
-                         THEN (t.Quantity * t.UnitPrice + t.Fees)
-                         ELSE 0 END) AS TotalBuyCost
-            FROM trade t
-            JOIN security s ON t.SecurityID = s.SecurityID
-            WHERE t.PortfolioID = %s
-              AND t.Type IN ('BUY','SELL')
-            GROUP BY s.SecurityID, s.Ticker, s.SecType
-            """,
-            (portfolio_id,)
-        )
-        rows = cursor.fetchall()
-
-        holdings = []
-        for sid, ticker, sec_type, buy_qty, sell_qty, total_buy_cost in rows:
-            buy_qty = float(buy_qty or 0)
-            sell_qty = float(sell_qty or 0)
-            total_buy_cost = float(total_buy_cost or 0.0)
-
-            net_qty = buy_qty - sell_qty
-            if net_qty == 0:
-                continue
-
-            avg_cost_per_share = None
-            if buy_qty > 0:
-                avg_cost_per_share = total_buy_cost / buy_qty
-
-            holdings.append(
-                (sid, ticker, sec_type, buy_qty, sell_qty, net_qty, avg_cost_per_share)
-            )
-
-        if not holdings:
-            print("\nNo open positions (net quantity) found for this portfolio.")
-            return
-
-        pname = _load_portfolio_name(portfolio_id)
-        print(f"\n=== Holdings Report for {pname} (ID={portfolio_id}) ===")
-        print(f"{'Ticker':<8} {'Type':<8} {'BuyQty':>8} {'SellQty':>8} {'NetQty':>8} {'AvgCost':>12}")
-        print("-" * 60)
+    if not holdings:
+        print("\nNo open positions (net quantity) found for this portfolio.")
+        return
 
-        for sid, ticker, sec_type, buy_qty, sell_qty, net_qty, avg_cost in holdings:
-            avg_cost_str = f"{avg_cost:.2f}" if avg_cost is not None else "N/A"
-            print(f"{ticker:<8} {sec_type:<8} {buy_qty:>8.2f} {sell_qty:>8.2f} {net_qty:>8.2f} {avg_cost_str:>12}")
+    pname = _load_portfolio_name(portfolio_id)
+    print(f"\n=== Holdings Report for {pname} (ID={portfolio_id}) ===")
+    print(f"{'Ticker':<8} {'Type':<8} {'BuyQty':>8} {'SellQty':>8} {'NetQty':>8} {'AvgCost':>12}")
+    print("-" * 60)
 
-        print("-" * 60)
-        print("End of holdings report.")
+    for h in holdings:
+        avg_cost_str = f"{h['AvgCost']:.2f}" if h["AvgCost"] is not None else "N/A"
+        print(f"{h['Ticker']:<8} {h['SecType']:<8} {h['BuyQty']:>8.2f} {h['SellQty']:>8.2f} "
+              f"{h['NetQty']:>8.2f} {avg_cost_str:>12}")
 
-    except Exception as e:
-        print(f"[ERROR] Failed to generate holdings report: {e}")
-    finally:
-        cursor.close()
-        conn.close()
+    print("-" * 60)
+    print("End of holdings report.")
 
 
-def portfolio_snapshot_value(current_user_id: int):
-
+def repair_holdings(current_user_id: int):
     portfolio_id = _choose_portfolio(current_user_id)
     if portfolio_id is None:
         return
 
+    rebuild_holdings(portfolio_id)
+
+
+def get_portfolio_snapshot(portfolio_id: int, interval_code: Optional[str] = None) -> Optional[dict]:
+    """
+    Input-free service behind portfolio_snapshot_value and the CLI.
+    Values every open position at its latest close (of any bar, or only
+    interval_code bars) and returns the totals plus a "Positions" list
+    sorted by market value, or None on failure.
+
+    Per-position amounts are in the security's currency. MarketValueBase
+    is converted into the portfolio's BaseCurrency at the FX rate in force
+    on the day of the position's close, and OpenCostBasisBase from each
+    buy's TradeCurrency at the rate on its TradeDate, so the base-currency
+    P&L includes the currency move since purchase. Positions with a missing
+    rate are left out of the totals and their pairs listed in "MissingFx".
+    """
     conn = get_connection()
     if conn is None:
         print("[ERROR] Could not connect to database.")
-        return
+        return None
 
     try:
-        cursor = conn.cursor()
+        cursor = conn.cursor(prepared=True)
 
-        # 1) Aggregate trades into positions
-        cursor.execute(
-            """
-            SELECT
-                s.SecurityID,
-                s.Ticker,
-                s.SecType,
-                SUM(CASE WHEN t.Type = 'BUY'  THEN t.Quantity ELSE 0 END) AS BuyQty,
-                SUM(CASE WHEN t.Type = 'SELL' THEN t.Quantity ELSE 0 END) AS SellQty,
-                SUM(CASE WHEN t.Type = 'BUY'
-                         THEN (t.Quantity * t.UnitPrice + t.Fees)
-                         ELSE 0 END) AS TotalBuyCost
-            FROM trade t
-            JOIN security s ON t.SecurityID = s.SecurityID
-            WHERE t.PortfolioID = %s
-              AND t.Type IN ('BUY','SELL')
-            GROUP BY s.SecurityID, s.Ticker, s.SecType
-            """,
-            (portfolio_id,)
-        )
-        rows = cursor.fetchall()
+        cursor.execute("SELECT BaseCurrency FROM portfolio WHERE PortfolioID = %s", (portfolio_id,))
+        row = cursor.fetchone()
+        if row is None:
+            print(f"[ERROR] Portfolio {portfolio_id} not found.")
+            return None
+        base_currency = row[0]
+
+        # 1) Open positions straight from the maintained holding table
+        rows = _load_positions(cursor, portfolio_id, open_only=True)
 
         holdings = []
-        for sid, ticker, sec_type, buy_qty, sell_qty, total_buy_cost in rows:
+        for sid, ticker, sec_type, buy_qty, sell_qty, net_qty, total_buy_cost in rows:
             buy_qty = float(buy_qty or 0)
             sell_qty = float(sell_qty or 0)
+            net_qty = float(net_qty or 0)
             total_buy_cost = float(total_buy_cost or 0.0)
 
-            net_qty = buy_qty - sell_qty
-            if net_qty <= 0:
-                # no open position
-                continue
-
             avg_cost_per_share = None
             open_cost_basis = 0.0
             if buy_qty > 0:
@@ -301,36 +371,15 @@ def portfolio_snapshot_value(current_user_id: int):
                 }
             )
 
-        if not holdings:
-            print("\nNo open positions (net quantity) found for this portfolio.")
-            return
-
-        # 2) Pull latest prices and compute values / P&L based on OPEN cost basis
-        total_invested = 0.0      # sum of open cost basis
-        total_market_value = 0.0
+        # 2) Pull latest prices for every held security in one query and
+        #    compute values / P&L based on OPEN cost basis
+        latest = _latest_closes(cursor, portfolio_id, interval_code) if holdings else {}
 
         for h in holdings:
-            sid = h["SecurityID"]
-
-            cursor.execute(
-                """
-                SELECT ClosePrice, SnapshotTime
-                FROM price_snapshot
-                WHERE SecurityID = %s
-                ORDER BY SnapshotTime DESC
-                LIMIT 1
-                """,
-                (sid,)
-            )
-            price_row = cursor.fetchone()
-            if price_row:
-                last_price, snap_time = price_row
-                last_price = float(last_price)
-            else:
-                last_price, snap_time = None, None
+            last_price, snap_time = latest.get(h["SecurityID"], (None, None))
 
-            net_qty = float(h["NetQty"])
-            open_cost_basis = float(h["OpenCostBasis"])
+            net_qty = h["NetQty"]
+            open_cost_basis = h["OpenCostBasis"]
 
             if last_price is not None:
                 market_value = net_qty * last_price
@@ -340,51 +389,373 @@ def portfolio_snapshot_value(current_user_id: int):
             unrealized_pl = market_value - open_cost_basis
             unrealized_pl_pct = (unrealized_pl / open_cost_basis * 100.0) if open_cost_basis > 0 else 0.0
 
-            total_invested += open_cost_basis
-            total_market_value += market_value
-
             h["LastPrice"] = last_price
             h["SnapshotTime"] = snap_time
             h["MarketValue"] = market_value
             h["UnrealizedPL"] = unrealized_pl
             h["UnrealizedPLPct"] = unrealized_pl_pct
 
+        # 3) Convert every position into the base currency at once: market
+        #    values at the rate in force when the close was taken, cost at
+        #    the rate of each buy's TradeDate
+        info = security_cache().get_many(h["SecurityID"] for h in holdings)
+        currencies = [info[h["SecurityID"]].currency if h["SecurityID"] in info else base_currency
+                      for h in holdings]
+        today = date.today()
+        as_of = [h["SnapshotTime"] or today for h in holdings]
+        market_values, rates = convert([h["MarketValue"] for h in holdings], currencies, base_currency, as_of)
+        buy_costs, missing = _buy_costs_in(_buy_lots(cursor, portfolio_id) if holdings else [], base_currency)
+        open_costs = np.array(
+            [buy_costs.get((portfolio_id, h["SecurityID"]), 0.0) / h["BuyQty"] * h["NetQty"] if h["BuyQty"] > 0 else 0.0
+             for h in holdings],
+            dtype=np.float64,
+        )
+        known = ~np.isnan(rates) & ~np.isnan(open_costs)
+
+        for h, curr, rate, mv, cost, ok in zip(holdings, currencies, rates, market_values, open_costs, known):
+            h["Currency"] = curr
+            h["FxRate"] = float(rate) if not np.isnan(rate) else None
+            h["MarketValueBase"] = float(mv) if ok else None
+            h["OpenCostBasisBase"] = float(cost) if ok else None
+
+        total_invested = float(open_costs[known].sum())      # sum of open cost basis
+        total_market_value = float(market_values[known].sum())
         total_unrealized_pl = total_market_value - total_invested
         total_unrealized_pl_pct = (total_unrealized_pl / total_invested * 100.0) if total_invested > 0 else 0.0
 
-        pname = _load_portfolio_name(portfolio_id)
-        print(f"\n=== Portfolio Snapshot for {pname} (ID={portfolio_id}) ===")
-        print(f"Total Invested        : {total_invested:,.2f}")
-        print(f"Total Market Value    : {total_market_value:,.2f}")
-        print(f"Unrealized P/L        : {total_unrealized_pl:,.2f} ({total_unrealized_pl_pct:+.2f}%)")
-        print("-" * 70)
-        print(f"{'Ticker':<8} {'Type':<8} {'Shares':>8} {'AvgCost':>10} {'Last':>10} {'MktValue':>12} {'Unrlzd P/L':>12}")
-        print("-" * 70)
+        return {
+            "PortfolioID": portfolio_id,
+            "BaseCurrency": base_currency,
+            "TotalInvested": total_invested,
+            "TotalMarketValue": total_market_value,
+            "UnrealizedPL": total_unrealized_pl,
+            "UnrealizedPLPct": total_unrealized_pl_pct,
+            "MissingFx": sorted(set(missing_pairs(currencies, base_currency, rates)) | set(missing)),
+            "Positions": sorted(holdings, key=lambda h: h["MarketValueBase"] or 0.0, reverse=True),
+        }
 
-        holdings_sorted = sorted(holdings, key=lambda h: h["MarketValue"], reverse=True)
+    except Exception as e:
+        print(f"[ERROR] Failed to compute portfolio snapshot value: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
 
-        for h in holdings_sorted:
-            ticker = h["Ticker"]
-            sec_type = h["SecType"]
-            net_qty = h["NetQty"]
-            avg_cost = h["AvgCost"]
-            last_price = h["LastPrice"]
-            mkt_val = h["MarketValue"]
-            pl = h["UnrealizedPL"]
 
-            avg_cost_str = f"{avg_cost:.2f}" if avg_cost is not None else "N/A"
-            last_price_str = f"{last_price:.2f}" if last_price is not None else "N/A"
-            mkt_val_str = f"{mkt_val:,.2f}"
-            pl_str = f"{pl:,.2f}"
+def portfolio_snapshot_value(current_user_id: int):
+
+    portfolio_id = _choose_portfolio(current_user_id)
+    if portfolio_id is None:
+        return
+
+    snap = get_portfolio_snapshot(portfolio_id)
+    if snap is None:
+        return
+
+    if not snap["Positions"]:
+        print("\nNo open positions (net quantity) found for this portfolio.")
+        return
+
+    pname = _load_portfolio_name(portfolio_id)
+    print(f"\n=== Portfolio Snapshot for {pname} (ID={portfolio_id}) ===")
+    base = snap["BaseCurrency"]
+    print(f"Total Invested        : {snap['TotalInvested']:,.2f} {base}")
+    print(f"Total Market Value    : {snap['TotalMarketValue']:,.2f} {base}")
+    print(f"Unrealized P/L        : {snap['UnrealizedPL']:,.2f} {base} ({snap['UnrealizedPLPct']:+.2f}%)")
+    print("-" * 84)
+    print(f"{'Ticker':<8} {'Type':<8} {'Curr':<5} {'Shares':>8} {'AvgCost':>10} {'Last':>10} "
+          f"{'MktValue':>12} {'Unrlzd P/L':>12} {'MktVal ' + base:>12}")
+    print("-" * 84)
+
+    for h in snap["Positions"]:
+        ticker = h["Ticker"]
+        sec_type = h["SecType"]
+        net_qty = h["NetQty"]
+        avg_cost = h["AvgCost"]
+        last_price = h["LastPrice"]
+        mkt_val = h["MarketValue"]
+        pl = h["UnrealizedPL"]
+        mkt_val_base = h["MarketValueBase"]
+
+        avg_cost_str = f"{avg_cost:.2f}" if avg_cost is not None else "N/A"
+        last_price_str = f"{last_price:.2f}" if last_price is not None else "N/A"
+        mkt_val_str = f"{mkt_val:,.2f}"
+        pl_str = f"{pl:,.2f}"
+        mkt_val_base_str = f"{mkt_val_base:,.2f}" if mkt_val_base is not None else "N/A"
+
+        print(f"{ticker:<8} {sec_type:<8} {h['Currency']:<5} {net_qty:>8.2f} {avg_cost_str:>10} "
+              f"{last_price_str:>10} {mkt_val_str:>12} {pl_str:>12} {mkt_val_base_str:>12}")
+
+    print("-" * 84)
+    if snap["MissingFx"]:
+        print(f"[WARN] No FX rate for {', '.join(snap['MissingFx'])}; those positions are not in the totals.")
+    print("✅ End of snapshot.")
+
+
+# ---------- CONSOLIDATED (MULTI-PORTFOLIO) VALUATION ----------
+
+CONSOLIDATION_CHUNK = 10   # portfolios valued per worker before fanning out
+
+
+def _value_portfolio_chunk(portfolio_ids: List[int], interval_code: Optional[str] = None,
+                           with_costs: bool = True) -> Tuple[list, list]:
+    """
+    Values open positions for a group of portfolios on one pooled
+    connection: one holding/security query, one latest-close query and one
+    query for the buys of the open positions (skipped without with_costs),
+    regardless of how many portfolios are in the group.
+    Returns ([(PortfolioID, SecurityID, Ticker, NetQty, BuyQty, LastPrice,
+    SnapshotTime)], _buy_lots rows).
+    """
+    conn = get_connection()
+    if conn is None:
+        raise RuntimeError("Could not connect to database.")
+
+    try:
+        cursor = conn.cursor()
+        placeholders = ", ".join(["%s"] * len(portfolio_ids))
+        cursor.execute(
+            f"""
+            SELECT h.PortfolioID, h.SecurityID, s.Ticker, h.NetQty, h.BuyQty, h.TotalBuyCost
+            FROM holding h
+            JOIN security s ON h.SecurityID = s.SecurityID
+            WHERE h.PortfolioID IN ({placeholders})
+              AND h.NetQty > 0
+            """,
+            tuple(portfolio_ids)
+        )
+        rows = cursor.fetchall()
+        latest = _latest_closes(cursor, portfolio_ids, interval_code) if rows else {}
+        lots = _buy_lots(cursor, portfolio_ids) if rows and with_costs else []
+
+        out = []
+        for pid, sid, ticker, net_qty, buy_qty, _total_buy_cost in rows:
+            last_price, snap_time = latest.get(sid, (None, None))
+            out.append((pid, sid, ticker, float(net_qty), float(buy_qty or 0), last_price, snap_time))
+        return out, lots
+    finally:
+        cursor.close()
+        conn.close()
+
 
-            print(f"{ticker:<8} {sec_type:<8} {net_qty:>8.2f} {avg_cost_str:>10} {last_price_str:>10} {mkt_val_str:>12} {pl_str:>12}")
+def _totals(invested: float, market_value: float) -> dict:
+    pl = market_value - invested
+    return {
+        "TotalInvested": invested,
+        "TotalMarketValue": market_value,
+        "UnrealizedPL": pl,
+        "UnrealizedPLPct": (pl / invested * 100.0) if invested > 0 else 0.0,
+    }
 
-        print("-" * 70)
-        print("✅ End of snapshot.")
 
+def get_consolidated_valuation(
+    user_id: int,
+    account_id: Optional[int] = None,
+    workers: Optional[int] = None,
+    interval_code: Optional[str] = None,
+    currency: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    Values every portfolio a user owns (optionally only those managed by one
+    brokerage AccountID) and returns consolidated totals plus per-account,
+    per-portfolio and per-security breakdowns.
+
+    Portfolio rows are in each portfolio's BaseCurrency; totals, accounts
+    and securities are in `currency` (default the BaseCurrency most of the
+    portfolios share). Market values are converted at the FX rate in force
+    on the day of their close and cost at the rate of each buy's TradeDate;
+    positions with a missing rate are left out and their pairs listed in
+    "MissingFx".
+
+    Portfolios are valued in groups of CONSOLIDATION_CHUNK with three
+    set-based queries per group; groups run concurrently on separate
+    pooled connections (at most `workers`, default the pool size).
+    """
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    try:
+        cursor = conn.cursor()
+        sql = """
+            SELECT p.PortfolioID, p.PortfolioName, p.BaseCurrency,
+                   p.ManagedByAccountID, b.BrokerageName, b.Nickname
+            FROM portfolio p
+            LEFT JOIN brokerage_account b
+                ON p.ManagedByAccountID = b.AccountID
+            WHERE p.OwnerUserID = %s
+        """
+        params = [user_id]
+        if account_id is not None:
+            sql += " AND p.ManagedByAccountID = %s"
+            params.append(account_id)
+        cursor.execute(sql + " ORDER BY p.PortfolioID", tuple(params))
+        portfolios = cursor.fetchall()
     except Exception as e:
-        print(f"[ERROR] Failed to compute portfolio snapshot value: {e}")
+        print(f"[ERROR] Failed to list portfolios: {e}")
+        return None
     finally:
         cursor.close()
         conn.close()
 
+    ids = [row[0] for row in portfolios]
+    chunks = [ids[i:i + CONSOLIDATION_CHUNK] for i in range(0, len(ids), CONSOLIDATION_CHUNK)]
+
+    try:
+        if len(chunks) <= 1:
+            results = [_value_portfolio_chunk(c, interval_code) for c in chunks]
+        else:
+            max_workers = min(len(chunks), workers or init_pool().size)
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                # each task runs in a copy of this context, so the SQL it
+                # issues is profiled under the caller's action
+                futures = [pool.submit(contextvars.copy_context().run, _value_portfolio_chunk, c, interval_code)
+                           for c in chunks]
+                results = [f.result() for f in futures]
+    except Exception as e:
+        print(f"[ERROR] Failed to compute consolidated valuation: {e}")
+        return None
+
+    per_portfolio = {
+        pid: {"PortfolioID": pid, "PortfolioName": name, "BaseCurrency": curr,
+              "AccountID": acc_id, "Positions": 0, "_inv": 0.0, "_mv": 0.0}
+        for pid, name, curr, acc_id, _broker, _nick in portfolios
+    }
+    account_names = {
+        acc_id: (f"{broker} '{nick}'" if nick else broker) if acc_id is not None else "Unlinked"
+        for _pid, _name, _curr, acc_id, broker, nick in portfolios
+    }
+    if currency is None:
+        bases = Counter(curr for _pid, _name, curr, _acc, _broker, _nick in portfolios)
+        currency = bases.most_common(1)[0][0] if bases else "USD"
+    currency = currency.upper()
+
+    # Flatten every position so the FX conversions run once over all of them
+    positions = [row for chunk, _lots in results for row in chunk]
+    lots = [lot for _chunk, chunk_lots in results for lot in chunk_lots]
+    info = security_cache().get_many({row[1] for row in positions})
+    currencies = [info[row[1]].currency if row[1] in info else per_portfolio[row[0]]["BaseCurrency"]
+                  for row in positions]
+    today = date.today()
+    as_of = [row[6] or today for row in positions]
+    local_mv = np.array([row[3] * row[5] if row[5] is not None else 0.0 for row in positions])
+    # share of each position's buys still held
+    open_share = np.array([row[3] / row[4] if row[4] > 0 else 0.0 for row in positions])
+
+    def open_costs(to_currency):
+        costs, lot_missing = _buy_costs_in(lots, to_currency)
+        missing.update(lot_missing)
+        return np.array([costs.get((row[0], row[1]), 0.0) for row in positions]) * open_share
+
+    def known_only(values, rates, costs):
+        known = ~np.isnan(rates) & ~np.isnan(costs)
+        return np.where(known, values * rates, 0.0), np.where(known, costs, 0.0)
+
+    # into the report currency ...
+    rates = fx_rates().rates_to(currencies, currency, as_of)
+    missing = set(missing_pairs(currencies, currency, rates))
+    mv, inv = known_only(local_mv, rates, open_costs(currency))
+
+    # ... and into each portfolio's own BaseCurrency, one pass per currency
+    base_rates = np.empty(len(positions))
+    pbase = np.array([per_portfolio[row[0]]["BaseCurrency"] for row in positions], dtype=object)
+    cur_arr = np.array(currencies, dtype=object)
+    days_arr = np.array(as_of, dtype="datetime64[D]")
+    for base in set(pbase.tolist()):
+        mask = pbase == base
+        base_rates[mask] = fx_rates().rates_to(cur_arr[mask], base, days_arr[mask])
+        missing.update(missing_pairs(cur_arr[mask], base, base_rates[mask]))
+    base_mv, base_inv = known_only(
+        local_mv, base_rates, open_costs({pid: p["BaseCurrency"] for pid, p in per_portfolio.items()})
+    )
+
+    per_account = {}
+    for p in per_portfolio.values():
+        a = per_account.setdefault(
+            p["AccountID"], {"AccountID": p["AccountID"], "AccountName": account_names[p["AccountID"]],
+                             "Portfolios": 0, "_inv": 0.0, "_mv": 0.0}
+        )
+        a["Portfolios"] += 1
+
+    per_security = {}
+    for i, (pid, sid, ticker, net_qty, _buy_qty, last_price, _snap_time) in enumerate(positions):
+        p = per_portfolio[pid]
+        p["Positions"] += 1
+        p["_inv"] += base_inv[i]
+        p["_mv"] += base_mv[i]
+
+        a = per_account[p["AccountID"]]
+        a["_inv"] += inv[i]
+        a["_mv"] += mv[i]
+
+        sec = per_security.setdefault(
+            sid, {"SecurityID": sid, "Ticker": ticker, "Currency": currencies[i], "NetQty": 0.0,
+                  "LastPrice": last_price, "_inv": 0.0, "_mv": 0.0}
+        )
+        sec["NetQty"] += net_qty
+        sec["_inv"] += inv[i]
+        sec["_mv"] += mv[i]
+
+    def finish(items):
+        out = []
+        for item in items:
+            inv, mv = item.pop("_inv"), item.pop("_mv")
+            item.update(_totals(float(inv), float(mv)))
+            out.append(item)
+        return sorted(out, key=lambda x: x["TotalMarketValue"], reverse=True)
+
+    total_inv = float(inv.sum())
+    total_mv = float(mv.sum())
+
+    result = {"UserID": user_id, "AccountID": account_id, "PortfolioCount": len(ids), "Currency": currency}
+    result.update(_totals(total_inv, total_mv))
+    result["MissingFx"] = sorted(missing)
+    result["Accounts"] = finish(per_account.values())
+    result["Portfolios"] = finish(per_portfolio.values())
+    result["Securities"] = finish(per_security.values())
+    return result
+
+
+def consolidated_valuation(current_user_id: int):
+    print("\n=== Consolidated Valuation ===")
+    acc_str = input("AccountID to restrict to (blank = all your portfolios): ").strip()
+    account_id = None
+    if acc_str:
+        try:
+            account_id = int(acc_str)
+        except ValueError:
+            print("Invalid AccountID.")
+            return
+
+    result = get_consolidated_valuation(current_user_id, account_id)
+    if result is None:
+        return
+
+    if not result["PortfolioCount"]:
+        print("No portfolios found.")
+        return
+
+    curr = result["Currency"]
+    print(f"Portfolios            : {result['PortfolioCount']}")
+    print(f"Total Invested        : {result['TotalInvested']:,.2f} {curr}")
+    print(f"Total Market Value    : {result['TotalMarketValue']:,.2f} {curr}")
+    print(f"Unrealized P/L        : {result['UnrealizedPL']:,.2f} {curr} ({result['UnrealizedPLPct']:+.2f}%)")
+
+    print(f"\nBy account ({curr}):")
+    print(f"{'Account':<30} {'Portfolios':>10} {'MktValue':>14} {'Unrlzd P/L':>14}")
+    print("-" * 70)
+    for a in result["Accounts"]:
+        print(f"{str(a['AccountName'])[:30]:<30} {a['Portfolios']:>10} "
+              f"{a['TotalMarketValue']:>14,.2f} {a['UnrealizedPL']:>14,.2f}")
+
+    print("\nBy portfolio (in its base currency):")
+    print(f"{'ID':>5} {'Portfolio':<24} {'Pos':>5} {'Curr':<5} {'MktValue':>14} {'Unrlzd P/L':>14}")
+    print("-" * 76)
+    for p in result["Portfolios"]:
+        print(f"{p['PortfolioID']:>5} {p['PortfolioName'][:24]:<24} {p['Positions']:>5} {p['BaseCurrency']:<5} "
+              f"{p['TotalMarketValue']:>14,.2f} {p['UnrealizedPL']:>14,.2f}")
+    print("-" * 76)
+    if result["MissingFx"]:
+        print(f"[WARN] No FX rate for {', '.join(result['MissingFx'])}; those positions are not in the totals.")
+    print("✅ End of consolidated valuation.")
@@ -0,0 +1,199 @@
+# resample_functions.py
+#
+# Derived OHLCV bars. 1MIN bars are rolled up into 1H bars and 1H bars into
+# 1D bars (open = first, high = max, low = min, close = last, volume = sum)
+# and written back to price_snapshot with Source 'ROLLUP', so reports can
+# ask for a coarse IntervalCode and read a compact series.
+#
+# Runs are incremental: every price write marks the rollup window it falls
+# in (price_functions.mark_rollup_windows), a run rebuilds only the marked
+# windows, and the 1H bars it writes mark their days for the 1D pass.
+# Windows are stamped with their start (10:00 for 10:00-10:59, 00:00 for
+# the day) in the timestamps' own time zone.
+
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from db import get_connection
+from price_functions import (
+    DEFAULT_BATCH_SIZE, ROLLUPS, UPSERT_PRICE_SQL, mark_price_partitions, mark_rollup_windows,
+    rollup_window_start,
+)
+from risk_functions import invalidate_risk
+
+ROLLUP_SOURCE = "ROLLUP"
+FETCH_CHUNK = 50_000
+WINDOW_SPAN = {"1H": timedelta(hours=1), "1D": timedelta(days=1)}
+
+
+def aggregate_bars(
+    rows: Iterator[tuple],
+    target: str,
+    windows: Optional[Dict[datetime, int]] = None,
+) -> Iterator[tuple]:
+    """
+    rows are time-ordered (SnapshotTime, Open, High, Low, Close, Volume)
+    for one security. Yields (WindowStart, Open, High, Low, Close, Volume)
+    per target window, only for windows in `windows` when given.
+    """
+    current = None
+    for ts, o, h, low, c, v in rows:
+        start = rollup_window_start(ts, target)
+        if current is None or start != current[0]:
+            if current is not None and (windows is None or current[0] in windows):
+                yield tuple(current)
+            current = [start, float(o), float(h), float(low), float(c), int(v)]
+        else:
+            if float(h) > current[2]:
+                current[2] = float(h)
+            if float(low) < current[3]:
+                current[3] = float(low)
+            current[4] = float(c)
+            current[5] += int(v)
+    if current is not None and (windows is None or current[0] in windows):
+        yield tuple(current)
+
+
+def _contiguous_ranges(starts: List[datetime], span: timedelta) -> List[Tuple[datetime, datetime]]:
+    """Sorted window starts -> [lo, hi) ranges covering runs of adjacent windows."""
+    ranges = []
+    for start in starts:
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], start + span)
+        else:
+            ranges.append([start, start + span])
+    return [(lo, hi) for lo, hi in ranges]
+
+
+def _read_bars(cursor, security_id: int, interval_code: str,
+               lo: Optional[datetime] = None, hi: Optional[datetime] = None) -> Iterator[tuple]:
+    sql = """
+        SELECT SnapshotTime, OpenPrice, HighPrice, LowPrice, ClosePrice, Volume
+        FROM price_snapshot
+        WHERE SecurityID = %s
+          AND IntervalCode = %s
+    """
+    params = [security_id, interval_code]
+    if lo is not None:
+        sql += " AND SnapshotTime >= %s AND SnapshotTime < %s"
+        params += [lo, hi]
+    cursor.execute(sql + " ORDER BY SnapshotTime", tuple(params))
+    while True:
+        chunk = cursor.fetchmany(FETCH_CHUNK)
+        if not chunk:
+            break
+        yield from chunk
+
+
+def _roll_interval(conn, cursor, source: str, target: str, full: bool,
+                   security_id: Optional[int]) -> dict:
+    """One pass source -> target, committing per security."""
+    stats = {"securities": 0, "windows": 0, "bars": 0}
+
+    sid_sql = " AND SecurityID = %s" if security_id is not None else ""
+    sid_params = (security_id,) if security_id is not None else ()
+
+    # SecurityID -> {WindowStart: MarkedAt}, or None for "every window"
+    work: Dict[int, Optional[Dict[datetime, int]]] = {}
+    if full:
+        cursor.execute(
+            "SELECT DISTINCT SecurityID FROM price_snapshot WHERE IntervalCode = %s" + sid_sql,
+            (source,) + sid_params
+        )
+        work = {sid: None for (sid,) in cursor.fetchall()}
+    else:
+        cursor.execute(
+            "SELECT SecurityID, WindowStart, MarkedAt FROM price_rollup_dirty "
+            "WHERE IntervalCode = %s" + sid_sql + " ORDER BY SecurityID, WindowStart",
+            (target,) + sid_params
+        )
+        for sid, start, marked_at in cursor.fetchall():
+            work.setdefault(sid, {})[start] = marked_at
+
+    span = WINDOW_SPAN[target]
+    for sid, windows in work.items():
+        # a full rebuild covers every mark made before its read started,
+        # including the ones the previous pass of this run just wrote
+        read_started = time.time_ns() // 1000
+        if windows is None:
+            bars = list(aggregate_bars(_read_bars(cursor, sid, source), target))
+        else:
+            bars = []
+            for lo, hi in _contiguous_ranges(sorted(windows), span):
+                bars.extend(aggregate_bars(_read_bars(cursor, sid, source, lo, hi), target, windows))
+
+        rows = [(sid, start, o, h, low, c, v, ROLLUP_SOURCE, target) for start, o, h, low, c, v in bars]
+        for i in range(0, len(rows), DEFAULT_BATCH_SIZE):
+            cursor.executemany(UPSERT_PRICE_SQL, rows[i:i + DEFAULT_BATCH_SIZE])
+        # 1H bars written here mark their days for the 1D pass
+        mark_rollup_windows(cursor, rows)
+        mark_price_partitions(cursor, rows)
+
+        if windows is None:
+            cursor.execute(
+                "DELETE FROM price_rollup_dirty "
+                "WHERE IntervalCode = %s AND SecurityID = %s AND MarkedAt <= %s",
+                (target, sid, read_started)
+            )
+        else:
+            # a window re-marked while we worked keeps its newer mark
+            cursor.executemany(
+                "DELETE FROM price_rollup_dirty "
+                "WHERE IntervalCode = %s AND SecurityID = %s AND WindowStart = %s AND MarkedAt <= %s",
+                [(target, sid, start, marked_at) for start, marked_at in windows.items()]
+            )
+        conn.commit()
+        if rows:
+            invalidate_risk(security_ids=[sid])
+
+        stats["securities"] += 1
+        stats["windows"] += len(windows) if windows is not None else len(rows)
+        stats["bars"] += len(rows)
+
+    return stats
+
+
+def resample_prices(
+    security_id: Optional[int] = None,
+    full: bool = False,
+    verbose: bool = True,
+) -> Optional[dict]:
+    """
+    Rebuilds rolled-up bars for every window marked dirty since the last
+    run (or, with full=True, every window) for all securities or one.
+    Returns per-target stats keyed by IntervalCode, or None on failure.
+    """
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    result = {}
+    start = time.perf_counter()
+    try:
+        cursor = conn.cursor()
+        for source, target in ROLLUPS.items():
+            result[target] = _roll_interval(conn, cursor, source, target, full, security_id)
+            if verbose:
+                s = result[target]
+                print(f"  {source:>4} -> {target:<3} {s['bars']:,} bar(s) over {s['securities']:,} security(ies)")
+
+    except Exception as e:
+        print(f"[ERROR] Resampling failed: {e}")
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+    result["seconds"] = time.perf_counter() - start
+    if verbose:
+        print(f"✅ Resampling finished in {result['seconds']:.1f}s.")
+    return result
+
+
+def resample_prices_menu():
+    print("\n=== Roll Up Intraday Bars (1MIN -> 1H -> 1D) ===")
+    answer = input("Rebuild every window instead of only new/changed ones? (y/N): ").strip().lower()
+    resample_prices(full=(answer == "y"))
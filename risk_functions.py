@@ -0,0 +1,340 @@
+# risk_functions.py
+#
+# Risk statistics for a portfolio over a date window: per-security
+# volatility and beta against a benchmark security, the covariance /
+# correlation matrix of the current holdings, and portfolio volatility,
+# beta and maximum drawdown.
+#
+# Positions and closes are the (days x securities) matrices of
+# history_functions, converted into the portfolio's BaseCurrency and cut
+# down to business days; every statistic is then a vectorized NumPy
+# reduction over the daily return matrix. Portfolio returns are
+# time-weighted - each day's P&L on the previous day's positions divided by
+# their value - so buys and sells are not mistaken for gains or drawdowns.
+# Figures are annualized with TRADING_DAYS.
+#
+# Results are memoized per (portfolio, window start, as-of date,
+# benchmark, interval) in an LRU of MAX_CACHED_RESULTS. Code that writes
+# price bars must call invalidate_risk(security_ids=...) and code that
+# writes trades invalidate_risk(portfolio_id) after committing; FX writes
+# are picked up through the FX cache generation.
+
+import copy
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from db import get_connection
+from fx_functions import fx_rates
+from history_functions import (
+    convert_price_matrix,
+    load_position_matrix,
+    load_price_matrix,
+    load_price_matrix_cached,
+)
+from report_functions import _choose_portfolio, _load_portfolio_name
+from security_cache import find_security, security_cache
+
+TRADING_DAYS = 252
+DEFAULT_WINDOW_DAYS = 365
+MAX_CACHED_RESULTS = 256
+
+# key -> (result, SecurityIDs it read, FX generation)
+_results: "OrderedDict[tuple, tuple]" = OrderedDict()
+_generation = 0       # bumped by every invalidation
+_lock = threading.Lock()
+
+
+def invalidate_risk(portfolio_id: Optional[int] = None, security_ids: Optional[Iterable[int]] = None):
+    """
+    Drops memoized results for one portfolio and/or every result that read
+    one of security_ids; with no arguments, all of them.
+    """
+    global _generation
+    security_ids = set(security_ids) if security_ids is not None else None
+    with _lock:
+        _generation += 1
+        if portfolio_id is None and security_ids is None:
+            _results.clear()
+            return
+        for key in [
+            k for k, (_result, sids, _fx) in _results.items()
+            if k[0] == portfolio_id or (security_ids and not sids.isdisjoint(security_ids))
+        ]:
+            del _results[key]
+
+
+def _num(value) -> Optional[float]:
+    """float, or None for NaN / inf (keeps --json output valid)."""
+    return float(value) if value is not None and np.isfinite(value) else None
+
+
+def _returns(prices: np.ndarray) -> np.ndarray:
+    """Simple daily returns down each column; NaN where either close is missing."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return prices[1:] / prices[:-1] - 1.0
+
+
+def _pairwise_beta(returns: np.ndarray, bench: np.ndarray):
+    """
+    Beta of every column of returns against bench, each over the days both
+    have a return. Returns (betas, observations).
+    """
+    mask = ~np.isnan(returns) & ~np.isnan(bench)[:, None]
+    n = mask.sum(axis=0)
+    r = np.where(mask, returns, 0.0)
+    b = np.where(mask, bench[:, None], 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r_dev = np.where(mask, r - r.sum(axis=0) / n, 0.0)
+        b_dev = np.where(mask, b - b.sum(axis=0) / n, 0.0)
+        beta = (r_dev * b_dev).sum(axis=0) / (b_dev ** 2).sum(axis=0)
+    return np.where(n >= 2, beta, np.nan), n
+
+
+def _volatility(returns: np.ndarray) -> np.ndarray:
+    """Annualized sample standard deviation down each column, ignoring NaNs."""
+    mask = ~np.isnan(returns)
+    n = mask.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(mask, returns, 0.0).sum(axis=0) / n
+        var = (np.where(mask, returns - mean, 0.0) ** 2).sum(axis=0) / (n - 1)
+    return np.where(n >= 2, np.sqrt(var * TRADING_DAYS), np.nan)
+
+
+def _max_drawdown(index: np.ndarray, dates: np.ndarray):
+    """(drawdown, peak date, trough date) of a value index; drawdown <= 0."""
+    if len(index) == 0:
+        return None, None, None
+    peaks = np.maximum.accumulate(index)
+    drawdown = index / peaks - 1.0
+    trough = int(np.argmin(drawdown))
+    peak = int(np.argmax(index[:trough + 1]))
+    return float(drawdown[trough]), str(dates[peak]), str(dates[trough])
+
+
+def _matrix_rows(tickers: List[str], matrix: np.ndarray) -> List[dict]:
+    return [
+        {"Ticker": t, **{u: _num(v) for u, v in zip(tickers, row)}}
+        for t, row in zip(tickers, matrix)
+    ]
+
+
+def _compute(cursor, portfolio_id, start, end, benchmark_id, interval_code, use_cache, currency) -> tuple:
+    """(result, SecurityIDs read) for get_risk_stats."""
+    security_ids, positions = load_position_matrix(cursor, portfolio_id, start, end)
+    ids = list(security_ids)
+    if benchmark_id is not None and benchmark_id not in ids:
+        ids.append(benchmark_id)
+    if use_cache:
+        prices = load_price_matrix_cached(cursor, ids, start, end, interval_code or "1D")
+    else:
+        prices = load_price_matrix(cursor, ids, start, end, interval_code)
+    dates = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+    convert_price_matrix(prices, ids, dates, currency)
+
+    # weekends carry Friday's close forward and would add zero returns
+    busday = np.is_busday(dates)
+    dates, prices, positions = dates[busday], prices[busday], positions[busday]
+    held = prices[:, :len(security_ids)]
+
+    # Portfolio: P&L on yesterday's positions over yesterday's value
+    prev_value = np.nansum(positions[:-1] * held[:-1], axis=1)
+    pnl = np.nansum(positions[:-1] * (held[1:] - held[:-1]), axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        port_ret = np.where(prev_value > 0, pnl / prev_value, np.nan)
+    valid = ~np.isnan(port_ret)
+    index = np.cumprod(1.0 + port_ret[valid])
+    index_dates = dates[1:][valid]
+    if len(index):
+        # start the index at 1.0 on the day before the first return, so a
+        # loss on that first return counts towards the drawdown
+        index = np.concatenate(([1.0], index))
+        index_dates = np.concatenate((dates[:-1][valid][:1], index_dates))
+    drawdown, peak, trough = _max_drawdown(index, index_dates)
+
+    bench_ret = _returns(prices[:, ids.index(benchmark_id)]) if benchmark_id is not None else None
+
+    # Securities held at the end of the window, weighted by market value
+    cols = np.flatnonzero(positions[-1] > 0) if len(positions) else np.array([], dtype=np.int64)
+    last = prices[-1, cols] if len(prices) else np.array([])
+    mv = np.nan_to_num(positions[-1, cols] * last) if len(positions) else np.array([])
+    weights = mv / mv.sum() if mv.sum() > 0 else np.zeros(len(cols))
+
+    sec_ret = _returns(held[:, cols])
+    vols = _volatility(sec_ret)
+    counts = (~np.isnan(sec_ret)).sum(axis=0)
+    betas = _pairwise_beta(sec_ret, bench_ret)[0] if bench_ret is not None else np.full(len(cols), np.nan)
+
+    # Covariance over the days every held security has a return
+    complete = sec_ret[~np.isnan(sec_ret).any(axis=1)]
+    if len(cols) and complete.shape[0] >= 2:
+        cov = np.atleast_2d(np.cov(complete, rowvar=False, ddof=1)) * TRADING_DAYS
+        sd = np.sqrt(np.diag(cov))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = cov / np.outer(sd, sd)
+        ex_ante = float(np.sqrt(weights @ cov @ weights))
+    else:
+        cov = corr = np.full((len(cols), len(cols)), np.nan)
+        ex_ante = None
+
+    info = security_cache().get_many(ids)
+    held_ids = [security_ids[c] for c in cols]
+    tickers = [info[sid].ticker if sid in info else str(sid) for sid in held_ids]
+
+    port_vol = _volatility(port_ret[:, None])[0]
+    port_beta = _pairwise_beta(port_ret[:, None], bench_ret)[0][0] if bench_ret is not None else None
+    bench_vol = _volatility(bench_ret[:, None])[0] if bench_ret is not None else None
+
+    securities = [
+        {"SecurityID": sid, "Ticker": t, "Weight": _num(w * 100.0), "Volatility": _num(v),
+         "Beta": _num(b), "Observations": int(n)}
+        for sid, t, w, v, b, n in zip(held_ids, tickers, weights, vols, betas, counts)
+    ]
+    return {
+        "PortfolioID": portfolio_id,
+        "Start": str(start),
+        "End": str(end),
+        "Currency": currency,
+        "BenchmarkID": benchmark_id,
+        "Benchmark": info[benchmark_id].ticker if benchmark_id in info else None,
+        "Observations": int(valid.sum()),
+        "Return": _num(index[-1] - 1.0) if len(index) else None,
+        "Volatility": _num(port_vol),
+        "ExAnteVolatility": _num(ex_ante),
+        "Beta": _num(port_beta),
+        "BenchmarkVolatility": _num(bench_vol),
+        "MaxDrawdown": _num(drawdown),
+        "DrawdownPeak": peak,
+        "DrawdownTrough": trough,
+        "Securities": sorted(securities, key=lambda s: -(s["Weight"] or 0.0)),
+        "Covariance": _matrix_rows(tickers, cov),
+        "Correlation": _matrix_rows(tickers, corr),
+    }, frozenset(ids)
+
+
+def get_risk_stats(
+    portfolio_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    benchmark_id: Optional[int] = None,
+    interval_code: Optional[str] = None,
+    use_cache: bool = False,
+) -> Optional[dict]:
+    """
+    Risk statistics of a portfolio from start to end (default the
+    DEFAULT_WINDOW_DAYS up to today) in its BaseCurrency, with betas
+    against benchmark_id when given. Volatilities are annualized, weights
+    and the covariance / correlation matrices cover the positions held at
+    end. use_cache reads closes from the local price cache.
+    Returns a copy the caller may modify, or None on failure.
+    """
+    end = end or datetime.today().date()
+    start = start or end - timedelta(days=DEFAULT_WINDOW_DAYS)
+    if end < start:
+        print("[ERROR] End date is before start date.")
+        return None
+
+    key = (portfolio_id, start, end, benchmark_id, interval_code, use_cache)
+    fx_generation = fx_rates().generation
+    with _lock:
+        hit = _results.get(key)
+        if hit is not None and hit[2] == fx_generation:
+            _results.move_to_end(key)
+            return copy.deepcopy(hit[0])
+        generation = _generation
+
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT BaseCurrency FROM portfolio WHERE PortfolioID = %s", (portfolio_id,))
+        row = cursor.fetchone()
+        if row is None:
+            print(f"[ERROR] Portfolio {portfolio_id} not found.")
+            return None
+        result, read_ids = _compute(cursor, portfolio_id, start, end, benchmark_id,
+                                    interval_code, use_cache, row[0])
+
+    except Exception as e:
+        print(f"[ERROR] Failed to compute risk statistics: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+    # a bar or trade written while we were reading may be missing from result
+    with _lock:
+        if generation == _generation:
+            _results[key] = (result, read_ids, fx_generation)
+            while len(_results) > MAX_CACHED_RESULTS:
+                _results.popitem(last=False)
+    return copy.deepcopy(result)
+
+
+def _pct(value: Optional[float]) -> str:
+    return f"{value * 100:.2f}%" if value is not None else "N/A"
+
+
+def _fmt(value: Optional[float]) -> str:
+    return f"{value:.2f}" if value is not None else "N/A"
+
+
+def risk_report(current_user_id: int):
+    portfolio_id = _choose_portfolio(current_user_id)
+    if portfolio_id is None:
+        return
+
+    today = datetime.today().date()
+    try:
+        end_str = input("As-of date (YYYY-MM-DD, blank = today): ").strip()
+        end = datetime.strptime(end_str, "%Y-%m-%d").date() if end_str else today
+        start_str = input("Window start (YYYY-MM-DD, blank = one year before): ").strip()
+        start = datetime.strptime(start_str, "%Y-%m-%d").date() if start_str else end - timedelta(days=DEFAULT_WINDOW_DAYS)
+    except ValueError:
+        print("Invalid date format.")
+        return
+
+    benchmark_id = None
+    ticker = input("Benchmark ticker (e.g. SPY; blank = none): ").strip()
+    if ticker:
+        sec = find_security(ticker)
+        if sec is None:
+            print(f"Unknown or ambiguous ticker '{ticker}'.")
+            return
+        benchmark_id = sec.security_id
+
+    r = get_risk_stats(portfolio_id, start, end, benchmark_id)
+    if r is None:
+        return
+
+    pname = _load_portfolio_name(portfolio_id)
+    print(f"\n=== Risk for {pname} (ID={portfolio_id}), {r['Start']} to {r['End']} ({r['Currency']}) ===")
+    if not r["Observations"]:
+        print("Not enough priced positions in this window.")
+        return
+    print(f"Daily returns         : {r['Observations']}")
+    print(f"Return (time-weighted): {_pct(r['Return'])}")
+    print(f"Volatility (annual)   : {_pct(r['Volatility'])}  (ex-ante at current weights: {_pct(r['ExAnteVolatility'])})")
+    if r["Benchmark"]:
+        print(f"Beta vs {r['Benchmark']:<14}: {_fmt(r['Beta'])}  (benchmark volatility {_pct(r['BenchmarkVolatility'])})")
+    print(f"Max drawdown          : {_pct(r['MaxDrawdown'])}"
+          + (f" ({r['DrawdownPeak']} -> {r['DrawdownTrough']})" if r["MaxDrawdown"] else ""))
+
+    print(f"\n{'Ticker':<10} {'Weight':>8} {'Volatility':>11} {'Beta':>7} {'Days':>6}")
+    print("-" * 46)
+    for s in r["Securities"]:
+        weight = f"{s['Weight']:.2f}%" if s["Weight"] is not None else "N/A"
+        print(f"{s['Ticker']:<10} {weight:>8} {_pct(s['Volatility']):>11} {_fmt(s['Beta']):>7} {s['Observations']:>6}")
+
+    if 1 < len(r["Correlation"]) <= 12:
+        tickers = [row["Ticker"] for row in r["Correlation"]]
+        print("\nCorrelation:")
+        print(" " * 10 + "".join(f"{t[:7]:>8}" for t in tickers))
+        for row in r["Correlation"]:
+            print(f"{row['Ticker'][:10]:<10}" + "".join(f"{_fmt(row[t]):>8}" for t in tickers))
@@ -0,0 +1,337 @@
+# security_cache.py
+#
+# In-process cache of the security master (ID -> ticker, exchange, currency,
+# type, sector, industry, tags).
+#
+# On first use the whole master is loaded in two queries if it fits in
+# max_entries; after that lookups, ticker resolution and picker searches are
+# answered from memory. Larger masters fall back to an LRU of recently used
+# securities with misses served from the database.
+#
+# Code that writes to security or security_tag must call
+# invalidate_security() so the next read sees the change.
+
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, namedtuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from db import get_connection, get_config
+
+DEFAULT_MAX_ENTRIES = 100_000
+
+SecurityInfo = namedtuple(
+    "SecurityInfo",
+    ["security_id", "ticker", "exchange", "currency", "sec_type", "sector", "industry", "tags"],
+)
+
+_SECURITY_COLUMNS = "SecurityID, Ticker, Exchange, Currency, SecType, Sector, Industry"
+
+
+class SecurityCache:
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
+        self._reset()
+        self.generation = 0     # bumped by every invalidation (see tag_functions)
+        self.hits = 0
+        self.misses = 0
+
+    def _reset(self):
+        self._entries: "OrderedDict[int, SecurityInfo]" = OrderedDict()
+        self._keys: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._by_ticker: Dict[str, Optional[int]] = {}
+        self._sorted: Optional[List[Tuple[str, int]]] = None
+        self._stale = set()
+        self._complete = False
+        self._warmed = False
+
+    # ---------- loading ----------
+
+    def _query(self, where: str = "", params: tuple = ()) -> List[SecurityInfo]:
+        conn = get_connection()
+        if conn is None:
+            raise RuntimeError("Could not connect to database.")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {_SECURITY_COLUMNS} FROM security {where}", params)
+            rows = cursor.fetchall()
+            if not rows:
+                return []
+
+            if where:
+                ids = [r[0] for r in rows]
+                placeholders = ", ".join(["%s"] * len(ids))
+                cursor.execute(
+                    f"SELECT SecurityID, Tag FROM security_tag WHERE SecurityID IN ({placeholders})",
+                    tuple(ids)
+                )
+            else:
+                cursor.execute("SELECT SecurityID, Tag FROM security_tag")
+            tags: Dict[int, list] = {}
+            for sid, tag in cursor.fetchall():
+                tags.setdefault(sid, []).append(tag)
+
+            return [
+                SecurityInfo(sid, ticker, exch, curr, sec_type, sector, industry,
+                             frozenset(tags.get(sid, ())))
+                for sid, ticker, exch, curr, sec_type, sector, industry in rows
+            ]
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _store(self, info: SecurityInfo):
+        self._entries[info.security_id] = info
+        self._entries.move_to_end(info.security_id)
+        key = (info.ticker.upper(), info.exchange.upper())
+        self._keys[key] = info.security_id
+        self._keys.move_to_end(key)
+
+        if len(self._entries) > self.max_entries:
+            self._complete = False
+            self._sorted = None
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            while len(self._keys) > self.max_entries:
+                self._keys.popitem(last=False)
+
+    def _drop(self, security_id: int):
+        self._entries.pop(security_id, None)
+        for key in [k for k, v in self._keys.items() if v == security_id]:
+            del self._keys[key]
+
+    def _warm(self):
+        if self._warmed:
+            return
+
+        conn = get_connection()
+        if conn is None:
+            raise RuntimeError("Could not connect to database.")
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM security")
+            count = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+            conn.close()
+
+        if count <= self.max_entries:
+            for info in self._query():
+                self._store(info)
+            self._complete = len(self._entries) <= self.max_entries
+            self._rebuild_ticker_index()
+        self._warmed = True
+
+    def _rebuild_ticker_index(self):
+        self._by_ticker = {}
+        for (ticker, _exch), sid in self._keys.items():
+            self._by_ticker[ticker] = None if ticker in self._by_ticker else sid
+        self._sorted = None
+
+    def _refresh_stale(self):
+        if not self._stale:
+            return
+        stale, self._stale = list(self._stale), set()
+        for sid in stale:
+            self._drop(sid)
+        placeholders = ", ".join(["%s"] * len(stale))
+        for info in self._query(f"WHERE SecurityID IN ({placeholders})", tuple(stale)):
+            self._store(info)
+        self._rebuild_ticker_index()
+
+    def _ready(self):
+        self._warm()
+        self._refresh_stale()
+
+    # ---------- reads ----------
+
+    def get(self, security_id: int) -> Optional[SecurityInfo]:
+        with self._lock:
+            self._ready()
+            info = self._entries.get(security_id)
+            if info is not None:
+                self.hits += 1
+                self._entries.move_to_end(security_id)
+                return info
+            self.misses += 1
+            if self._complete:
+                return None
+            rows = self._query("WHERE SecurityID = %s", (security_id,))
+            if not rows:
+                return None
+            self._store(rows[0])
+            return rows[0]
+
+    def get_many(self, security_ids: Iterable[int]) -> Dict[int, SecurityInfo]:
+        with self._lock:
+            self._ready()
+            found, missing = {}, []
+            for sid in security_ids:
+                info = self._entries.get(sid)
+                if info is not None:
+                    found[sid] = info
+                else:
+                    missing.append(sid)
+            self.hits += len(found)
+            self.misses += len(missing)
+
+            if missing and not self._complete:
+                placeholders = ", ".join(["%s"] * len(missing))
+                for info in self._query(f"WHERE SecurityID IN ({placeholders})", tuple(missing)):
+                    self._store(info)
+                    found[info.security_id] = info
+            return found
+
+    def find(self, ticker: str, exchange: Optional[str] = None) -> Optional[SecurityInfo]:
+        """
+        Resolves a ticker (and exchange) to a security. Without an exchange
+        the ticker must be unique in the master.
+        """
+        ticker = ticker.strip().upper()
+        with self._lock:
+            self._ready()
+            if exchange:
+                sid = self._keys.get((ticker, exchange.strip().upper()))
+            elif self._complete:
+                sid = self._by_ticker.get(ticker)
+            else:
+                # a partial cache cannot prove a ticker is unique
+                sid = None
+            if sid is not None:
+                return self.get(sid)
+            if self._complete:
+                self.misses += 1
+                return None
+
+            self.misses += 1
+            if exchange:
+                rows = self._query("WHERE Ticker = %s AND Exchange = %s",
+                                   (ticker, exchange.strip().upper()))
+            else:
+                rows = self._query("WHERE Ticker = %s LIMIT 2", (ticker,))
+            if len(rows) != 1:
+                return None
+            self._store(rows[0])
+            return rows[0]
+
+    def search(
+        self,
+        term: str,
+        after: Optional[Tuple[str, int]] = None,
+        limit: int = 20,
+        substring: bool = False,
+    ) -> List[SecurityInfo]:
+        """
+        One page of securities whose ticker starts with (or contains) term,
+        ordered by (Ticker, SecurityID), continuing after the given key.
+        Served by binary search over a sorted ticker list when the whole
+        master is cached, otherwise by a LIMITed query.
+        """
+        term = term.strip().upper()
+        with self._lock:
+            self._ready()
+            if not self._complete:
+                return self._search_db(term, after, limit, substring)
+
+            if self._sorted is None:
+                self._sorted = sorted(
+                    (info.ticker.upper(), sid) for sid, info in self._entries.items()
+                )
+            keys = self._sorted
+
+            if substring:
+                start = bisect_right(keys, after) if after else 0
+                out = []
+                for ticker, sid in keys[start:]:
+                    if term in ticker:
+                        out.append(self._entries[sid])
+                        if len(out) >= limit:
+                            break
+                return out
+
+            lo = bisect_left(keys, (term, -1))
+            if after is not None:
+                lo = max(lo, bisect_right(keys, after))
+            out = []
+            for ticker, sid in keys[lo:]:
+                if not ticker.startswith(term) or len(out) >= limit:
+                    break
+                out.append(self._entries[sid])
+            return out
+
+    def _search_db(self, term, after, limit, substring) -> List[SecurityInfo]:
+        escaped = term.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+        pattern = f"%{escaped}%" if substring else f"{escaped}%"
+
+        where = "WHERE Ticker LIKE %s ESCAPE '!'"
+        params = [pattern]
+        if after is not None:
+            where += " AND (Ticker > %s OR (Ticker = %s AND SecurityID > %s))"
+            params += [after[0], after[0], after[1]]
+        where += " ORDER BY Ticker, SecurityID LIMIT %s"
+        params.append(limit)
+
+        rows = self._query(where, tuple(params))
+        for info in rows:
+            self._store(info)
+        return rows
+
+    def all(self) -> List[SecurityInfo]:
+        """Every security in the master (loads it if it was not cached whole)."""
+        with self._lock:
+            self._ready()
+            if self._complete:
+                return list(self._entries.values())
+        return self._query()
+
+    # ---------- invalidation ----------
+
+    def invalidate(self, security_id: Optional[int] = None):
+        """
+        Marks one security (or, with no argument, the whole cache) as stale.
+        Single-security invalidation re-reads just that row on next access.
+        """
+        with self._lock:
+            self.generation += 1
+            if security_id is None:
+                self._reset()
+            else:
+                self._stale.add(security_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "complete": self._complete,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_cache: Optional[SecurityCache] = None
+_cache_lock = threading.Lock()
+
+
+def security_cache() -> SecurityCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                size = int(get_config().get("security_cache_size", DEFAULT_MAX_ENTRIES))
+                _cache = SecurityCache(size)
+    return _cache
+
+
+def get_security(security_id: int) -> Optional[SecurityInfo]:
+    return security_cache().get(security_id)
+
+
+def find_security(ticker: str, exchange: Optional[str] = None) -> Optional[SecurityInfo]:
+    return security_cache().find(ticker, exchange)
+
+
+def invalidate_security(security_id: Optional[int] = None):
+    security_cache().invalidate(security_id)
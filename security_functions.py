@@ -1,5 +1,10 @@
 from typing import Optional
+
 from db import get_connection
+from security_cache import get_security, invalidate_security, security_cache
+from tag_functions import tag_securities
+
+PICKER_PAGE_SIZE = 20
 
 
 def create_security() -> Optional[int]:
@@ -34,6 +39,7 @@ def create_security() -> Optional[int]:
         conn.commit()
 
         sec_id = cursor.lastrowid
+        invalidate_security(sec_id)
         print(f"\n✅ Security created with SecurityID={sec_id} ({ticker} on {exchange}).")
         return sec_id
 
@@ -47,80 +53,98 @@ def create_security() -> Optional[int]:
 
 
 def add_security_tag(current_user_id: int):
-    conn = get_connection()
-    if conn is None:
-        print("[ERROR] Could not connect to database.")
+    print("\n=== Add Security Tag ===")
+    sec_id = choose_security()
+    if sec_id is None:
+        print("No security selected. Aborting.")
         return
 
-    try:
-        cursor = conn.cursor()
+    # Ask for tag
+    tag = input("Enter tag label (e.g. Tech, Dividend, Speculative): ").strip()
+    if not tag:
+        print("Tag cannot be empty. Aborting.")
+        return
 
-        # Show existing securities
-        cursor.execute(
-            """
-            SELECT SecurityID, Ticker, Exchange, SecType, Currency
-            FROM security
-            ORDER BY SecurityID
-            """
-        )
-        securities = cursor.fetchall()
-
-        print("\n=== Add Security Tag ===")
-        if not securities:
-            print("No securities exist yet.")
-            create_choice = input("Create a new security now? (Y/N): ").strip().lower()
-            if create_choice != "y":
-                print("No security selected. Aborting.")
-                return
-
-            sec_id = create_security()
-            if sec_id is None:
-                print("Failed to create security. Aborting.")
-                return
-        else:
-            print("Existing securities:")
-            for sid, ticker, exch, sec_type, curr in securities:
-                print(f"  ID={sid} | {ticker} ({sec_type}) on {exch} [{curr}]")
-
-            choice = input("\nEnter SecurityID to tag, or N to create a new one: ").strip()
-
-            if choice.lower() == "n":
-                sec_id = create_security()
-                if sec_id is None:
-                    print("Failed to create security. Aborting.")
-                    return
+    inserted = tag_securities([(sec_id, tag)])
+    if inserted is None:
+        return
+    if inserted:
+        print(f"\n✅ Tag '{tag}' added to SecurityID={sec_id}.")
+    else:
+        print(f"Tag '{tag}' is already on SecurityID={sec_id}.")
+
+
+# ---------- SECURITY PICKER ----------
+
+def choose_security(allow_create: bool = True, page_size: int = PICKER_PAGE_SIZE) -> Optional[int]:
+    """
+    Interactive picker shared by every menu that needs a SecurityID.
+    Searches by ticker prefix (falling back to substring when nothing
+    starts with the text) and pages results through the security cache,
+    so a screen costs at most one small query no matter how large the
+    security master is. "#<id>" picks a SecurityID directly; a bare
+    number is searched as a ticker (e.g. "7203") and only taken as a
+    SecurityID when no ticker matches it.
+    """
+    print("\nChoose a security:")
+    print("  Type a ticker (or part of one) to search")
+    print("  #<SecurityID> to pick an existing security by ID")
+    if allow_create:
+        print("  N = create a new security")
+    print("  Enter nothing to cancel")
+
+    cache = security_cache()
+    term = None
+    substring = False
+    last_key = None
+
+    try:
+        while True:
+            choice = input("Search / #SecurityID: ").strip()
+            if choice == "":
+                print("Cancelled.")
+                return None
+
+            if allow_create and choice.lower() == "n":
+                return create_security()
+
+            if choice.startswith("#"):
+                sid = choice[1:].strip()
+                if sid.isdigit() and get_security(int(sid)) is not None:
+                    return int(sid)
+                print("No security with that SecurityID.")
+                continue
+
+            if choice == ">":
+                if last_key is None:
+                    print("No more results.")
+                    continue
             else:
-                try:
-                    sec_id_candidate = int(choice)
-                except ValueError:
-                    print("Invalid SecurityID. Aborting.")
-                    return
-
-                valid_ids = {row[0] for row in securities}
-                if sec_id_candidate not in valid_ids:
-                    print("That SecurityID is not in the list. Aborting.")
-                    return
-                sec_id = sec_id_candidate
-
-        # Ask for tag
-        tag = input("Enter tag label (e.g. Tech, Dividend, Speculative): ").strip()
-        if not tag:
-            print("Tag cannot be empty. Aborting.")
-            return
-
-        insert_tag_sql = """
-            INSERT INTO security_tag (SecurityID, Tag)
-            VALUES (%s, %s)
-        """
-        try:
-            cursor.execute(insert_tag_sql, (sec_id, tag))
-            conn.commit()
-            print(f"\n✅ Tag '{tag}' added to SecurityID={sec_id}.")
-        except Exception as e:
-            # Likely duplicate PK violation if tag already exists for that security
-            print(f"[ERROR] Failed to add tag (maybe it already exists?): {e}")
-            conn.rollback()
+                term, substring, last_key = choice, False, None
 
-    finally:
-        cursor.close()
-        conn.close()
+            rows = cache.search(term, last_key, page_size + 1, substring)
+            if not rows and last_key is None and not substring:
+                substring = True
+                rows = cache.search(term, None, page_size + 1, substring)
+
+            if not rows and last_key is None and term.isdigit() and get_security(int(term)) is not None:
+                return int(term)
+
+            if not rows:
+                print(f"  (no securities match '{term}')")
+                last_key = None
+                continue
+
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+            for sec in rows:
+                print(f"  ID={sec.security_id} | {sec.ticker} ({sec.sec_type}) "
+                      f"on {sec.exchange} [{sec.currency}]")
+
+            last_key = (rows[-1].ticker.upper(), rows[-1].security_id) if has_more else None
+            if has_more:
+                print("  > = next page")
+
+    except Exception as e:
+        print(f"[ERROR] Failed to search securities: {e}")
+        return None
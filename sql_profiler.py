@@ -0,0 +1,291 @@
+# sql_profiler.py
+#
+# Statement timing for every cursor handed out by db.py.
+#
+# When enabled ("sql_profile": true in db_config.json, or enable()), each
+# statement's latency (execute plus the fetches that drain it), row count
+# and call site are folded into aggregates keyed by the top-level action
+# that issued it - menu options and CLI commands wrap themselves in
+# action(name). The current action lives in a ContextVar, so actions on
+# different threads do not see each other; work handed to a thread pool
+# keeps its caller's action when submitted through
+# contextvars.copy_context().run. Statements slower than slow_query_ms are
+# also appended to the slow-query log. print_summary() lists the top
+# statements by total time.
+#
+# Statement text is normalised (whitespace collapsed, IN (%s, %s, ...) lists
+# folded) so the same query with different list lengths aggregates together.
+
+import contextvars
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_SLOW_QUERY_MS = 200.0
+DEFAULT_SLOW_QUERY_LOG = "slow_queries.log"
+NO_ACTION = "(none)"
+
+# frames in these files are skipped when looking for the call site
+_INTERNAL_FILES = {"sql_profiler.py", "db.py"}
+
+_lock = threading.Lock()
+_enabled = False
+_slow_ms = DEFAULT_SLOW_QUERY_MS
+_slow_log = DEFAULT_SLOW_QUERY_LOG
+
+_current_action: contextvars.ContextVar = contextvars.ContextVar("sql_profiler_action", default=None)
+_stats: Dict[Tuple[str, str], "StatementStats"] = {}
+_actions: Dict[str, List[float]] = {}     # action -> [runs, total seconds]
+
+
+class StatementStats:
+    __slots__ = ("calls", "total_s", "max_s", "rows", "sites")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.rows = 0
+        self.sites: Dict[str, int] = {}
+
+
+# ---------- CONFIGURATION ----------
+
+def configure(cfg: dict):
+    """
+    Applies the sql_profile / slow_query_ms / slow_query_log config keys;
+    keys that are absent leave the current setting alone.
+    """
+    global _enabled, _slow_ms, _slow_log
+    _enabled = bool(cfg.get("sql_profile", _enabled))
+    _slow_ms = float(cfg.get("slow_query_ms", _slow_ms))
+    _slow_log = cfg.get("slow_query_log", _slow_log)
+
+
+def enable(slow_query_ms: Optional[float] = None):
+    global _enabled, _slow_ms
+    _enabled = True
+    if slow_query_ms is not None:
+        _slow_ms = float(slow_query_ms)
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _actions.clear()
+
+
+# ---------- ACTIONS ----------
+
+@contextmanager
+def action(name: str):
+    """
+    Attributes every statement run inside the block to name: on this
+    thread, and on pool threads given a copy of this context. Nested
+    actions count toward the outermost one.
+    """
+    if _current_action.get() is not None:
+        yield
+        return
+
+    token = _current_action.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _current_action.reset(token)
+        if _enabled:
+            with _lock:
+                entry = _actions.setdefault(name, [0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+
+
+# ---------- RECORDING ----------
+
+_IN_LIST_RE = re.compile(r"\(\s*%s(?:\s*,\s*%s)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize(sql: str) -> str:
+    return _IN_LIST_RE.sub("(%s, ...)", _SPACE_RE.sub(" ", sql).strip())
+
+
+def _call_site() -> str:
+    frame = sys._getframe(2)
+    while frame is not None and os.path.basename(frame.f_code.co_filename) in _INTERNAL_FILES:
+        frame = frame.f_back
+    if frame is None:
+        return "?"
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+
+
+def _record(sql: str, site: str, elapsed: float, rows: int):
+    key_action = _current_action.get() or NO_ACTION
+    text = normalize(sql)
+    with _lock:
+        s = _stats.get((key_action, text))
+        if s is None:
+            s = _stats[(key_action, text)] = StatementStats()
+        s.calls += 1
+        s.total_s += elapsed
+        s.max_s = max(s.max_s, elapsed)
+        s.rows += rows
+        s.sites[site] = s.sites.get(site, 0) + 1
+
+    if elapsed * 1000.0 >= _slow_ms and _slow_log:
+        try:
+            with open(_slow_log, "a", encoding="utf-8") as f:
+                f.write(f"{datetime.now().isoformat(timespec='seconds')}\t{elapsed * 1000.0:.1f}ms"
+                        f"\trows={rows}\t{key_action}\t{site}\t{text}\n")
+        except OSError:
+            pass
+
+
+class ProfiledCursor:
+    """
+    Wraps a DB-API cursor. A statement is timed from execute() until the
+    cursor moves on to the next statement or is closed, so time spent
+    streaming rows with fetchmany() is charged to the query that produced
+    them.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._pending = None      # [sql, site, elapsed, rows_fetched]
+
+    def _finish(self):
+        if self._pending is None:
+            return
+        sql, site, elapsed, rows = self._pending
+        self._pending = None
+        if self._cursor.description is None:
+            rows = max(self._cursor.rowcount or 0, 0)
+        _record(sql, site, elapsed, rows)
+
+    def _timed(self, method, sql, params):
+        self._finish()
+        site = _call_site()
+        start = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            self._pending = [sql, site, time.perf_counter() - start, 0]
+
+    def execute(self, sql, params=()):
+        return self._timed(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._timed(self._cursor.executemany, sql, seq_of_params)
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - start
+            if result is not None:
+                self._pending[3] += len(result) if isinstance(result, list) else 1
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size: int = 1):
+        return self._fetch(self._cursor.fetchmany, size)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def wrap_cursor(cursor):
+    """Returns cursor, instrumented when profiling is enabled."""
+    return ProfiledCursor(cursor) if _enabled else cursor
+
+
+# ---------- REPORTING ----------
+
+def summary(limit: int = 10, action_name: Optional[str] = None) -> dict:
+    """Per-action totals plus the top statements by total time."""
+    with _lock:
+        rows = [
+            {
+                "Action": act,
+                "Statement": text,
+                "Calls": s.calls,
+                "TotalMs": s.total_s * 1000.0,
+                "AvgMs": s.total_s * 1000.0 / s.calls,
+                "MaxMs": s.max_s * 1000.0,
+                "Rows": s.rows,
+                "CallSites": sorted(s.sites, key=s.sites.get, reverse=True),
+            }
+            for (act, text), s in _stats.items()
+            if action_name is None or act == action_name
+        ]
+        actions = []
+        for act, (runs, total) in _actions.items():
+            if action_name is not None and act != action_name:
+                continue
+            stmts = [s for (a, _), s in _stats.items() if a == act]
+            sql_s = sum(s.total_s for s in stmts)
+            actions.append({
+                "Action": act,
+                "Runs": runs,
+                "TotalMs": total * 1000.0,
+                "Statements": sum(s.calls for s in stmts),
+                "SqlMs": sql_s * 1000.0,
+            })
+
+    rows.sort(key=lambda r: r["TotalMs"], reverse=True)
+    actions.sort(key=lambda a: a["TotalMs"], reverse=True)
+    return {"Actions": actions, "TopStatements": rows[:limit]}
+
+
+def print_summary(limit: int = 10, action_name: Optional[str] = None):
+    if not _enabled and not _stats:
+        print("SQL profiling is off. Set \"sql_profile\": true in db_config.json to enable it.")
+        return
+
+    result = summary(limit, action_name)
+    print("\n=== SQL time by action ===")
+    print(f"{'Action':<32} {'Runs':>5} {'Stmts':>7} {'SQL ms':>10} {'Total ms':>10}")
+    print("-" * 68)
+    for a in result["Actions"]:
+        print(f"{a['Action']:<32} {a['Runs']:>5} {a['Statements']:>7} {a['SqlMs']:>10.1f} {a['TotalMs']:>10.1f}")
+
+    print(f"\n=== Top {limit} statements by total time ===")
+    for i, r in enumerate(result["TopStatements"], 1):
+        print(f"{i:>2}. {r['TotalMs']:>9.1f} ms total  {r['Calls']:>6} call(s)  avg {r['AvgMs']:.2f} ms  "
+              f"max {r['MaxMs']:.2f} ms  {r['Rows']:,} row(s)  [{r['Action']}]")
+        print(f"    {r['Statement'][:160]}")
+        print(f"    at {', '.join(r['CallSites'][:3])}")
@@ -0,0 +1,467 @@
+# tag_functions.py
+#
+# Security tags as an in-memory inverted index: tag -> set of SecurityID.
+#
+# The whole security_tag table is read in one query the first time a tag
+# is looked up; multi-tag filters are then set intersections / unions /
+# differences instead of one join per tag. Tags match case-insensitively
+# and are reported in the spelling first seen.
+#
+# The index follows the security cache: any invalidate_security() call
+# (which code writing to security_tag must already make) bumps its
+# generation and the index is rebuilt on next use.
+#
+# Bulk tagging (a mapping file, or a rule such as "every security in
+# Sector X") writes with INSERT IGNORE, so tags a security already has are
+# skipped by the server instead of failing one row at a time.
+
+import csv
+import re
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+from db import get_connection
+from security_cache import invalidate_security, security_cache
+
+DEFAULT_BATCH_SIZE = 5000
+INVALIDATE_EACH_MAX = 100   # above this many securities, drop the whole security cache
+MAX_TAG_LENGTH = 50     # security_tag.Tag is VARCHAR(50)
+
+INSERT_TAG_SQL = "INSERT IGNORE INTO security_tag (SecurityID, Tag) VALUES (%s, %s)"
+
+# security columns a tagging rule may match on
+RULE_COLUMNS = {
+    "sector": "Sector",
+    "industry": "Industry",
+    "sec_type": "SecType",
+    "exchange": "Exchange",
+    "currency": "Currency",
+}
+
+# Accepted CSV header spellings (case-insensitive)
+_CSV_COLUMNS = {
+    "security_id": ("securityid", "security_id", "id"),
+    "ticker": ("ticker", "symbol"),
+    "exchange": ("exchange",),
+    "tag": ("tag", "tags"),
+}
+
+
+def _key(tag: str) -> str:
+    return tag.strip().casefold()
+
+
+class TagIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_tag: Dict[str, FrozenSet[int]] = {}
+        self._names: Dict[str, str] = {}
+        self._generation: Optional[int] = None
+
+    def _ready(self):
+        generation = security_cache().generation
+        if self._generation == generation:
+            return
+
+        conn = get_connection()
+        if conn is None:
+            raise RuntimeError("Could not connect to database.")
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT Tag, SecurityID FROM security_tag")
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+        by_tag: Dict[str, Set[int]] = {}
+        names: Dict[str, str] = {}
+        for tag, sid in rows:
+            key = _key(tag)
+            by_tag.setdefault(key, set()).add(sid)
+            names.setdefault(key, tag)
+        self._by_tag = {key: frozenset(sids) for key, sids in by_tag.items()}
+        self._names = names
+        self._generation = generation
+
+    def tags(self) -> Dict[str, int]:
+        """Tag -> number of securities carrying it."""
+        with self._lock:
+            self._ready()
+            return {self._names[key]: len(sids) for key, sids in self._by_tag.items()}
+
+    def securities(self, tag: str) -> FrozenSet[int]:
+        with self._lock:
+            self._ready()
+            return self._by_tag.get(_key(tag), frozenset())
+
+    def match(
+        self,
+        all_of: Iterable[str] = (),
+        any_of: Iterable[str] = (),
+        none_of: Iterable[str] = (),
+        within: Optional[Iterable[int]] = None,
+    ) -> Set[int]:
+        """
+        SecurityIDs carrying every tag in all_of, at least one of any_of and
+        none of none_of, restricted to `within` when given. With neither
+        all_of nor any_of the starting set is `within` (or every tagged
+        security).
+        """
+        all_of, any_of, none_of = list(all_of), list(any_of), list(none_of)
+        within = set(within) if within is not None else None
+        with self._lock:
+            self._ready()
+
+            def get(tag):
+                return self._by_tag.get(_key(tag), frozenset())
+
+            if all_of:
+                # intersect smallest first so the working set only shrinks
+                sets = sorted((get(tag) for tag in all_of), key=len)
+                result = set(sets[0]).intersection(*sets[1:])
+                if any_of:
+                    result &= set().union(*(get(tag) for tag in any_of))
+            elif any_of:
+                result = set().union(*(get(tag) for tag in any_of))
+            elif within is not None:
+                result = set(within)
+            else:
+                result = set().union(*self._by_tag.values())
+
+            if within is not None:
+                result &= within
+            for tag in none_of:
+                result -= get(tag)
+            return result
+
+
+_index = TagIndex()
+
+
+def tag_index() -> TagIndex:
+    return _index
+
+
+# ---------- TAG EXPRESSIONS ----------
+
+_TOKEN_RE = re.compile(r'\s*(\(|\)|"[^"]*"|[^\s()"]+)\s*')
+_KEYWORDS = ("AND", "OR", "NOT")
+
+
+def _tokenize(expression: str) -> List[tuple]:
+    """(kind, tag) tokens; kind is "(", ")", AND, OR, NOT or TAG."""
+    tokens, pos, bare = [], 0, False
+    expression = expression.strip()
+    while pos < len(expression):
+        m = _TOKEN_RE.match(expression, pos)
+        if m is None:
+            raise ValueError(f"unbalanced quote at position {pos}")
+        pos = m.end()
+        text = m.group(1)
+        if text in ("(", ")") or text.upper() in _KEYWORDS:
+            tokens.append((text.upper(), None))
+            bare = False
+        elif text.startswith('"'):
+            tokens.append(("TAG", text[1:-1]))
+            bare = False
+        elif bare:
+            # consecutive bare words form one tag: Large Cap
+            tokens[-1] = ("TAG", tokens[-1][1] + " " + text)
+        else:
+            tokens.append(("TAG", text))
+            bare = True
+    return tokens
+
+
+class _Parser:
+    """
+    expr := term (OR term)* ; term := factor (AND factor)* ;
+    factor := NOT factor | ( expr ) | tag
+    """
+
+    def __init__(self, tokens: List[tuple], lookup, universe):
+        self.tokens, self.pos = tokens, 0
+        self.lookup, self.universe = lookup, universe
+
+    def _peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def _take(self, kind: str):
+        if self._peek() != kind:
+            found = self._peek() or "end of expression"
+            raise ValueError(f"expected {kind}, found {found}")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self) -> Set[int]:
+        result = self._expr()
+        if self._peek() is not None:
+            raise ValueError(f"unexpected {self._peek()}")
+        return result
+
+    def _expr(self) -> Set[int]:
+        result = self._term()
+        while self._peek() == "OR":
+            self._take("OR")
+            result = result | self._term()
+        return result
+
+    def _term(self) -> Set[int]:
+        result = self._factor()
+        while self._peek() == "AND":
+            self._take("AND")
+            result = result & self._factor()
+        return result
+
+    def _factor(self) -> Set[int]:
+        if self._peek() == "NOT":
+            self._take("NOT")
+            return self.universe() - self._factor()
+        if self._peek() == "(":
+            self._take("(")
+            result = self._expr()
+            self._take(")")
+            return result
+        return set(self.lookup(self._take("TAG")[1]))
+
+
+def find_securities_by_tags(expression: str) -> Optional[List[int]]:
+    """
+    Sorted SecurityIDs matching a tag expression such as
+        Tech AND (Dividend OR "Large Cap") AND NOT Speculative
+    AND binds tighter than OR; consecutive bare words are one tag name.
+    Evaluated as set operations on the cached tag index; NOT is relative
+    to the whole security master. Returns None on failure.
+    """
+    try:
+        tokens = _tokenize(expression)
+        if not tokens:
+            raise ValueError("empty expression")
+
+        def universe():
+            return {info.security_id for info in security_cache().all()}
+
+        return sorted(_Parser(tokens, tag_index().securities, universe).parse())
+    except ValueError as e:
+        print(f"[ERROR] Invalid tag expression: {e}")
+        return None
+    except Exception as e:
+        print(f"[ERROR] Failed to evaluate tag expression: {e}")
+        return None
+
+
+# ---------- BULK TAGGING ----------
+
+def _clean_tag(tag: str) -> str:
+    tag = tag.strip()
+    if not tag or len(tag) > MAX_TAG_LENGTH:
+        raise ValueError(f"tag must be 1-{MAX_TAG_LENGTH} characters: {tag!r}")
+    return tag
+
+
+def tag_securities(pairs: Iterable[tuple], batch_size: int = DEFAULT_BATCH_SIZE) -> Optional[int]:
+    """
+    Adds (SecurityID, Tag) pairs with batched INSERT IGNORE in one
+    transaction. Returns how many were new, or None on failure.
+    """
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    inserted = 0
+    touched = set()
+    try:
+        cursor = conn.cursor()
+        batch = []
+        for sid, tag in pairs:
+            batch.append((sid, _clean_tag(tag)))
+            touched.add(sid)
+            if len(batch) >= batch_size:
+                cursor.executemany(INSERT_TAG_SQL, batch)
+                inserted += max(cursor.rowcount, 0)
+                batch = []
+        if batch:
+            cursor.executemany(INSERT_TAG_SQL, batch)
+            inserted += max(cursor.rowcount, 0)
+        conn.commit()
+        return inserted
+
+    except Exception as e:
+        print(f"[ERROR] Failed to tag securities: {e}")
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+        if inserted and len(touched) <= INVALIDATE_EACH_MAX:
+            for sid in touched:
+                invalidate_security(sid)
+        elif inserted:
+            invalidate_security()
+
+
+def tag_by_rule(tag: str, **criteria) -> Optional[int]:
+    """
+    Tags every security whose RULE_COLUMNS match criteria (e.g.
+    sector="Energy", sec_type="ETF"; values are compared exactly) with one
+    INSERT IGNORE ... SELECT. No criteria tags the whole master.
+    Returns how many securities gained the tag, or None on failure.
+    """
+    unknown = [k for k in criteria if k not in RULE_COLUMNS]
+    if unknown:
+        print(f"[ERROR] Unknown rule field(s): {', '.join(unknown)}")
+        return None
+    try:
+        tag = _clean_tag(tag)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return None
+
+    conditions = [(RULE_COLUMNS[k], v) for k, v in criteria.items() if v is not None]
+    where = " AND ".join(f"{column} = %s" for column, _ in conditions)
+
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    inserted = 0
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT IGNORE INTO security_tag (SecurityID, Tag) "
+            f"SELECT SecurityID, %s FROM security {'WHERE ' + where if where else ''}",
+            (tag,) + tuple(v for _, v in conditions)
+        )
+        inserted = max(cursor.rowcount, 0)
+        conn.commit()
+        return inserted
+
+    except Exception as e:
+        print(f"[ERROR] Failed to tag securities: {e}")
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+        if inserted:
+            invalidate_security()
+
+
+def tag_from_file(path: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                  default_exchange: Optional[str] = None) -> Optional[dict]:
+    """
+    Applies a CSV mapping of securities to tags: a SecurityID or Ticker
+    (plus optional Exchange) column and a Tag column, where one cell may
+    hold several tags separated by ';'. Tickers are resolved through the
+    security cache; unknown ones are skipped and counted.
+    """
+    stats = {"rows": 0, "pairs": 0, "inserted": 0, "unknown": 0, "rejected": 0, "seconds": 0.0}
+    start = time.perf_counter()
+    cache = security_cache()
+    default_exchange = default_exchange.upper() if default_exchange else None
+
+    pairs = []
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            header = [h.strip().lower() for h in next(reader, [])]
+            cols = {field: next((header.index(n) for n in names if n in header), None)
+                    for field, names in _CSV_COLUMNS.items()}
+            if cols["tag"] is None or (cols["security_id"] is None and cols["ticker"] is None):
+                print("[ERROR] CSV needs a Tag column and a SecurityID or Ticker column.")
+                return None
+
+            for row in reader:
+                if not row:
+                    continue
+                stats["rows"] += 1
+                try:
+                    if cols["security_id"] is not None and row[cols["security_id"]].strip():
+                        sid = int(row[cols["security_id"]])
+                        sec = cache.get(sid)
+                    else:
+                        exch = row[cols["exchange"]].strip() if cols["exchange"] is not None else ""
+                        sec = cache.find(row[cols["ticker"]], exch or default_exchange)
+                    tags = [_clean_tag(t) for t in row[cols["tag"]].split(";") if t.strip()]
+                except (ValueError, IndexError):
+                    stats["rejected"] += 1
+                    continue
+                if sec is None:
+                    stats["unknown"] += 1
+                    continue
+                pairs.extend((sec.security_id, tag) for tag in tags)
+    except OSError as e:
+        print(f"[ERROR] Could not read {path}: {e}")
+        return None
+
+    stats["pairs"] = len(pairs)
+    inserted = tag_securities(pairs, batch_size)
+    if inserted is None:
+        return None
+    stats["inserted"] = inserted
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+# ---------- MENUS ----------
+
+def bulk_tag_menu():
+    print("\n=== Bulk Tag Securities ===")
+    mode = input("Tag from a mapping file (F) or by rule (R)? [F/R]: ").strip().upper()
+
+    if mode == "F":
+        path = input("CSV path (SecurityID or Ticker[,Exchange], Tag): ").strip()
+        if not path:
+            print("Path is required.")
+            return
+        stats = tag_from_file(path)
+        if stats is None:
+            return
+        print(f"\n✅ {stats['inserted']:,} new tag(s) from {stats['rows']:,} row(s) "
+              f"in {stats['seconds']:.2f}s ({stats['pairs'] - stats['inserted']:,} already present).")
+        if stats["unknown"] or stats["rejected"]:
+            print(f"[WARN] {stats['unknown']:,} unknown security row(s), {stats['rejected']:,} malformed row(s) skipped.")
+        return
+
+    tag = input("Tag to add: ").strip()
+    criteria = {}
+    for field, column in RULE_COLUMNS.items():
+        value = input(f"{column} equals (blank = any): ").strip()
+        if value:
+            criteria[field] = value
+    if not criteria and input("No criteria: tag EVERY security? [y/N]: ").strip().lower() != "y":
+        return
+    inserted = tag_by_rule(tag, **criteria)
+    if inserted is not None:
+        print(f"\n✅ Tag '{tag}' added to {inserted:,} security(ies).")
+
+
+def tag_query_menu():
+    print("\n=== Find Securities by Tag ===")
+    counts = tag_index().tags()
+    if not counts:
+        print("No tags defined yet.")
+        return
+    print("Tags: " + ", ".join(f"{t} ({n})" for t, n in sorted(counts.items())))
+    expression = input('Expression (e.g. Tech AND (Dividend OR "Large Cap") AND NOT Speculative): ').strip()
+    if not expression:
+        return
+    ids = find_securities_by_tags(expression)
+    if ids is None:
+        return
+
+    print(f"\n{len(ids):,} matching security(ies)")
+    info = security_cache().get_many(ids)
+    print(f"{'ID':>6} {'Ticker':<10} {'Exchange':<10} {'Type':<8} {'Sector':<24} Tags")
+    print("-" * 80)
+    for sid in ids:
+        i = info.get(sid)
+        if i is not None:
+            print(f"{sid:>6} {i.ticker:<10} {i.exchange:<10} {i.sec_type:<8} {str(i.sector or ''):<24} "
+                  f"{', '.join(sorted(i.tags))}")
@@ -1,8 +1,52 @@
-from datetime import datetime
-from typing import Optional
+import csv
+import json
+import os
+import time
+from collections import namedtuple
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 from db import get_connection
-from security_functions import create_security
+from dividend_functions import invalidate_dividends
+from holding_functions import apply_trades_to_holdings
+from risk_functions import invalidate_risk
+from security_cache import SecurityInfo, find_security, get_security, security_cache
+from security_functions import choose_security
+
+INSERT_TRADE_SQL = """
+    INSERT INTO trade
+        (PortfolioID, SecurityID, Type, TradeDate, SettleDate,
+         Quantity, UnitPrice, Fees, TradeCurrency, Notes)
+    VALUES
+        (%s, %s, %s, %s, %s,
+         %s, %s, %s, %s, %s)
+"""
+
+DEFAULT_COMMIT_SIZE = 5000
+IMPORT_TRADE_TYPES = ("BUY", "SELL", "DIVIDEND")
+DEFAULT_PAGE_SIZE = 100
+STREAM_CHUNK = 5000
+MENU_PAGE_SIZE = 20
+
+TradeRow = namedtuple(
+    "TradeRow",
+    ["transaction_id", "security_id", "type", "trade_date", "settle_date",
+     "quantity", "unit_price", "fees", "currency", "notes"],
+)
+
+# Accepted broker-export field names (case-insensitive) for each trade column
+_IMPORT_FIELDS = {
+    "ticker": ("ticker", "symbol"),
+    "exchange": ("exchange",),
+    "type": ("type", "action", "side"),
+    "trade_date": ("tradedate", "date", "trade_date"),
+    "settle_date": ("settledate", "settle_date"),
+    "quantity": ("quantity", "qty", "shares"),
+    "unit_price": ("unitprice", "price", "unit_price"),
+    "fees": ("fees", "commission", "fee"),
+    "currency": ("currency", "tradecurrency"),
+    "notes": ("notes", "description"),
+}
 
 
 def _choose_portfolio(current_user_id: int) -> Optional[int]:
@@ -60,59 +104,72 @@ def _choose_portfolio(current_user_id: int) -> Optional[int]:
         conn.close()
 
 
-def _choose_security() -> Optional[int]:
+def insert_trade(
+    portfolio_id: int,
+    security_id: int,
+    trade_type: str,
+    trade_date: date,
+    qty: float,
+    unit_price: float,
+    fees: float = 0.0,
+    settle_date: Optional[date] = None,
+    notes: Optional[str] = None,
+    trade_currency: Optional[str] = None,
+) -> Optional[int]:
+    """
+    Input-free service behind record_trade / record_dividend and the CLI.
+    Inserts one BUY, SELL or DIVIDEND row (currency defaults to the
+    security's), folds it into holding in the same transaction, and returns
+    the new TransactionID, or None on failure.
+    """
+    trade_type = trade_type.upper()
+    if trade_type not in IMPORT_TRADE_TYPES:
+        print(f"[ERROR] Trade type must be one of {', '.join(IMPORT_TRADE_TYPES)}.")
+        return None
+
+    if trade_currency is None:
+        sec = get_security(security_id)
+        if sec is None:
+            print("[ERROR] Security disappeared, aborting.")
+            return None
+        trade_currency = sec.currency
+
     conn = get_connection()
     if conn is None:
         print("[ERROR] Could not connect to database.")
         return None
 
     try:
-        cursor = conn.cursor()
+        cursor = conn.cursor(prepared=True)
         cursor.execute(
-            """
-            SELECT SecurityID, Ticker, Exchange, SecType, Currency
-            FROM security
-            ORDER BY SecurityID
-            """
+            INSERT_TRADE_SQL,
+            (
+                portfolio_id,
+                security_id,
+                trade_type,
+                trade_date,
+                settle_date or trade_date,
+                qty,
+                unit_price,
+                fees,
+                trade_currency,
+                notes,
+            ),
         )
-        rows = cursor.fetchall()
-
-        print("\nAvailable securities:")
-        if not rows:
-            print("  (none yet)")
+        txn_id = cursor.lastrowid
+        apply_trades_to_holdings(
+            cursor, portfolio_id, [(security_id, trade_type, qty, unit_price, fees)]
+        )
+        conn.commit()
+        if trade_type == "DIVIDEND":
+            invalidate_dividends(portfolio_id)
         else:
-            for sid, ticker, exch, sec_type, curr in rows:
-                print(f"  ID={sid} | {ticker} ({sec_type}) on {exch} [{curr}]")
-
-        print("\nChoose a security:")
-        print("  Enter an existing SecurityID")
-        print("  N = create a new security")
-        print("  Enter nothing to cancel")
-
-        choice = input("Choice: ").strip()
-        if choice == "":
-            print("Cancelled.")
-            return None
-
-        if choice.lower() == "n":
-            sec_id = create_security()
-            return sec_id
-
-        try:
-            chosen_id = int(choice)
-        except ValueError:
-            print("Invalid SecurityID.")
-            return None
-
-        valid_ids = {row[0] for row in rows}
-        if chosen_id not in valid_ids:
-            print("That SecurityID is not in the list.")
-            return None
-
-        return chosen_id
+            invalidate_risk(portfolio_id)
+        return txn_id
 
     except Exception as e:
-        print(f"[ERROR] Failed to list securities: {e}")
+        print(f"[ERROR] Failed to record {trade_type.lower()}: {e}")
+        conn.rollback()
         return None
     finally:
         cursor.close()
@@ -126,113 +183,67 @@ def record_trade(current_user_id: int):
         return
 
     # 2. Pick security
-    security_id = _choose_security()
+    security_id = choose_security()
     if security_id is None:
         return
 
-    conn = get_connection()
-    if conn is None:
-        print("[ERROR] Could not connect to database.")
+    print("\n=== Record Trade (BUY/SELL) ===")
+    trade_type = input("Trade type (BUY or SELL): ").strip().upper()
+    if trade_type not in ("BUY", "SELL"):
+        print("Trade type must be BUY or SELL.")
         return
 
-    try:
-        cursor = conn.cursor()
-
-        print("\n=== Record Trade (BUY/SELL) ===")
-        trade_type = input("Trade type (BUY or SELL): ").strip().upper()
-        if trade_type not in ("BUY", "SELL"):
-            print("Trade type must be BUY or SELL.")
-            return
-
-        date_str = input("Trade date (YYYY-MM-DD, blank = today): ").strip()
-        if date_str == "":
-            trade_date = datetime.today().date()
-        else:
-            try:
-                trade_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-            except ValueError:
-                print("Invalid date format.")
-                return
-
-        settle_str = input("Settle date (YYYY-MM-DD, blank = same as trade): ").strip()
-        if settle_str == "":
-            settle_date = trade_date
-        else:
-            try:
-                settle_date = datetime.strptime(settle_str, "%Y-%m-%d").date()
-            except ValueError:
-                print("Invalid date format.")
-                return
-
+    date_str = input("Trade date (YYYY-MM-DD, blank = today): ").strip()
+    if date_str == "":
+        trade_date = datetime.today().date()
+    else:
         try:
-            qty = float(input("Quantity (e.g. 10.5): ").strip())
+            trade_date = datetime.strptime(date_str, "%Y-%m-%d").date()
         except ValueError:
-            print("Invalid quantity.")
+            print("Invalid date format.")
             return
 
+    settle_str = input("Settle date (YYYY-MM-DD, blank = same as trade): ").strip()
+    if settle_str == "":
+        settle_date = trade_date
+    else:
         try:
-            price = float(input("Unit price (e.g. 150.25): ").strip())
+            settle_date = datetime.strptime(settle_str, "%Y-%m-%d").date()
         except ValueError:
-            print("Invalid price.")
+            print("Invalid date format.")
             return
 
-        fees_str = input("Fees (blank = 0): ").strip()
-        if fees_str == "":
-            fees = 0.0
-        else:
-            try:
-                fees = float(fees_str)
-            except ValueError:
-                print("Invalid fees.")
-                return
+    try:
+        qty = float(input("Quantity (e.g. 10.5): ").strip())
+    except ValueError:
+        print("Invalid quantity.")
+        return
 
-        # Use the security's currency as the trade currency
-        cursor.execute(
-            "SELECT Currency FROM security WHERE SecurityID = %s",
-            (security_id,)
-        )
-        sec_row = cursor.fetchone()
-        if not sec_row:
-            print("[ERROR] Security disappeared, aborting.")
+    try:
+        price = float(input("Unit price (e.g. 150.25): ").strip())
+    except ValueError:
+        print("Invalid price.")
+        return
+
+    fees_str = input("Fees (blank = 0): ").strip()
+    if fees_str == "":
+        fees = 0.0
+    else:
+        try:
+            fees = float(fees_str)
+        except ValueError:
+            print("Invalid fees.")
             return
-        trade_currency = sec_row[0]
-
-        sql = """
-            INSERT INTO trade
-                (PortfolioID, SecurityID, Type, TradeDate, SettleDate,
-                 Quantity, UnitPrice, Fees, TradeCurrency, Notes)
-            VALUES
-                (%s, %s, %s, %s, %s,
-                 %s, %s, %s, %s, %s)
-        """
-        notes = input("Notes (optional): ").strip() or None
 
-        cursor.execute(
-            sql,
-            (
-                portfolio_id,
-                security_id,
-                trade_type,
-                trade_date,
-                settle_date,
-                qty,
-                price,
-                fees,
-                trade_currency,
-                notes,
-            ),
-        )
-        conn.commit()
+    notes = input("Notes (optional): ").strip() or None
 
+    txn_id = insert_trade(
+        portfolio_id, security_id, trade_type, trade_date, qty, price,
+        fees=fees, settle_date=settle_date, notes=notes,
+    )
+    if txn_id is not None:
         print("\n✅ Trade recorded successfully.")
 
-    except Exception as e:
-        print(f"[ERROR] Failed to record trade: {e}")
-        conn.rollback()
-    finally:
-        cursor.close()
-        conn.close()
-
 
 def record_dividend(current_user_id: int):
     # 1. Pick portfolio
@@ -241,169 +252,84 @@ def record_dividend(current_user_id: int):
         return
 
     # 2. Pick security
-    security_id = _choose_security()
+    security_id = choose_security()
     if security_id is None:
         return
 
-    conn = get_connection()
-    if conn is None:
-        print("[ERROR] Could not connect to database.")
-        return
-
-    try:
-        cursor = conn.cursor()
-
-        print("\n=== Record Dividend ===")
-        # Type is always DIVIDEND
-        trade_type = "DIVIDEND"
-
-        date_str = input("Dividend date (YYYY-MM-DD, blank = today): ").strip()
-        if date_str == "":
-            trade_date = datetime.today().date()
-        else:
-            try:
-                trade_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-            except ValueError:
-                print("Invalid date format.")
-                return
-
-        settle_str = input("Pay date (YYYY-MM-DD, blank = same as dividend date): ").strip()
-        if settle_str == "":
-            settle_date = trade_date
-        else:
-            try:
-                settle_date = datetime.strptime(settle_str, "%Y-%m-%d").date()
-            except ValueError:
-                print("Invalid date format.")
-                return
-
-        print("\nWe will store:")
-        print("- Quantity      = number of shares receiving the dividend")
-        print("- UnitPrice     = dividend amount per share")
-        print("- Total cash    = Quantity * UnitPrice (can be computed later in reports)\n")
+    print("\n=== Record Dividend ===")
 
+    date_str = input("Dividend date (YYYY-MM-DD, blank = today): ").strip()
+    if date_str == "":
+        trade_date = datetime.today().date()
+    else:
         try:
-            qty = float(input("Number of shares this dividend applies to (e.g. 15): ").strip())
+            trade_date = datetime.strptime(date_str, "%Y-%m-%d").date()
         except ValueError:
-            print("Invalid quantity.")
+            print("Invalid date format.")
             return
 
+    settle_str = input("Pay date (YYYY-MM-DD, blank = same as dividend date): ").strip()
+    if settle_str == "":
+        settle_date = trade_date
+    else:
         try:
-            div_per_share = float(input("Dividend per share (e.g. 0.25): ").strip())
+            settle_date = datetime.strptime(settle_str, "%Y-%m-%d").date()
         except ValueError:
-            print("Invalid dividend amount.")
+            print("Invalid date format.")
             return
 
-        fees_str = input("Fees/withholding tax (blank = 0): ").strip()
-        if fees_str == "":
-            fees = 0.0
-        else:
-            try:
-                fees = float(fees_str)
-            except ValueError:
-                print("Invalid fees.")
-                return
+    print("\nWe will store:")
+    print("- Quantity      = number of shares receiving the dividend")
+    print("- UnitPrice     = dividend amount per share")
+    print("- Total cash    = Quantity * UnitPrice (can be computed later in reports)\n")
 
-        # Use the security's currency as the trade currency
-        cursor.execute(
-            "SELECT Currency FROM security WHERE SecurityID = %s",
-            (security_id,)
-        )
-        sec_row = cursor.fetchone()
-        if not sec_row:
-            print("[ERROR] Security disappeared, aborting.")
-            return
-        trade_currency = sec_row[0]
-
-        notes = input("Notes (optional): ").strip() or None
-
-        sql = """
-            INSERT INTO trade
-                (PortfolioID, SecurityID, Type, TradeDate, SettleDate,
-                 Quantity, UnitPrice, Fees, TradeCurrency, Notes)
-            VALUES
-                (%s, %s, %s, %s, %s,
-                 %s, %s, %s, %s, %s)
-        """
-        cursor.execute(
-            sql,
-            (
-                portfolio_id,
-                security_id,
-                trade_type,
-                trade_date,
-                settle_date,
-                qty,
-                div_per_share,
-                fees,
-                trade_currency,
-                notes,
-            )
-        )
-        conn.commit()
-
-        print("\n✅ Dividend recorded successfully.")
-
-    except Exception as e:
-        print(f"[ERROR] Failed to record dividend: {e}")
-        conn.rollback()
-    finally:
-        cursor.close()
-        conn.close()
-
-
-def trade_history_by_security(current_user_id: int):
-    # 1. Pick portfolio
-    portfolio_id = _choose_portfolio(current_user_id)
-    if portfolio_id is None:
-        return
-
-    conn = get_connection()
-    if conn is None:
-        print("[ERROR] Could not connect to database.")
+    try:
+        qty = float(input("Number of shares this dividend applies to (e.g. 15): ").strip())
+    except ValueError:
+        print("Invalid quantity.")
         return
 
     try:
-        cursor = conn.cursor()
-
-        # Find distinct securities traded in this portfolio
-        cursor.execute(
-            """
-            SELECT DISTINCT s.SecurityID, s.Ticker, s.Exchange, s.SecType, s.Currency
-            FROM trade t
-            JOIN security s ON t.SecurityID = s.SecurityID
-            WHERE t.PortfolioID = %s
-            ORDER BY s.SecurityID
-            """,
-            (portfolio_id,)
-        )
-        sec_rows = cursor.fetchall()
+        div_per_share = float(input("Dividend per share (e.g. 0.25): ").strip())
+    except ValueError:
+        print("Invalid dividend amount.")
+        return
 
-        if not sec_rows:
-            print("\nNo trades recorded for this portfolio yet.")
+    fees_str = input("Fees/withholding tax (blank = 0): ").strip()
+    if fees_str == "":
+        fees = 0.0
+    else:
+        try:
+            fees = float(fees_str)
+        except ValueError:
+            print("Invalid fees.")
             return
 
-        print("\nSecurities traded in this portfolio:")
-        for sid, ticker, exch, sec_type, curr in sec_rows:
-            print(f"  ID={sid} | {ticker} ({sec_type}) on {exch} [{curr}]")
+    notes = input("Notes (optional): ").strip() or None
 
-        choice = input("\nEnter SecurityID to view trade history (or press Enter to cancel): ").strip()
-        if choice == "":
-            print("Cancelled.")
-            return
+    # Type is always DIVIDEND
+    txn_id = insert_trade(
+        portfolio_id, security_id, "DIVIDEND", trade_date, qty, div_per_share,
+        fees=fees, settle_date=settle_date, notes=notes,
+    )
+    if txn_id is not None:
+        print("\n✅ Dividend recorded successfully.")
 
-        try:
-            security_id = int(choice)
-        except ValueError:
-            print("Invalid SecurityID.")
-            return
 
-        valid_ids = {row[0] for row in sec_rows}
-        if security_id not in valid_ids:
-            print("That SecurityID is not in the traded list for this portfolio.")
-            return
+def get_trade_history(portfolio_id: int, security_id: int) -> Optional[list]:
+    """
+    Input-free service: every trade for one (portfolio, security) in
+    (TradeDate, TransactionID) order as tuples of TransactionID, Type,
+    TradeDate, SettleDate, Quantity, UnitPrice, Fees, TradeCurrency, Notes.
+    Returns None on failure.
+    """
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
 
-        # Fetch trades for that (portfolio, security)
+    try:
+        cursor = conn.cursor(prepared=True)
         cursor.execute(
             """
             SELECT
@@ -423,43 +349,432 @@ def trade_history_by_security(current_user_id: int):
             """,
             (portfolio_id, security_id)
         )
-        trades = cursor.fetchall()
+        return cursor.fetchall()
 
-        if not trades:
-            print("\nNo trades found for that security in this portfolio.")
+    except Exception as e:
+        print(f"[ERROR] Failed to load trade history: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# ---------- TRADE HISTORY QUERIES ----------
+#
+# Trade history is read in (TradeDate, TransactionID) order with keyset
+# pagination: each page is "the next N rows after (date, id)". The page is a
+# range scan in index order that stops at LIMIT on idx_trade_portfolio_date
+# (migration 5), or on idx_trade_portfolio_security_date (migration 2) /
+# idx_trade_portfolio_type_date (migration 4) when exactly one security or
+# one Type is asked for; all three indexes continue TradeDate with
+# TransactionID. Page k then costs the same as page 1. Several securities
+# or Types at once sort the matching rows of the portfolio on every page.
+# No cursor is held open between pages, so callers can stop at any point.
+
+def _history_query(
+    portfolio_id: int,
+    start: Optional[date],
+    end: Optional[date],
+    types: Optional[Iterable[str]],
+    security_ids: Optional[Iterable[int]],
+    after: Optional[Tuple[date, int]],
+    limit: int,
+) -> Tuple[str, tuple]:
+    sql = """
+        SELECT TransactionID, SecurityID, Type, TradeDate, SettleDate,
+               Quantity, UnitPrice, Fees, TradeCurrency, Notes
+        FROM trade
+        WHERE PortfolioID = %s
+    """
+    params: list = [portfolio_id]
+    if start is not None:
+        sql += " AND TradeDate >= %s"
+        params.append(start)
+    if end is not None:
+        sql += " AND TradeDate <= %s"
+        params.append(end)
+    if types:
+        types = sorted({t.upper() for t in types})
+        sql += f" AND Type IN ({', '.join(['%s'] * len(types))})"
+        params += types
+    if security_ids:
+        security_ids = sorted(set(security_ids))
+        sql += f" AND SecurityID IN ({', '.join(['%s'] * len(security_ids))})"
+        params += security_ids
+    if after is not None:
+        # the leading TradeDate >= keeps this a range condition on the index
+        sql += " AND TradeDate >= %s AND (TradeDate > %s OR TransactionID > %s)"
+        params += [after[0], after[0], after[1]]
+    sql += " ORDER BY TradeDate, TransactionID LIMIT %s"
+    params.append(limit)
+    return sql, tuple(params)
+
+
+def _fetch_trades(cursor, portfolio_id, start, end, types, security_ids, after, limit) -> List[TradeRow]:
+    cursor.execute(*_history_query(portfolio_id, start, end, types, security_ids, after, limit))
+    return [TradeRow(*row) for row in cursor.fetchall()]
+
+
+def iter_trades(
+    portfolio_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    types: Optional[Iterable[str]] = None,
+    security_ids: Optional[Iterable[int]] = None,
+    after: Optional[Tuple[date, int]] = None,
+    chunk: int = STREAM_CHUNK,
+) -> Iterator[TradeRow]:
+    """
+    Streams a portfolio's trades (optionally within [start, end], of the
+    given Types and SecurityIDs) in (TradeDate, TransactionID) order as
+    TradeRows, reading keyset pages of `chunk` rows. Memory use does not
+    depend on the number of trades. Raises on database errors.
+    """
+    types = list(types) if types else None
+    security_ids = list(security_ids) if security_ids else None
+    while True:
+        conn = get_connection()
+        if conn is None:
+            raise RuntimeError("Could not connect to database.")
+        try:
+            cursor = conn.cursor(prepared=True)
+            rows = _fetch_trades(cursor, portfolio_id, start, end, types, security_ids, after, chunk)
+        finally:
+            cursor.close()
+            conn.close()
+
+        yield from rows
+        if len(rows) < chunk:
             return
+        after = (rows[-1].trade_date, rows[-1].transaction_id)
+
+
+def format_page_cursor(row: TradeRow) -> str:
+    return f"{row.trade_date.isoformat()}:{row.transaction_id}"
 
+
+def parse_page_cursor(token: str) -> Tuple[date, int]:
+    """'YYYY-MM-DD:TransactionID' -> (date, id); raises ValueError."""
+    day, _, txn_id = token.partition(":")
+    return date.fromisoformat(day), int(txn_id)
+
+
+def get_trade_page(
+    portfolio_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    types: Optional[Iterable[str]] = None,
+    security_ids: Optional[Iterable[int]] = None,
+    after: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> Optional[dict]:
+    """
+    One page of filtered trade history. after is the NextCursor of the
+    previous page (None for the first page). Returns {"Trades": [...],
+    "NextCursor": token or None}, or None on failure.
+    """
+    try:
+        after_key = parse_page_cursor(after) if after else None
+    except ValueError:
+        print(f"[ERROR] Invalid page cursor '{after}' (expected YYYY-MM-DD:TransactionID).")
+        return None
+
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    try:
+        cursor = conn.cursor(prepared=True)
+        # one extra row tells us whether another page exists
+        rows = _fetch_trades(cursor, portfolio_id, start, end, types, security_ids, after_key, limit + 1)
+    except Exception as e:
+        print(f"[ERROR] Failed to load trade history: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    info = security_cache().get_many({r.security_id for r in rows if r.security_id is not None})
+    return {
+        "PortfolioID": portfolio_id,
+        "Trades": [
+            {
+                "TransactionID": r.transaction_id,
+                "TradeDate": r.trade_date,
+                "Type": r.type,
+                "SecurityID": r.security_id,
+                "Ticker": info[r.security_id].ticker if r.security_id in info else None,
+                "Quantity": r.quantity,
+                "UnitPrice": r.unit_price,
+                "Fees": r.fees,
+                "Currency": r.currency,
+                "SettleDate": r.settle_date,
+                "Notes": r.notes,
+            }
+            for r in rows
+        ],
+        "NextCursor": format_page_cursor(rows[-1]) if more else None,
+    }
+
+
+def trade_history_by_security(current_user_id: int):
+    # 1. Pick portfolio
+    portfolio_id = _choose_portfolio(current_user_id)
+    if portfolio_id is None:
+        return
+
+    try:
+        # Securities are picked through the cached search instead of listing
+        # every one the portfolio ever traded, so the first page shows at once
+        security_ids = None
+        answer = input("\nLimit to one security? (y/N, q to cancel): ").strip().lower()
+        if answer == "q":
+            print("Cancelled.")
+            return
+        if answer == "y":
+            security_id = choose_security(allow_create=False)
+            if security_id is None:
+                return
+            security_ids = [security_id]
+
+        type_text = input("Only these types (e.g. BUY,SELL; blank = all): ").strip().upper()
+        types = [t.strip() for t in type_text.split(",") if t.strip()] or None
+        try:
+            start_text = input("From date (YYYY-MM-DD, blank = first trade): ").strip()
+            end_text = input("To date (YYYY-MM-DD, blank = last trade): ").strip()
+            start = datetime.strptime(start_text, "%Y-%m-%d").date() if start_text else None
+            end = datetime.strptime(end_text, "%Y-%m-%d").date() if end_text else None
+        except ValueError:
+            print("Invalid date.")
+            return
+
+        cache = security_cache()
+        tickers = {}
         print("\n=== Trade History ===")
-        for (
-            txn_id,
-            ttype,
-            tdate,
-            sdate,
-            qty,
-            uprice,
-            fees,
-            curr,
-            notes,
-        ) in trades:
+        shown = 0
+        for row in iter_trades(portfolio_id, start, end, types, security_ids, chunk=MENU_PAGE_SIZE):
+            curr = row.currency
             print("---------------------------------------")
-            print(f"TransactionID : {txn_id}")
-            print(f"Type          : {ttype}")
-            print(f"TradeDate     : {tdate}")
-            print(f"SettleDate    : {sdate}")
-            print(f"Quantity      : {qty}")
-            print(f"UnitPrice     : {uprice} {curr}")
-            print(f"Fees          : {fees} {curr}")
-            if ttype == "DIVIDEND":
-                total_div = (qty or 0) * (uprice or 0)
+            print(f"TransactionID : {row.transaction_id}")
+            if row.security_id not in tickers:
+                sec = cache.get(row.security_id) if row.security_id is not None else None
+                tickers[row.security_id] = sec.ticker if sec else row.security_id
+            print(f"Security      : {tickers[row.security_id]}")
+            print(f"Type          : {row.type}")
+            print(f"TradeDate     : {row.trade_date}")
+            print(f"SettleDate    : {row.settle_date}")
+            print(f"Quantity      : {row.quantity}")
+            print(f"UnitPrice     : {row.unit_price} {curr}")
+            print(f"Fees          : {row.fees} {curr}")
+            if row.type == "DIVIDEND":
+                total_div = (row.quantity or 0) * (row.unit_price or 0)
                 print(f"Total Dividend: {total_div} {curr}")
-            if notes:
-                print(f"Notes         : {notes}")
+            if row.notes:
+                print(f"Notes         : {row.notes}")
+
+            shown += 1
+            if shown % MENU_PAGE_SIZE == 0:
+                more = input(f"-- {shown} shown. Enter for more, q to stop: ").strip().lower()
+                if more == "q":
+                    return
 
         print("---------------------------------------")
-        print("✅ End of trade history.")
+        if shown == 0:
+            print("No trades match those filters.")
+        else:
+            print("✅ End of trade history.")
 
     except Exception as e:
         print(f"[ERROR] Failed to show trade history: {e}")
+
+
+# ---------- BATCHED BROKER STATEMENT IMPORT ----------
+
+def _normalize_record(record: dict) -> dict:
+    lowered = {str(k).strip().lower(): v for k, v in record.items()}
+    out = {}
+    for field, names in _IMPORT_FIELDS.items():
+        for name in names:
+            if name in lowered:
+                value = lowered[name]
+                out[field] = value.strip() if isinstance(value, str) else value
+                break
+    return out
+
+
+def _iter_trade_records(path: str) -> Iterator[dict]:
+    """
+    Yields one dict per trade from a CSV, JSON-lines or JSON-array broker
+    export. A .json file that starts with "[" is read as one array.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith((".jsonl", ".json", ".ndjson")):
+            head = f.read(4096).lstrip()
+            f.seek(0)
+            if head.startswith("["):
+                yield from json.load(f)
+                return
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def _parse_import_date(value) -> Optional[date]:
+    if value in (None, ""):
+        return None
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+def _write_trade_batch(cursor, portfolio_id: int, batch: list):
+    cursor.executemany(INSERT_TRADE_SQL, batch)
+    apply_trades_to_holdings(
+        cursor,
+        portfolio_id,
+        ((row[1], row[2], row[5], row[6], row[7]) for row in batch),
+    )
+
+
+def import_trades_file(
+    portfolio_id: int,
+    path: str,
+    commit_size: int = DEFAULT_COMMIT_SIZE,
+    default_exchange: Optional[str] = None,
+    verbose: bool = True,
+) -> Optional[dict]:
+    """
+    Loads a broker trade export (CSV, JSON lines, or a JSON array in a .json file)
+    into trade for one portfolio.
+
+    Each distinct (ticker, exchange) is resolved once through the
+    in-process security cache and remembered for the rest of the file,
+    so repeated and unknown tickers cost no further lookups. Rows are
+    written with executemany, committing every commit_size rows. Rows
+    with an unknown ticker or bad values are counted and skipped rather
+    than aborting the whole file.
+    """
+    conn = get_connection()
+    if conn is None:
+        print("[ERROR] Could not connect to database.")
+        return None
+
+    stats = {"rows": 0, "written": 0, "unknown": 0, "rejected": 0, "seconds": 0.0}
+    unknown_tickers = set()
+    resolved: Dict[Tuple[str, Optional[str]], Optional[SecurityInfo]] = {}
+    has_dividends = False
+    start = time.perf_counter()
+
+    try:
+        cursor = conn.cursor()
+        batch = []
+        for record in _iter_trade_records(path):
+            stats["rows"] += 1
+            rec = _normalize_record(record)
+
+            ticker = str(rec.get("ticker") or "").upper()
+            exch = str(rec.get("exchange") or default_exchange or "").upper()
+            key = (ticker, exch or None)
+            if key in resolved:
+                sec = resolved[key]
+            else:
+                sec = resolved[key] = find_security(*key)
+            if sec is None:
+                stats["unknown"] += 1
+                unknown_tickers.add(f"{ticker}:{exch}" if exch else ticker)
+                continue
+
+            try:
+                trade_type = str(rec.get("type") or "").upper()
+                if trade_type not in IMPORT_TRADE_TYPES:
+                    raise ValueError(trade_type)
+                trade_date = _parse_import_date(rec.get("trade_date"))
+                if trade_date is None:
+                    raise ValueError("missing trade date")
+                settle_date = _parse_import_date(rec.get("settle_date")) or trade_date
+                qty = abs(float(rec["quantity"]))
+                price = float(rec["unit_price"])
+                fees = float(rec.get("fees") or 0)
+            except (KeyError, TypeError, ValueError):
+                stats["rejected"] += 1
+                continue
+
+            currency = str(rec.get("currency") or sec.currency).upper()
+            notes = rec.get("notes") or None
+            has_dividends = has_dividends or trade_type == "DIVIDEND"
+
+            batch.append((
+                portfolio_id,
+                sec.security_id,
+                trade_type,
+                trade_date,
+                settle_date,
+                qty,
+                price,
+                fees,
+                currency,
+                notes,
+            ))
+
+            if len(batch) >= commit_size:
+                _write_trade_batch(cursor, portfolio_id, batch)
+                conn.commit()
+                stats["written"] += len(batch)
+                batch.clear()
+
+        if batch:
+            _write_trade_batch(cursor, portfolio_id, batch)
+            conn.commit()
+            stats["written"] += len(batch)
+
+    except Exception as e:
+        print(f"[ERROR] Trade import failed: {e}")
+        conn.rollback()
+        return None
     finally:
         cursor.close()
         conn.close()
+        # earlier batches may have been committed even if a later one failed
+        if has_dividends:
+            invalidate_dividends(portfolio_id)
+        if stats["written"]:
+            invalidate_risk(portfolio_id)
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_sec"] = stats["written"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+
+    if verbose:
+        print(f"\n✅ Imported {stats['written']:,} trade(s) in {stats['seconds']:.1f}s "
+              f"({stats['rows_per_sec']:,.0f} rows/sec).")
+        if stats["rejected"]:
+            print(f"[WARN] {stats['rejected']:,} malformed row(s) skipped.")
+        if stats["unknown"]:
+            sample = ", ".join(sorted(unknown_tickers)[:10])
+            print(f"[WARN] {stats['unknown']:,} row(s) skipped for unknown securities: {sample}"
+                  + (" ..." if len(unknown_tickers) > 10 else ""))
+
+    return stats
+
+
+def import_trades(current_user_id: int):
+    portfolio_id = _choose_portfolio(current_user_id)
+    if portfolio_id is None:
+        return
+
+    print("\n=== Import Broker Trades ===")
+    print("CSV, JSON lines or a JSON array with: Ticker, Exchange, Type, TradeDate, Quantity, UnitPrice")
+    print("(optional: SettleDate, Fees, Currency, Notes)")
+    path = input("Export file path (or press Enter to cancel): ").strip()
+    if path == "":
+        print("Cancelled.")
+        return
+
+    if not os.path.isfile(path):
+        print("That file does not exist.")
+        return
+
+    import_trades_file(portfolio_id, path)